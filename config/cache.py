@@ -0,0 +1,291 @@
+"""
+Бэкенды кэша проекта.
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .instrumentation import note_cache_access
+
+_missing = object()
+
+
+class LocalLRU:
+    """
+    Ограниченный по размеру потокобезопасный LRU с TTL на запись.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Возвращает (найдено, значение).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisInvalidationBus:
+    """
+    Рассылка инвалидаций локальных кэшей через Redis pub/sub.
+
+    Подписка слушается в фоновом потоке, который запускается лениво и
+    перезапускается после fork (воркеры Celery, gunicorn). Если сообщение
+    потеряно, устаревшая локальная запись живёт не дольше LOCAL_TIMEOUT.
+    """
+
+    def __init__(self, location, channel):
+        import redis
+
+        self.channel = channel
+        self.client = redis.Redis.from_url(re.split('[;,]', location)[0])
+        self._callback = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        self._callback = callback
+
+    def ensure_listening(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._handle})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self._pid = os.getpid()
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message))
+
+    def _handle(self, message):
+        if self._callback is not None:
+            self._callback(json.loads(message['data']))
+
+
+class TwoTierCache(BaseCache):
+    """
+    Двухуровневый кэш: локальный LRU процесса перед общим удалённым кэшем (Redis).
+
+    Локально хранятся только ключи с префиксами из LOCAL_PREFIXES (маленькие и
+    очень частые: роли, версии списков); остальные ключи идут сразу в Redis.
+    Любая запись или удаление такого ключа публикует инвалидацию, и остальные
+    процессы выбрасывают его из своего LRU.
+
+    OPTIONS:
+        REMOTE_BACKEND: класс удалённого уровня (по умолчанию RedisCache).
+        INVALIDATION_BUS: класс шины инвалидаций (по умолчанию RedisInvalidationBus).
+        CHANNEL: канал pub/sub.
+        LOCAL_PREFIXES: префиксы ключей локального уровня (пусто — все ключи).
+        LOCAL_MAX_ENTRIES: размер LRU.
+        LOCAL_TIMEOUT: TTL локальной записи в секундах.
+    Остальные OPTIONS передаются удалённому бэкенду.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        remote_class = import_string(options.pop('REMOTE_BACKEND', 'django.core.cache.backends.redis.RedisCache'))
+        bus_class = import_string(options.pop('INVALIDATION_BUS', 'config.cache.RedisInvalidationBus'))
+        channel = options.pop('CHANNEL', 'cache-invalidation')
+        self.local_prefixes = tuple(options.pop('LOCAL_PREFIXES', ()))
+        local_max_entries = int(options.pop('LOCAL_MAX_ENTRIES', 1024))
+        local_timeout = float(options.pop('LOCAL_TIMEOUT', 5))
+
+        super().__init__(params)
+        self.remote = remote_class(location, {**params, 'OPTIONS': options})
+        self.local = LocalLRU(local_max_entries, local_timeout)
+        self.bus = bus_class(location, channel)
+        self.bus.subscribe(self._on_invalidate)
+        self.node = uuid.uuid4().hex
+        self.counts = Counter()
+
+    # -------- локальный уровень и инвалидации --------
+
+    def _is_local(self, key):
+        return not self.local_prefixes or str(key).startswith(self.local_prefixes)
+
+    def _invalidate(self, made_keys):
+        """
+        Удаляет ключи из своего LRU и просит остальные процессы сделать то же.
+        """
+        if not made_keys:
+            return
+        self.local.delete_many(made_keys)
+        self.bus.publish({'node': self.node, 'keys': made_keys})
+
+    def _on_invalidate(self, message):
+        if message.get('node') == self.node:
+            return
+        if message.get('clear'):
+            self.local.clear()
+        else:
+            self.local.delete_many(message.get('keys', ()))
+
+    def _local_keys(self, keys, version):
+        return [self.make_key(key, version) for key in keys if self._is_local(key)]
+
+    def stats(self):
+        """
+        Число обращений и доля попаданий по уровням.
+
+        local — доля get, обслуженных LRU; remote — доля попаданий среди
+        обращений к Redis; overall — доля get, вернувших значение.
+        """
+        counts = {
+            name: self.counts[name]
+            for name in ('local_hits', 'local_misses', 'remote_hits', 'remote_misses', 'remote_only')
+        }
+        lookups = counts['local_hits'] + counts['local_misses']
+        remote_lookups = counts['remote_hits'] + counts['remote_misses']
+        return {
+            **counts,
+            'local_entries': len(self.local),
+            'local_hit_ratio': counts['local_hits'] / lookups if lookups else 0.0,
+            'remote_hit_ratio': counts['remote_hits'] / remote_lookups if remote_lookups else 0.0,
+            'hit_ratio': (counts['local_hits'] + counts['remote_hits']) / (lookups + counts['remote_only'])
+            if lookups + counts['remote_only'] else 0.0,
+        }
+
+    # -------- API кэша --------
+
+    def get(self, key, default=None, version=None):
+        local = self._is_local(key)
+        made_key = self.make_key(key, version)
+        if local:
+            self.bus.ensure_listening()
+            found, value = self.local.get(made_key)
+            if found:
+                self.counts['local_hits'] += 1
+                note_cache_access(True)
+                return value
+            self.counts['local_misses'] += 1
+        else:
+            self.counts['remote_only'] += 1
+
+        value = self.remote.get(key, _missing, version=version)
+        hit = value is not _missing
+        self.counts['remote_hits' if hit else 'remote_misses'] += 1
+        note_cache_access(hit)
+        if not hit:
+            return default
+        if local:
+            self.local.set(made_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        remote_keys = []
+        for key in keys:
+            if self._is_local(key):
+                self.bus.ensure_listening()
+                found, value = self.local.get(self.make_key(key, version))
+                if found:
+                    self.counts['local_hits'] += 1
+                    note_cache_access(True)
+                    result[key] = value
+                    continue
+                self.counts['local_misses'] += 1
+            else:
+                self.counts['remote_only'] += 1
+            remote_keys.append(key)
+
+        if remote_keys:
+            found = self.remote.get_many(remote_keys, version=version)
+            for key in remote_keys:
+                hit = key in found
+                self.counts['remote_hits' if hit else 'remote_misses'] += 1
+                note_cache_access(hit)
+                if hit and self._is_local(key):
+                    self.local.set(self.make_key(key, version), found[key])
+            result.update(found)
+        return result
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self.local.get(self.make_key(key, version))[0]:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout=timeout, version=version)
+        self._invalidate(self._local_keys([key], version))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._invalidate(self._local_keys([key], version))
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout=timeout, version=version)
+        self._invalidate(self._local_keys(data, version))
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.remote.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.remote.delete(key, version=version)
+        self._invalidate(self._local_keys([key], version))
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.remote.delete_many(keys, version=version)
+        self._invalidate(self._local_keys(keys, version))
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        self._invalidate(self._local_keys([key], version))
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def clear(self):
+        self.remote.clear()
+        self.local.clear()
+        self.bus.publish({'node': self.node, 'clear': True})
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
@@ -1,8 +1,21 @@
 import os
 from celery import Celery
+from kombu import Queue
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+
+
+@app.on_after_configure.connect
+def declare_queues(sender, **kwargs):
+    from django.conf import settings
+
+    # Очередь по умолчанию для остальных задач и очереди отправки рассылок по приоритетам
+    # (mailing.scheduling); задача отправки сама выбирает очередь при постановке
+    sender.conf.task_queues = [
+        Queue(sender.conf.task_default_queue),
+        *(Queue(name, routing_key=name) for name in settings.MAILING_QUEUES.values()),
+    ]
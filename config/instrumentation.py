@@ -0,0 +1,174 @@
+"""
+Инструментирование запросов: число SQL-запросов, суммарное время SQL, повторы,
+попадания/промахи кэша и время рендеринга шаблона.
+
+Включается настройкой REQUEST_INSTRUMENTATION. Результат пишется в лог
+config.instrumentation одной JSON-строкой на запрос, а при
+REQUEST_INSTRUMENTATION_HEADERS — ещё и в заголовки ответа. Для потоковых
+ответов строка лога пишется, когда тело отдано целиком, а заголовки содержат
+только то, что выполнено до начала потока.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """
+    Метрики одного запроса.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.queries = Counter()
+        self.statements = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.render_started = None
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Обёртка для connection.execute_wrapper().
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.query_count += 1
+            self.statements[sql] += 1
+            try:
+                self.queries[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    @property
+    def duplicate_count(self):
+        """
+        Запросы, выполненные повторно с теми же параметрами.
+        """
+        return sum(count - 1 for count in self.queries.values() if count > 1)
+
+    @property
+    def similar(self):
+        """
+        Одинаковые SQL с разными параметрами (типичный признак N+1), самые частые первыми.
+        """
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+        response.add_post_render_callback(self.finish_render)
+
+    def finish_render(self, response):
+        self.render_time = time.perf_counter() - self.render_started
+
+    def as_dict(self):
+        return {
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'duplicates': self.duplicate_count,
+            'similar': [{'sql': sql[:200], 'count': count} for sql, count in self.similar[:5]],
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'render_ms': round(self.render_time * 1000, 2),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+
+def note_cache_access(hit):
+    """
+    Учитывает обращение к кэшу в метриках текущего запроса (если они собираются).
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Middleware, собирающее метрики каждого запроса.
+
+    Отключается целиком (MiddlewareNotUsed), если REQUEST_INSTRUMENTATION = False.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.headers = getattr(settings, 'REQUEST_INSTRUMENTATION_HEADERS', False)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            with self.collect(stats):
+                response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+
+        if response.streaming:
+            # Тело потокового ответа (выгрузки) читает базу уже после возврата из вьюхи:
+            # метрики собираются, пока отдаётся поток, и пишутся в лог в его конце
+            response.streaming_content = self.stream(request, response, response.streaming_content, stats)
+        else:
+            self.log(request, response, stats)
+
+        if self.headers:
+            data = stats.as_dict()
+            response['X-DB-Queries'] = data['queries']
+            response['X-DB-Duplicates'] = data['duplicates']
+            response['X-Cache-Hits'] = data['cache_hits']
+            response['X-Cache-Misses'] = data['cache_misses']
+            response['Server-Timing'] = (
+                f"db;dur={data['sql_ms']}, render;dur={data['render_ms']}, total;dur={data['total_ms']}"
+            )
+        return response
+
+    @staticmethod
+    @contextmanager
+    def collect(stats):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            yield
+
+    def stream(self, request, response, content, stats):
+        try:
+            with self.collect(stats):
+                yield from content
+        finally:
+            self.log(request, response, stats)
+
+    def log(self, request, response, stats):
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': getattr(request, 'resolver_match', None) and request.resolver_match.view_name,
+            **stats.as_dict(),
+        }, ensure_ascii=False))
+
+    def process_template_response(self, request, response):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.start_render(response)
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -45,12 +46,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     'users',
     'mailing',
 ]
 
 MIDDLEWARE = [
+    'config.instrumentation.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,16 +100,110 @@ DATABASES = {
 
 REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')
 
+# Двухуровневый кэш: маленькие и самые частые ключи (роли, версии списков)
+# дополнительно держатся в памяти процесса и инвалидируются через Redis pub/sub
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'BACKEND': 'config.cache.TwoTierCache',
         'LOCATION': f'{REDIS_URL}/1',
+        'OPTIONS': {
+            'LOCAL_PREFIXES': ('role:', 'listver:'),
+            'LOCAL_MAX_ENTRIES': 4096,
+            'LOCAL_TIMEOUT': 5,
+        },
     }
 }
 
+# Тесты не требуют Redis: config.testing.TestRunner подменяет кэш памятью процесса
+TEST_RUNNER = 'config.testing.TestRunner'
+
+# Страницы списков кэшируются с версией по владельцу и модели (mailing.cache),
+# поэтому могут жить долго: любое изменение данных сразу делает их неактуальными
+LIST_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Роль пользователя (менеджер или нет) кэшируется и сбрасывается сигналами при смене групп
+ROLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Метрики запросов (SQL, кэш, рендер) в лог и, при необходимости, в заголовки ответа
+REQUEST_INSTRUMENTATION = os.getenv('REQUEST_INSTRUMENTATION', 'False') == 'True'
+REQUEST_INSTRUMENTATION_HEADERS = os.getenv('REQUEST_INSTRUMENTATION_HEADERS', 'False') == 'True'
+
+# Отслеживание открытий и переходов (mailing.tracking): события копятся в потоке Redis
+# и пачками записываются в базу фоновой задачей. SITE_URL — адрес сайта для ссылок в письмах
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
+TRACKING_BUFFER = {
+    'BACKEND': 'mailing.tracking.RedisStreamBuffer',
+    'LOCATION': f'{REDIS_URL}/2',
+}
+TRACKING_BATCH_SIZE = 1000
+
+# Метрики отправки для Prometheus (mailing.metrics, эндпоинт /metrics/): процессы копят
+# значения в памяти и раз в METRICS_FLUSH_INTERVAL секунд прибавляют их к хешам Redis.
+# METRICS_TOKEN — токен для сборщика (заголовок Authorization: Bearer <токен>)
+METRICS_STORE = {
+    'BACKEND': 'mailing.metrics.RedisStore',
+    'LOCATION': f'{REDIS_URL}/3',
+}
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Обработчики замеров времени этапов отправки (mailing.profiling): лог и метрики
+SEND_TIMING_HOOKS = [
+    'mailing.profiling.LogTimingHook',
+    'mailing.profiling.MetricsTimingHook',
+]
+
 CELERY_BROKER_URL = f'{REDIS_URL}/0'
 CELERY_RESULT_BACKEND = f'{REDIS_URL}/0'
 
+# Очереди отправки рассылок по приоритетам (mailing.scheduling, очереди объявлены в config/celery.py).
+# На каждую очередь — свой воркер со своей concurrency, например:
+#   celery -A config worker -Q mailing_high -c 4
+#   celery -A config worker -Q mailing_normal -c 4
+#   celery -A config worker -Q mailing_bulk -c 2
+#   celery -A config worker -Q celery -c 2        # остальные задачи
+MAILING_QUEUES = {
+    'high': 'mailing_high',
+    'normal': 'mailing_normal',
+    'bulk': 'mailing_bulk',
+}
+# Рассылки с аудиторией не больше этого числа идут в срочную очередь
+SMALL_MAILING_SIZE = 1000
+# Получателей в одной задаче отправки; затем продолжение встаёт в конец очереди
+SEND_CHUNK_SIZE = 500
+# Длина такта равномерной отправки (mailing.pacing), секунд
+PACING_INTERVAL = 60
+# Срок аренды рассылки (mailing.leases): держатель продлевает её во время отправки,
+# аренда упавшего держателя освобождается через это время. Должен превышать
+# обычное ожидание продолжения рассылки в очереди
+MAILING_LEASE_TIMEOUT = 300
+# Воркер берёт по одной задаче: длинная часть рассылки не держит за собой следующие
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Периодические задачи (celery -A config beat)
+CELERY_BEAT_SCHEDULE = {
+    # Запись накопленных событий открытий и переходов (mailing.tracking)
+    'consume-tracking-events': {
+        'task': 'mailing.tasks.consume_tracking_events_task',
+        'schedule': 10,
+    },
+    # Сохранение смены статусов рассылок по расписанию (MailingQuerySet.sync_status)
+    'sync-mailing-status': {
+        'task': 'mailing.tasks.sync_mailing_status_task',
+        'schedule': 60,
+    },
+    # Запуск повторяющихся рассылок по next_run_at (mailing.scheduling.run_recurring)
+    'run-recurring-mailings': {
+        'task': 'mailing.tasks.run_recurring_mailings_task',
+        'schedule': 60,
+    },
+    # Досборка помеченных удалёнными рассылок и получателей (mailing.deletion)
+    'purge-deleted': {
+        'task': 'mailing.tasks.purge_deleted_task',
+        'schedule': 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -179,6 +276,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'config.instrumentation': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'mailing.profiling': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -187,8 +294,23 @@ LOGGING = {
 # EMAIL_HOST_USER = 'noreply@example.com'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.yandex.ru'
-EMAIL_PORT = 587
+EMAIL_HOST = os.getenv("EMAIL_HOST", 'smtp.yandex.ru')
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
+
+# Пул SMTP-серверов для рассылок (mailing.relays): JSON-список в EMAIL_RELAYS, например
+# [{"NAME": "yandex", "HOST": "smtp.yandex.ru", "PORT": 587, "USER": "...", "PASSWORD": "...",
+#   "USE_TLS": true, "WEIGHT": 2, "RATE": 5}]. WEIGHT — доля писем, RATE — писем в секунду.
+# По умолчанию пул из одного сервера EMAIL_HOST
+EMAIL_RELAYS = json.loads(os.getenv("EMAIL_RELAYS") or 'null') or [{
+    'NAME': 'default',
+    'HOST': EMAIL_HOST,
+    'PORT': EMAIL_PORT,
+    'USER': EMAIL_HOST_USER,
+    'PASSWORD': EMAIL_HOST_PASSWORD,
+    'USE_TLS': EMAIL_USE_TLS,
+}]
+# На сколько секунд сервер выводится из ротации после сбоя соединения или авторизации
+RELAY_COOLDOWN = 60
@@ -0,0 +1,115 @@
+"""
+Вспомогательные средства для тестов проекта.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+
+class LocalInvalidationBus:
+    """
+    Внутрипроцессная замена RedisInvalidationBus для тестов: все экземпляры
+    с одним каналом получают сообщения друг друга синхронно.
+
+    Подписка живёт до close(), поэтому создавший шину тест должен её закрыть.
+    """
+    _subscribers = {}
+
+    def __init__(self, location, channel):
+        self.channel = channel
+        self._callbacks = []
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+        self._subscribers.setdefault(self.channel, []).append(callback)
+
+    def ensure_listening(self):
+        pass
+
+    def publish(self, message):
+        for callback in list(self._subscribers.get(self.channel, ())):
+            callback(message)
+
+    def close(self):
+        subscribers = self._subscribers.get(self.channel, [])
+        for callback in self._callbacks:
+            subscribers.remove(callback)
+        if not subscribers:
+            self._subscribers.pop(self.channel, None)
+        self._callbacks = []
+
+
+def local_caches():
+    """
+    CACHES для тестов: тот же TwoTierCache, что и в settings, но удалённый уровень —
+    память процесса, а инвалидации идут через LocalInvalidationBus.
+    """
+    default = settings.CACHES['default']
+    return {
+        'default': {
+            **default,
+            'LOCATION': 'default',
+            'OPTIONS': {
+                **default.get('OPTIONS', {}),
+                'REMOTE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'INVALIDATION_BUS': 'config.testing.LocalInvalidationBus',
+            },
+        },
+    }
+
+
+def redis_available():
+    """
+    Доступен ли Redis из REDIS_URL: тесты самих Redis-бэкендов без него пропускаются.
+    """
+    import redis
+
+    try:
+        return redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except redis.RedisError:
+        return False
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Раннер тестов (TEST_RUNNER): на время тестов кэш заменяется на local_caches(),
+    поэтому тестам не нужен Redis.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=local_caches())
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        for cache in caches.all(initialized_only=True):
+            bus = getattr(cache, 'bus', None)
+            if isinstance(bus, LocalInvalidationBus):
+                bus.close()
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Миксин для TestCase: проверяет, что запрос к вьюхе укладывается в бюджет SQL-запросов.
+
+    Бюджет задаётся константой на вьюху. Тестовые данные должны содержать
+    несколько объектов в списках, тогда N+1 сразу выходит за бюджет.
+    """
+
+    def assertQueryBudget(self, budget, url, method='get', data=None, **extra):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, **extra)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+
+        executed = [query['sql'] for query in context.captured_queries]
+        self.assertLessEqual(
+            len(executed), budget,
+            msg=f'{method.upper()} {url}: {len(executed)} запросов при бюджете {budget}:\n' + '\n'.join(executed)
+        )
+        return response
@@ -1,53 +1,197 @@
 from django.contrib import admin
-from .models import Recipient, Message, Mailing, Attempt
+from . import cache
+from .admin_tools import AutocompleteFilter, ScalableAdminMixin
+from .deletion import soft_delete, soft_delete_many
+from .models import Recipient, Message, Mailing, Attempt, RecipientImport, Segment, Tag
+
+
+class SoftDeleteAdminMixin:
+    """
+    Удаление в админке тем же путём, что и в интерфейсе (mailing.deletion):
+    объект помечается удалённым, история попыток удаляется фоновой задачей.
+
+    Страница подтверждения не обходит связанные объекты коллектором,
+    чтобы не загружать всю историю в память.
+    """
+
+    def delete_model(self, request, obj):
+        soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        soft_delete_many(queryset)
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, perms_needed, []
 
 
 @admin.register(Recipient)
-class RecipientAdmin(admin.ModelAdmin):
+class RecipientAdmin(ScalableAdminMixin, SoftDeleteAdminMixin, admin.ModelAdmin):
     """
     Админ-интерфейс для модели Recipient.
 
-    Отображает email, имя и владельца. Позволяет искать по email и имени, фильтровать по владельцу.
+    Отображает email, имя и владельца. Позволяет искать по email и имени, фильтровать по владельцу
+    (поле с автодополнением) и блокировке адреса после возвратов. Поиск по подстроке использует
+    триграммные индексы (pg_trgm). Удаление фоновое (SoftDeleteAdminMixin).
     """
-    list_display = ('email', 'full_name', 'owner')
+    list_display = ('email', 'full_name', 'owner', 'is_suppressed')
     search_fields = ('email', 'full_name')
-    list_filter = ('owner',)
+    list_filter = ('is_suppressed', ('owner', AutocompleteFilter))
+    list_select_related = ('owner',)
+    autocomplete_fields = ('owner', 'tags')
+    ordering = ('-id',)
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    """
+    Админ-интерфейс для модели Tag.
+
+    Отображает название и владельца. Поиск по названию.
+    """
+    list_display = ('name', 'owner')
+    search_fields = ('name',)
+
+
+@admin.register(Segment)
+class SegmentAdmin(admin.ModelAdmin):
+    """
+    Админ-интерфейс для модели Segment.
+
+    Отображает название, домен и владельца. Выбор тегов через горизонтальный список.
+    """
+    list_display = ('name', 'email_domain', 'owner')
+    search_fields = ('name',)
+    ordering = ('name',)
+    filter_horizontal = ('tags',)
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(ScalableAdminMixin, admin.ModelAdmin):
     """
     Админ-интерфейс для модели Message.
 
-    Отображает тему и владельца. Поиск по теме, фильтрация по владельцу.
+    Отображает тему и владельца. Поиск по теме (триграммный индекс), фильтрация по владельцу.
     """
     list_display = ('subject', 'owner')
     search_fields = ('subject',)
-    list_filter = ('owner',)
+    list_filter = (('owner', AutocompleteFilter),)
+    list_select_related = ('owner',)
+    autocomplete_fields = ('owner',)
+    ordering = ('-id',)
 
 
 @admin.register(Mailing)
-class MailingAdmin(admin.ModelAdmin):
+class MailingAdmin(ScalableAdminMixin, SoftDeleteAdminMixin, admin.ModelAdmin):
     """
     Админ-интерфейс для модели Mailing.
 
-    Отображает расписание и статус рассылки.
-    Фильтрация по статусу и владельцу.
-    Выбор получателей через горизонтальный список.
+    Отображает расписание и статус рассылки (вычисленный по расписанию).
+    Фильтрация по сохранённому статусу, активности и владельцу, навигация по дате начала.
+    Поиск по теме сообщения (триграммный индекс) или точному id.
+    Получатели в форме не выводятся (их могут быть миллионы): состав меняется
+    пакетными операциями на сайте (mailing.audience).
+    Включение/отключение выбранных рассылок — одним UPDATE.
+    Удаление фоновое (SoftDeleteAdminMixin).
     """
-    list_display = ('id', 'start_time', 'end_time', 'status', 'owner')
-    list_filter = ('status', 'owner')
-    search_fields = ('id',)
-    filter_horizontal = ('recipients',)
+    list_display = ('id', 'start_time', 'end_time', 'current_status', 'is_active', 'priority', 'segment', 'owner')
+    list_filter = ('status', 'is_active', 'priority', 'pacing', 'recurrence', ('owner', AutocompleteFilter))
+    list_select_related = ('message', 'segment', 'owner')
+    date_hierarchy = 'start_time'
+    ordering = ('-id',)
+    search_fields = ('message__subject',)
+    search_help_text = 'Тема сообщения или id рассылки'
+    autocomplete_fields = ('message', 'segment', 'owner')
+    exclude = ('recipients', 'audience_snapshot')
+    readonly_fields = ('recipient_count',)
+    actions = ('enable_mailings', 'disable_mailings')
+
+    def get_queryset(self, request):
+        # __str__ рассылки выводит тему сообщения: нужно и списку, и автодополнению.
+        # При заданном select_related ChangeList не применяет list_select_related сам
+        return super().get_queryset(request).select_related(*self.list_select_related)
+
+    @admin.display(description='Получателей в списке')
+    def recipient_count(self, obj):
+        return obj.recipients.count() if obj.pk else 0
+
+    def has_disable_permission(self, request):
+        return request.user.has_perm('mailing.disable_mailings')
+
+    def _set_active(self, request, queryset, is_active):
+        owner_ids = list(queryset.order_by().values_list('owner_id', flat=True).distinct())
+        updated = queryset.update(is_active=is_active)
+        if is_active:
+            # Пропущенные за время отключения запуски не догоняются: следующий — от текущего момента
+            recurring = list(queryset.exclude(recurrence=''))
+            for mailing in recurring:
+                mailing.next_run_at = mailing.get_next_run()
+            Mailing.objects.bulk_update(recurring, ['next_run_at'])
+        # update() не шлёт сигналов, списки владельцев инвалидируются явно
+        for owner_id in owner_ids:
+            cache.bump(owner_id, Mailing)
+        self.message_user(request, f'Изменено рассылок: {updated}.')
+
+    @admin.action(description='Включить выбранные рассылки', permissions=['disable'])
+    def enable_mailings(self, request, queryset):
+        self._set_active(request, queryset, True)
+
+    @admin.action(description='Отключить выбранные рассылки', permissions=['disable'])
+    def disable_mailings(self, request, queryset):
+        self._set_active(request, queryset, False)
+
+    @admin.display(description='Статус', ordering='start_time')
+    def current_status(self, obj):
+        # Сохранённый статус (по нему работает фильтр) обновляется периодической задачей
+        return obj.current_status
+
+    def get_search_results(self, request, queryset, search_term):
+        # icontains по id приводит число к тексту и не использует индекс,
+        # поэтому id ищется точным совпадением по первичному ключу
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip().isdigit():
+            results |= queryset.filter(pk=int(search_term))
+        return results, may_have_duplicates
 
 
 @admin.register(Attempt)
-class AttemptAdmin(admin.ModelAdmin):
+class AttemptAdmin(ScalableAdminMixin, admin.ModelAdmin):
     """
     Админ-интерфейс для модели Attempt.
 
-    Отображает рассылку, статус попытки и время.
-    Фильтрация по статусу и по рассылке.
+    Отображает рассылку, получателя, статус попытки, статус доставки из уведомлений
+    о недоставке, SMTP-сервер и время. Фильтрация по статусам, рассылке и получателю (поля
+    с автодополнением), навигация по дате попытки.
+    """
+    list_display = ('mailing', 'recipient', 'status', 'delivery_status', 'relay', 'attempt_time')
+    list_filter = (
+        'status', 'delivery_status', ('mailing', AutocompleteFilter), ('recipient', AutocompleteFilter),
+    )
+    list_select_related = ('mailing__message', 'recipient')
+    date_hierarchy = 'attempt_time'
+    autocomplete_fields = ('mailing', 'recipient')
+
+    def get_queryset(self, request):
+        # Попытки помеченных удалёнными рассылок и получателей ждут фонового удаления
+        return super().get_queryset(request).visible()
+
+
+@admin.register(RecipientImport)
+class RecipientImportAdmin(admin.ModelAdmin):
+    """
+    Админ-интерфейс для модели RecipientImport.
+
+    Только просмотр хода и итогов импортов; обработка идёт в фоновой задаче.
     """
-    list_display = ('mailing', 'status', 'attempt_time')
-    list_filter = ('status', 'mailing')
+    list_display = (
+        'id', 'owner', 'status', 'total_rows', 'created_count', 'updated_count', 'error_count', 'created_at',
+    )
+    list_filter = ('status',)
+    list_select_related = ('owner',)
+    readonly_fields = (
+        'owner', 'file', 'status', 'total_rows', 'created_count', 'updated_count', 'error_count',
+        'error_report', 'message', 'created_at', 'finished_at',
+    )
@@ -0,0 +1,104 @@
+"""
+Пакетные операции с явным составом аудитории рассылки (Mailing.recipients).
+
+Каждая операция — один SQL-запрос к промежуточной таблице M2M:
+добавление — INSERT … SELECT … ON CONFLICT DO NOTHING, удаление — DELETE
+с подзапросом. Получатели не загружаются в память и не проходят через
+ModelForm.save_m2m, поэтому назначение миллиона адресов занимает секунды.
+
+В рассылку попадают только получатели её владельца, какой бы набор ни
+передали.
+"""
+from django.db import connection
+
+from .models import Mailing, Recipient
+
+
+def _owned(mailing, recipients):
+    """
+    Получатели из recipients, принадлежащие владельцу рассылки, в виде подзапроса по pk.
+    """
+    return recipients.filter(owner_id=mailing.owner_id).order_by().values('pk')
+
+
+def add_recipients(mailing, recipients):
+    """
+    Добавляет в рассылку получателей из queryset recipients.
+
+    Уже добавленные пропускаются. Возвращает число новых строк.
+    """
+    through = Mailing.recipients.through
+    quote = connection.ops.quote_name
+    select_sql, select_params = _owned(mailing, recipients).query.sql_with_params()
+    sql = (
+        f'INSERT INTO {quote(through._meta.db_table)} '
+        f'({quote(through._meta.get_field("mailing").column)}, {quote(through._meta.get_field("recipient").column)}) '
+        # WHERE true нужен SQLite: без него ON CONFLICT после SELECT разбирается как часть JOIN
+        f'SELECT %s, audience.* FROM ({select_sql}) AS audience WHERE true '
+        f'ON CONFLICT DO NOTHING'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (mailing.pk, *select_params))
+        return cursor.rowcount
+
+
+def add_all(mailing):
+    """
+    Добавляет в рассылку всех получателей её владельца.
+    """
+    return add_recipients(mailing, Recipient.objects.all())
+
+
+def add_matching(mailing, query):
+    """
+    Добавляет получателей, найденных по строке query (см. SearchQuerySet.search).
+    """
+    return add_recipients(mailing, Recipient.objects.search(query))
+
+
+def add_segment(mailing, segment):
+    """
+    Добавляет текущий состав сегмента.
+
+    В отличие от Mailing.segment, состав фиксируется сейчас и дальше
+    от изменений сегмента не зависит.
+    """
+    return add_recipients(mailing, segment.resolve())
+
+
+def copy_from(mailing, source):
+    """
+    Добавляет всех получателей рассылки source (с учётом её сегмента).
+    """
+    return add_recipients(mailing, source.audience())
+
+
+def remove_recipients(mailing, recipients):
+    """
+    Исключает из рассылки получателей из queryset recipients.
+
+    У промежуточной модели нет обработчиков сигналов и каскадов, поэтому
+    delete() выполняется одним DELETE без загрузки строк. Возвращает число
+    удалённых строк.
+    """
+    through = Mailing.recipients.through
+    deleted, _ = through.objects.filter(
+        mailing_id=mailing.pk,
+        recipient_id__in=_owned(mailing, recipients),
+    ).delete()
+    return deleted
+
+
+def remove_matching(mailing, query):
+    """
+    Исключает получателей, найденных по строке query.
+    """
+    return remove_recipients(mailing, Recipient.objects.search(query))
+
+
+def clear(mailing):
+    """
+    Исключает из рассылки всех получателей.
+    """
+    deleted, _ = Mailing.recipients.through.objects.filter(mailing_id=mailing.pk).delete()
+    return deleted
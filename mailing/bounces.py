@@ -0,0 +1,348 @@
+"""
+Обработка уведомлений о недоставке (DSN, RFC 3464) из ящика для возвратов.
+
+Ящик mbox читается потоково с сохранённого смещения (BounceSource): в памяти
+находится одно письмо, и то не больше MAX_MESSAGE_BYTES, поэтому размер ящика
+не важен, а повторный запуск начинает с первого необработанного письма.
+В Maildir обработанные письма переносятся из new/ в cur/ с флагом S,
+как это делает почтовый клиент.
+
+Отчёт сначала разбирается регулярными выражениями по сырым байтам: так
+читаются обычные multipart/report от Postfix, Exim, Sendmail и крупных
+почтовых сервисов. Если это не удалось (перенесённые строки полей, возврат
+без отчёта), письмо разбирается стандартным email-парсером. Рассылка
+определяется по заголовку X-Mailing-ID исходного письма (его ставит
+services.send_mailing), получатель — по адресу.
+
+Результаты применяются пачками по BOUNCE_BATCH_SIZE в одной транзакции
+вместе со смещением: последней попытке отправки получателю проставляется
+delivery_status одним bulk_update, адреса с постоянной ошибкой помечаются
+is_suppressed одним UPDATE и больше не получают рассылок.
+"""
+import os
+import re
+from collections import namedtuple
+from email.parser import BytesParser
+from email.policy import compat32
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Attempt, BounceSource, Recipient
+
+BOUNCE_BATCH_SIZE = 1000
+
+# Из письма читается только начало: отчёт идёт первыми частями, дальше — копия исходного письма
+MAX_MESSAGE_BYTES = 256 * 1024
+
+# Ограничение длины строки при чтении mbox, чтобы не загрузить в память файл без переводов строк
+MAX_LINE_BYTES = 64 * 1024
+
+MAILING_HEADER = 'X-Mailing-ID'
+
+Bounce = namedtuple('Bounce', ['email', 'mailing_id', 'action', 'status', 'diagnostic'])
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+REPORT_RE = re.compile(rb'message/delivery-status', re.IGNORECASE)
+FINAL_RECIPIENT_RE = re.compile(rb'^Final-Recipient:[ \t]*rfc822[ \t]*;[ \t]*<?([^\s<>]+@[^\s<>]+)', _FLAGS)
+ACTION_RE = re.compile(rb'^Action:[ \t]*([a-z]+)', _FLAGS)
+STATUS_RE = re.compile(rb'^Status:[ \t]*([245]\.\d{1,3}\.\d{1,3})', _FLAGS)
+DIAGNOSTIC_RE = re.compile(rb'^Diagnostic-Code:[ \t]*(.*(?:\r?\n[ \t]+.*)*)', _FLAGS)
+MAILING_ID_RE = re.compile(rb'^X-Mailing-ID:[ \t]*(\d+)', _FLAGS)
+PART_BOUNDARY_RE = re.compile(rb'\r?\n--')
+
+
+class BounceResult:
+    """
+    Итоги обработки; обновляются после каждой пачки.
+    """
+
+    def __init__(self):
+        self.message_count = 0
+        self.bounce_count = 0
+        self.matched_count = 0
+        self.suppressed_count = 0
+        self.skipped_count = 0
+
+
+def normalize_email(email):
+    """
+    Адрес в том виде, в каком он хранится у получателя: домен в нижнем регистре (как при импорте).
+    """
+    email = email.strip().strip('<>')
+    local, _, domain = email.rpartition('@')
+    return f'{local}@{domain.lower()}' if local else email
+
+
+def _text(value):
+    return ' '.join(value.decode('utf-8', 'replace').split())
+
+
+def _parse_fast(raw):
+    """
+    Разбор стандартного multipart/report регулярными выражениями. None, если не получилось.
+    """
+    if not REPORT_RE.search(raw):
+        return None
+    match = MAILING_ID_RE.search(raw)
+    mailing_id = int(match.group(1)) if match else None
+
+    recipients = list(FINAL_RECIPIENT_RE.finditer(raw))
+    bounces = []
+    for index, recipient in enumerate(recipients):
+        # Поля получателя — до следующего Final-Recipient или конца части
+        end = recipients[index + 1].start() if index + 1 < len(recipients) else len(raw)
+        boundary = PART_BOUNDARY_RE.search(raw, recipient.end(), end)
+        block = raw[recipient.end():boundary.start() if boundary else end]
+        status = STATUS_RE.search(block)
+        if not status:
+            return None
+        action = ACTION_RE.search(block)
+        diagnostic = DIAGNOSTIC_RE.search(block)
+        bounces.append(Bounce(
+            email=normalize_email(recipient.group(1).decode('utf-8', 'replace')),
+            mailing_id=mailing_id,
+            action=action.group(1).decode().lower() if action else 'failed',
+            status=status.group(1).decode(),
+            diagnostic=_text(diagnostic.group(1)) if diagnostic else '',
+        ))
+    return bounces or None
+
+
+def _original_mailing_id(message):
+    for part in message.walk():
+        content_type = part.get_content_type()
+        if content_type == 'message/rfc822':
+            payload = part.get_payload()
+            value = payload[0].get(MAILING_HEADER) if payload else None
+        elif content_type == 'text/rfc822-headers':
+            found = MAILING_ID_RE.search(part.get_payload(decode=True) or b'')
+            value = found.group(1).decode() if found else None
+        else:
+            continue
+        if value and value.strip().isdigit():
+            return int(value)
+    return None
+
+
+def _parse_full(raw):
+    """
+    Разбор письма email-парсером: DSN с перенесёнными строками полей и возвраты Exim
+    без отчёта (заголовок X-Failed-Recipients).
+    """
+    message = BytesParser(policy=compat32).parsebytes(raw)
+    mailing_id = _original_mailing_id(message)
+    bounces = []
+    for part in message.walk():
+        if part.get_content_type() != 'message/delivery-status':
+            continue
+        for block in part.get_payload():
+            recipient = block.get('Final-Recipient', '')
+            _, _, address = recipient.partition(';')
+            status = (block.get('Status') or '').strip()
+            if '@' not in address or not re.match(r'[245]\.\d{1,3}\.\d{1,3}$', status):
+                continue
+            bounces.append(Bounce(
+                email=normalize_email(address),
+                mailing_id=mailing_id,
+                action=(block.get('Action') or 'failed').strip().lower(),
+                status=status,
+                diagnostic=' '.join((block.get('Diagnostic-Code') or '').split()),
+            ))
+    if not bounces and message.get('X-Failed-Recipients'):
+        for address in message['X-Failed-Recipients'].split(','):
+            if '@' in address:
+                bounces.append(Bounce(normalize_email(address), mailing_id, 'failed', '5.0.0', ''))
+    return bounces
+
+
+def parse_bounce(raw):
+    """
+    Список Bounce из письма raw (байты). Пустой список, если это не уведомление о недоставке.
+    """
+    return _parse_fast(raw) or _parse_full(raw)
+
+
+def delivery_status(bounce):
+    """
+    Значение Attempt.delivery_status для уведомления или None, если письмо доставлено.
+    """
+    if bounce.action == 'failed' and bounce.status.startswith('5'):
+        return 'Возврат'
+    if bounce.action in ('failed', 'delayed'):
+        return 'Отложено'
+    return None
+
+
+def apply_bounces(bounces, result):
+    """
+    Применяет пачку уведомлений: статус доставки попыток и блокировка адресов.
+
+    Для каждого уведомления обновляется последняя попытка отправки получателю
+    в указанной рассылке (или в любой, если рассылка неизвестна). Выполняется
+    по запросу на каждую рассылку в пачке, один bulk_update и один UPDATE получателей.
+    """
+    by_mailing = {}
+    for bounce in bounces:
+        status = delivery_status(bounce)
+        if status is None:
+            result.skipped_count += 1
+            continue
+        # Возврат не перекрывается более поздним «отложено»
+        previous = by_mailing.setdefault(bounce.mailing_id, {}).get(bounce.email)
+        if previous is None or previous[0] != 'Возврат':
+            by_mailing[bounce.mailing_id][bounce.email] = (status, f'{bounce.status} {bounce.diagnostic}'.strip())
+
+    attempts = []
+    hard_emails = set()
+    for mailing_id, statuses in by_mailing.items():
+        last_attempt = Attempt.objects.filter(recipient=OuterRef('pk')).order_by('-attempt_time', '-pk')
+        if mailing_id is not None:
+            last_attempt = last_attempt.filter(mailing_id=mailing_id)
+        rows = (
+            Recipient.all_objects.filter(email__in=list(statuses))
+            .annotate(attempt_id=Subquery(last_attempt.values('pk')[:1]))
+            .values_list('email', 'attempt_id')
+        )
+        for email, attempt_id in rows:
+            status, response = statuses[email]
+            if status == 'Возврат':
+                hard_emails.add(email)
+            if attempt_id is not None:
+                attempts.append(Attempt(pk=attempt_id, delivery_status=status, delivery_response=response))
+        result.skipped_count += len(statuses) - len(rows)
+
+    Attempt.objects.bulk_update(attempts, ['delivery_status', 'delivery_response'], batch_size=BOUNCE_BATCH_SIZE)
+    result.matched_count += len(attempts)
+    result.suppressed_count += (
+        Recipient.all_objects.filter(email__in=hard_emails, is_suppressed=False).update(is_suppressed=True)
+    )
+
+
+def iter_mbox(fileobj, max_bytes=MAX_MESSAGE_BYTES):
+    """
+    Письма mbox начиная с текущей позиции fileobj (бинарный режим, начало строки «From »).
+
+    Выдаёт (смещение сразу за письмом, первые max_bytes байт письма без строки «From »).
+    Последнее письмо выдаётся, только если оно закончено пустой строкой:
+    письмо, которое почтовый сервер ещё дописывает, будет прочитано в следующий раз.
+    """
+    position = fileobj.tell()
+    chunks, size = None, 0
+    previous_blank = True
+    for line in iter(lambda: fileobj.readline(MAX_LINE_BYTES), b''):
+        if previous_blank and line.startswith(b'From '):
+            if chunks is not None:
+                yield position, b''.join(chunks)
+            chunks, size = [], 0
+        elif chunks is not None and size < max_bytes:
+            chunks.append(line)
+            size += len(line)
+        position += len(line)
+        previous_blank = line in (b'\n', b'\r\n')
+    if chunks is not None and previous_blank:
+        yield position, b''.join(chunks)
+
+
+class BounceProcessor:
+    """
+    Накопление уведомлений и запись пачками по batch_size.
+
+    on_progress(result) вызывается после каждой пачки.
+    """
+
+    def __init__(self, batch_size=BOUNCE_BATCH_SIZE, on_progress=None):
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.result = BounceResult()
+        self.pending = []
+
+    def add(self, raw):
+        """
+        Разбирает письмо. Возвращает True, если пора записать пачку (flush).
+        """
+        self.result.message_count += 1
+        bounces = parse_bounce(raw)
+        if not bounces:
+            self.result.skipped_count += 1
+        self.result.bounce_count += len(bounces)
+        self.pending += bounces
+        return len(self.pending) >= self.batch_size
+
+    def flush(self, on_commit=None):
+        """
+        Записывает накопленное. on_commit() выполняется в той же транзакции (сохранение позиции).
+        """
+        with transaction.atomic():
+            apply_bounces(self.pending, self.result)
+            if on_commit:
+                on_commit()
+        self.pending = []
+        if self.on_progress:
+            self.on_progress(self.result)
+
+    def process_mbox(self, path):
+        """
+        Обрабатывает новые письма файла mbox с сохранённой позиции.
+
+        Если файл заменён (другой inode) или стал короче позиции, он читается с начала.
+        """
+        path = os.path.abspath(path)
+        source, _ = BounceSource.objects.get_or_create(path=path)
+        with open(path, 'rb') as fileobj:
+            stat = os.fstat(fileobj.fileno())
+            if source.inode != stat.st_ino or source.offset > stat.st_size:
+                source.offset, source.inode = 0, stat.st_ino
+            fileobj.seek(source.offset)
+
+            processed = 0
+
+            def save_position():
+                source.message_count += processed
+                source.save(update_fields=['offset', 'inode', 'message_count', 'updated_at'])
+
+            for offset, raw in iter_mbox(fileobj):
+                processed += 1
+                source.offset = offset
+                if self.add(raw):
+                    self.flush(save_position)
+                    processed = 0
+            self.flush(save_position)
+        return self.result
+
+    def process_maildir(self, path):
+        """
+        Обрабатывает письма из new/ ящика Maildir и переносит их в cur/ после записи пачки.
+        """
+        new_dir, cur_dir = os.path.join(path, 'new'), os.path.join(path, 'cur')
+        done = []
+
+        def move_done():
+            names = list(done)
+            # Перенос после фиксации транзакции: упавший запуск обработает пачку повторно
+            transaction.on_commit(lambda: [
+                os.replace(os.path.join(new_dir, name), os.path.join(cur_dir, f'{name}:2,S')) for name in names
+            ])
+
+        with os.scandir(new_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith('.'):
+                    continue
+                with open(entry.path, 'rb') as fileobj:
+                    raw = fileobj.read(MAX_MESSAGE_BYTES)
+                done.append(entry.name)
+                if self.add(raw):
+                    self.flush(move_done)
+                    done = []
+        self.flush(move_done)
+        return self.result
+
+
+def process_mailbox(path, batch_size=BOUNCE_BATCH_SIZE, on_progress=None):
+    """
+    Обрабатывает ящик mbox (файл) или Maildir (каталог с new/ и cur/). Возвращает BounceResult.
+    """
+    processor = BounceProcessor(batch_size, on_progress)
+    if os.path.isdir(path):
+        return processor.process_maildir(path)
+    return processor.process_mbox(path)
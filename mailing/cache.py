@@ -0,0 +1,79 @@
+"""
+Версионированный кэш списков с областью видимости по владельцу.
+
+Для каждой пары (модель, владелец) в кэше хранится номер версии. Ключ
+закэшированной страницы включает версии всех моделей, из которых она
+собрана, поэтому после изменения данных достаточно увеличить версию:
+старые записи просто перестают читаться и вытесняются сами.
+Менеджеры видят объекты всех владельцев, для них используется
+общая область 'all', которая увеличивается при любом изменении.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+ALL_SCOPE = 'all'
+
+
+def _version_key(label, scope):
+    return f'listver:{label}:{scope}'
+
+
+def _label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def get_versions(scope, models):
+    """
+    Текущие версии моделей в области scope.
+
+    Отсутствующая версия (новая или вытесненная) инициализируется текущим
+    временем в наносекундах, чтобы не совпасть с версиями старых записей.
+    """
+    keys = [_version_key(_label(model), scope) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(owner_id, *models):
+    """
+    Увеличивает версии моделей владельца и общей области менеджеров.
+    """
+    for model in models:
+        label = _label(model)
+        for scope in (owner_id, ALL_SCOPE):
+            key = _version_key(label, scope)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), timeout=None)
+
+
+def list_cache_key(request, namespace, models, is_manager):
+    """
+    Ключ закэшированной страницы списка для пользователя запроса.
+
+    Включает область (id пользователя или 'all' для менеджера), версии
+    зависимых моделей и параметры запроса (курсор страницы и т.п.).
+    """
+    scope = ALL_SCOPE if is_manager else request.user.pk
+    versions = '.'.join(str(version) for version in get_versions(scope, models))
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'list:{namespace}:{scope}:{versions}:{query}'
+
+
+def cached_page(key, compute):
+    """
+    Возвращает страницу из кэша или вычисляет и сохраняет её на LIST_CACHE_TIMEOUT.
+    """
+    page = cache.get(key)
+    if page is None:
+        page = compute()
+        cache.set(key, page, settings.LIST_CACHE_TIMEOUT)
+    return page
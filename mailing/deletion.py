@@ -0,0 +1,129 @@
+"""
+Удаление рассылок и получателей с большой историей попыток.
+
+Удаление из интерфейса или админки только помечает объект (is_deleted):
+он сразу пропадает из менеджера по умолчанию, списков и счётчиков.
+Попытки, строки связей M2M и сам объект удаляет фоновая задача пачками
+по PURGE_BATCH_SIZE, каждая пачка — в своей транзакции. Так коллектор
+Django не загружает историю в память, а запрос пользователя не ждёт
+удаления миллионов строк.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from . import cache
+from .models import Attempt, Mailing, Recipient, TrackingEvent, UserCounters
+
+PURGE_BATCH_SIZE = 5000
+
+
+def _uncount_mailing(mailing):
+    # Попытки по уже удалённым получателям были вычтены при их удалении
+    attempt_count = Attempt.objects.filter(mailing=mailing, recipient__is_deleted=False).count()
+    UserCounters.add(mailing.owner_id, mailing_count=-1, attempt_count=-attempt_count)
+    cache.bump(mailing.owner_id, Mailing, Attempt)
+
+
+def _uncount_recipient(recipient):
+    UserCounters.add(recipient.owner_id, recipient_count=-1)
+    cache.bump(recipient.owner_id, Recipient)
+    per_owner = (
+        Attempt.objects.filter(recipient=recipient, mailing__is_deleted=False)
+        .values('mailing__owner')
+        .annotate(total=Count('id'))
+    )
+    for row in per_owner:
+        UserCounters.add(row['mailing__owner'], attempt_count=-row['total'])
+        cache.bump(row['mailing__owner'], Attempt)
+
+
+def soft_delete(obj):
+    """
+    Помечает рассылку или получателя удалённым и ставит в очередь фоновое удаление.
+
+    Счётчики владельца и версии кэша списков обновляются сразу. Повторный вызов
+    для уже помеченного объекта ничего не делает. Возвращает True, если объект
+    был помечен этим вызовом.
+    """
+    from .tasks import purge_object_task
+
+    model = type(obj)
+    with transaction.atomic():
+        if not model.all_objects.filter(pk=obj.pk, is_deleted=False).update(is_deleted=True):
+            return False
+        obj.is_deleted = True
+        if model is Mailing:
+            _uncount_mailing(obj)
+        else:
+            _uncount_recipient(obj)
+        transaction.on_commit(lambda: purge_object_task.delay(model._meta.label_lower, obj.pk))
+    return True
+
+
+def soft_delete_many(queryset):
+    """
+    soft_delete для каждого объекта queryset. Возвращает число помеченных.
+    """
+    return sum(soft_delete(obj) for obj in queryset)
+
+
+def _dependents(obj):
+    """
+    Наборы строк, которые нужно удалить до самого объекта.
+    """
+    if isinstance(obj, Mailing):
+        return [
+            Attempt.objects.filter(mailing_id=obj.pk),
+            TrackingEvent.objects.filter(mailing_id=obj.pk),
+            Mailing.recipients.through.objects.filter(mailing_id=obj.pk),
+            Mailing.audience_snapshot.through.objects.filter(mailing_id=obj.pk),
+        ]
+    return [
+        Attempt.objects.filter(recipient_id=obj.pk),
+        TrackingEvent.objects.filter(recipient_id=obj.pk),
+        Mailing.recipients.through.objects.filter(recipient_id=obj.pk),
+        Mailing.audience_snapshot.through.objects.filter(recipient_id=obj.pk),
+        Recipient.tags.through.objects.filter(recipient_id=obj.pk),
+    ]
+
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE):
+    """
+    Удаляет строки queryset пачками по batch_size, каждую в отдельной транзакции.
+
+    Возвращает число удалённых строк.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return total
+            queryset.model._base_manager.filter(pk__in=pks).delete()
+        total += len(pks)
+
+
+def purge(obj, batch_size=PURGE_BATCH_SIZE):
+    """
+    Окончательно удаляет помеченный объект: сначала зависимые строки пачками, затем его самого.
+
+    Обработчики сигналов пропускают помеченные объекты, поэтому счётчики
+    второй раз не уменьшаются.
+    """
+    for queryset in _dependents(obj):
+        delete_in_batches(queryset, batch_size)
+    obj.delete()
+
+
+def purge_deleted(batch_size=PURGE_BATCH_SIZE):
+    """
+    Удаляет все помеченные рассылки и получателей (например, если задача на удаление потерялась).
+
+    Возвращает число удалённых объектов.
+    """
+    purged = 0
+    for model in (Mailing, Recipient):
+        for obj in model.all_objects.filter(is_deleted=True).iterator():
+            purge(obj, batch_size)
+            purged += 1
+    return purged
@@ -1,18 +1,61 @@
+import os
+
 from django import forms
-from .models import Mailing
+from .imports import IMPORT_FORMATS
+from .models import Mailing, Attempt, Recipient, RecipientImport, Segment, Tag
 from django.forms.widgets import DateTimeInput
+from django.urls import reverse_lazy
+
+
+class RecipientAutocompleteWidget(forms.SelectMultiple):
+    """
+    Множественный выбор получателей с поиском на сервере.
+
+    В HTML попадают только выбранные получатели (один запрос по их id),
+    остальные подгружаются скриптом формы (mailing_form.html) из search_url,
+    который передаётся атрибутом data-search-url.
+    """
+
+    def __init__(self, search_url=reverse_lazy('mailing:recipient_search'), attrs=None):
+        super().__init__(attrs)
+        self.search_url = search_url
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        selected = choices.__class__(choices.field)
+        selected.queryset = choices.queryset.filter(pk__in=[pk for pk in value if str(pk).isdigit()])
+        self.choices = selected
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-search-url'] = str(self.search_url)
+        return context
 
 
 class MailingForm(forms.ModelForm):
     """
     Форма для создания и редактирования рассылок.
 
-    Отображает поля: время начала, время окончания, сообщение и получатели.
-    Использует HTML5-виджеты для выбора даты и времени, а также множественный выбор для получателей.
+    Отображает поля: время начала, время окончания, сообщение, сегмент или получатели.
+    Использует HTML5-виджеты для выбора даты и времени, а получатели выбираются поиском
+    на сервере (RecipientAutocompleteWidget), без вывода всего списка в HTML.
+    Списки сообщений, сегментов и получателей ограничены объектами владельца (owner).
+    Нужно указать либо сегмент, либо явный список получателей.
+    Флажок track_engagement включает отслеживание открытий и переходов (mailing.tracking),
+    priority выбирает очередь отправки (mailing.scheduling), pacing — распределение
+    писем по интервалу рассылки (mailing.pacing), recurrence и cron — повторение
+    рассылки внутри интервала (mailing.recurrence).
     """
     class Meta:
         model = Mailing
-        fields = ['start_time', 'end_time', 'message', 'recipients']
+        fields = [
+            'start_time', 'end_time', 'message', 'segment', 'recipients', 'snapshot_audience', 'track_engagement',
+            'priority', 'pacing', 'recurrence', 'cron',
+        ]
         widgets = {
             'start_time': DateTimeInput(
                 attrs={
@@ -28,15 +71,199 @@ class MailingForm(forms.ModelForm):
                 },
                 format='%Y-%m-%dT%H:%M'
             ),
-            'recipients': forms.SelectMultiple(attrs={
+            'recipients': RecipientAutocompleteWidget(attrs={
                 'class': 'form-control',
                 'size': 5
             }),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, owner=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         # Устанавливаем формат начального значения для рендера
         self.fields['start_time'].input_formats = ['%Y-%m-%dT%H:%M']
         self.fields['end_time'].input_formats = ['%Y-%m-%dT%H:%M']
+
+        if owner is not None:
+            self.fields['message'].queryset = self.fields['message'].queryset.filter(owner=owner)
+            self.fields['segment'].queryset = Segment.objects.filter(owner=owner)
+            self.fields['recipients'].queryset = Recipient.objects.filter(owner=owner)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        segment = cleaned_data.get('segment')
+        recipients = cleaned_data.get('recipients')
+        if segment and recipients:
+            raise forms.ValidationError('Укажите либо сегмент, либо список получателей, но не оба сразу.')
+        if not segment and not recipients and 'recipients' not in self.errors:
+            raise forms.ValidationError('Укажите сегмент или выберите получателей.')
+        if cleaned_data.get('recurrence') == 'cron' and not cleaned_data.get('cron') and 'cron' not in self.errors:
+            self.add_error('cron', 'Укажите выражение cron.')
+        return cleaned_data
+
+
+class MailingAudienceForm(forms.Form):
+    """
+    Пакетное изменение явного списка получателей рассылки (см. mailing.audience).
+
+    Поле, нужное действию, обязательно только для него: строка поиска — для
+    добавления и исключения по поиску, сегмент и рассылка-источник — для
+    соответствующих действий. Списки выбора ограничены объектами владельца (owner).
+    """
+    ACTION_CHOICES = [
+        ('add_all', 'Добавить всех моих получателей'),
+        ('add_matching', 'Добавить найденных по строке поиска'),
+        ('add_segment', 'Добавить текущий состав сегмента'),
+        ('copy_from', 'Скопировать получателей другой рассылки'),
+        ('remove_matching', 'Исключить найденных по строке поиска'),
+        ('clear', 'Исключить всех'),
+    ]
+    REQUIRED_FIELDS = {
+        'add_matching': 'query',
+        'remove_matching': 'query',
+        'add_segment': 'segment',
+        'copy_from': 'source',
+    }
+
+    action = forms.ChoiceField(label='Действие', choices=ACTION_CHOICES)
+    query = forms.CharField(label='Строка поиска', max_length=100, required=False)
+    segment = forms.ModelChoiceField(label='Сегмент', queryset=Segment.objects.all(), required=False)
+    source = forms.ModelChoiceField(label='Рассылка', queryset=Mailing.objects.all(), required=False)
+
+    def __init__(self, *args, owner=None, mailing=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if owner is not None:
+            self.fields['segment'].queryset = Segment.objects.filter(owner=owner)
+            self.fields['source'].queryset = Mailing.objects.filter(owner=owner).select_related('message')
+        if mailing is not None:
+            self.fields['source'].queryset = self.fields['source'].queryset.exclude(pk=mailing.pk)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        required = self.REQUIRED_FIELDS.get(cleaned_data.get('action'))
+        if required and not cleaned_data.get(required) and required not in self.errors:
+            self.add_error(required, 'Обязательное поле для выбранного действия.')
+        return cleaned_data
+
+
+class ExportFilterForm(forms.Form):
+    """
+    Фильтры потоковой выгрузки попыток и отчётов по рассылкам.
+
+    Все поля необязательны. Период задаётся датами (включительно) по московскому времени.
+    """
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    mailing = forms.IntegerField(min_value=1, required=False)
+    owner = forms.IntegerField(min_value=1, required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    status = forms.ChoiceField(choices=Attempt.STATUS_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('Начало периода позже его окончания.')
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
+
+
+class RecipientImportForm(forms.ModelForm):
+    """
+    Загрузка файла с получателями для массового импорта.
+
+    Принимает CSV и XLSX с заголовком email, full_name, comment.
+    """
+
+    class Meta:
+        model = RecipientImport
+        fields = ['file']
+        labels = {'file': 'Файл CSV/XLSX'}
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        extension = os.path.splitext(file.name)[1].lower()
+        if extension not in IMPORT_FORMATS:
+            raise forms.ValidationError(
+                f'Поддерживаются файлы: {", ".join(IMPORT_FORMATS)}.'
+            )
+        return file
+
+
+class TagsField(forms.CharField):
+    """
+    Теги через запятую: при сохранении недостающие теги владельца создаются.
+    """
+
+    def to_python(self, value):
+        names = (name.strip() for name in (super().to_python(value) or '').split(','))
+        return sorted({name[:Tag._meta.get_field('name').max_length] for name in names if name})
+
+
+class RecipientForm(forms.ModelForm):
+    """
+    Форма создания и редактирования получателя с тегами для сегментов.
+    """
+    tag_names = TagsField(label='Теги', required=False, help_text='Через запятую')
+
+    class Meta:
+        model = Recipient
+        fields = ['email', 'full_name', 'comment']
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.owner = owner
+        if self.instance.pk:
+            self.initial['tag_names'] = ', '.join(tag.name for tag in self.instance.tags.all())
+
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        # Проверка уникальности ModelForm не видит помеченных удалёнными
+        if Recipient.all_objects.filter(email=email, is_deleted=True).exists():
+            raise forms.ValidationError('Получатель с этим email удаляется, повторите позже.')
+        return email
+
+    def save(self, commit=True):
+        recipient = super().save(commit=commit)
+        if commit:
+            self.save_tags()
+        return recipient
+
+    def save_tags(self):
+        owner = self.owner or self.instance.owner
+        names = self.cleaned_data['tag_names']
+        Tag.objects.bulk_create([Tag(owner=owner, name=name) for name in names], ignore_conflicts=True)
+        self.instance.tags.set(Tag.objects.filter(owner=owner, name__in=names))
+
+
+class SegmentForm(forms.ModelForm):
+    """
+    Форма сохранённого сегмента: получатели владельца с любым из выбранных тегов
+    и/или адресом в указанном домене.
+    """
+
+    class Meta:
+        model = Segment
+        fields = ['name', 'tags', 'email_domain']
+        labels = {
+            'name': 'Название',
+            'tags': 'Теги (любой из)',
+            'email_domain': 'Домен email',
+        }
+        widgets = {
+            'tags': forms.CheckboxSelectMultiple,
+        }
+
+    def __init__(self, *args, owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if owner is not None:
+            self.fields['tags'].queryset = Tag.objects.filter(owner=owner)
+
+    def clean_email_domain(self):
+        return self.cleaned_data['email_domain'].strip().lstrip('@').lower()
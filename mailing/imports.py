@@ -0,0 +1,266 @@
+"""
+Потоковый импорт получателей из CSV/XLSX.
+
+Файл читается построчно, строки проверяются и нормализуются, а затем
+записываются пачками по IMPORT_CHUNK_SIZE одним INSERT ... ON CONFLICT (email)
+DO UPDATE, который не трогает адреса других пользователей. В памяти
+одновременно находится не больше одной пачки, отклонённые строки сразу
+пишутся в отчёт об ошибках, поэтому память не зависит от размера файла.
+"""
+import csv
+import io
+import itertools
+import os
+import tempfile
+
+import openpyxl
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache
+from .models import Recipient, RecipientImport, UserCounters
+
+IMPORT_CHUNK_SIZE = 2000
+
+IMPORT_FORMATS = ('.csv', '.xlsx')
+
+ERROR_REPORT_COLUMNS = ('row', 'email', 'error')
+
+EMAIL_MAX_LENGTH = Recipient._meta.get_field('email').max_length
+FULL_NAME_MAX_LENGTH = Recipient._meta.get_field('full_name').max_length
+
+
+class ImportFormatError(ValueError):
+    """
+    Файл нельзя прочитать: неизвестный формат или нет колонки email.
+    """
+
+
+class ImportResult:
+    """
+    Итоги импорта; обновляются после каждой пачки.
+    """
+
+    def __init__(self):
+        self.total_rows = 0
+        self.created_count = 0
+        self.updated_count = 0
+        self.error_count = 0
+
+
+def _header(values):
+    columns = [str(value or '').strip().lower() for value in values]
+    if 'email' not in columns:
+        raise ImportFormatError('В первой строке файла нет колонки email.')
+    return columns
+
+
+def _csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    first_line = text.readline()
+    if not first_line:
+        return
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain([first_line], text), dialect)
+    yield _header(next(reader))
+    yield from reader
+
+
+def _xlsx_rows(fileobj):
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield _header(header)
+        yield from rows
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, name):
+    """
+    Итерирует строки файла как (номер строки, словарь колонка -> значение).
+
+    Первая строка — заголовок; обязательна колонка email, необязательны full_name и comment.
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(fileobj)
+    elif extension == '.xlsx':
+        rows = _xlsx_rows(fileobj)
+    else:
+        raise ImportFormatError(f'Неподдерживаемый формат файла: {extension or name}.')
+
+    columns = next(rows, None)
+    if columns is None:
+        return
+    for number, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        yield number, dict(zip(columns, values))
+
+
+def normalize_row(row):
+    """
+    Возвращает (email, full_name, comment) или бросает ValidationError.
+
+    Email очищается от пробелов, домен приводится к нижнему регистру
+    (как BaseUserManager.normalize_email).
+    """
+    email = str(row.get('email') or '').strip()
+    local, _, domain = email.rpartition('@')
+    email = f'{local}@{domain.lower()}' if local else email
+    if len(email) > EMAIL_MAX_LENGTH:
+        raise ValidationError('Слишком длинный email.')
+    validate_email(email)
+
+    full_name = str(row.get('full_name') or '').strip()[:FULL_NAME_MAX_LENGTH]
+    comment = str(row.get('comment') or '').strip() or None
+    return email, full_name, comment
+
+
+def _upsert(owner, recipients):
+    """
+    INSERT ... ON CONFLICT (email) DO UPDATE для пачки recipients.
+
+    Существующая строка обновляется, только если это действующий адрес owner:
+    условие WHERE проверяется под блокировкой конфликтующей строки, поэтому
+    адрес, который другой пользователь добавил в это же время, не перезаписывается.
+    Возвращает множество вставленных или обновлённых адресов.
+    """
+    quote = connection.ops.quote_name
+    meta = Recipient._meta
+    table = quote(meta.db_table)
+    email, full_name, comment, owner_id, is_deleted = (
+        quote(meta.get_field(name).column) for name in ('email', 'full_name', 'comment', 'owner', 'is_deleted')
+    )
+    is_suppressed = quote(meta.get_field('is_suppressed').column)
+    sql = (
+        f'INSERT INTO {table} ({email}, {full_name}, {comment}, {owner_id}, {is_suppressed}, {is_deleted}) '
+        f'VALUES {", ".join(["(%s, %s, %s, %s, FALSE, FALSE)"] * len(recipients))} '
+        f'ON CONFLICT ({email}) DO UPDATE SET {full_name} = EXCLUDED.{full_name}, {comment} = EXCLUDED.{comment} '
+        f'WHERE {table}.{owner_id} = EXCLUDED.{owner_id} AND NOT {table}.{is_deleted} '
+        f'RETURNING {email}'
+    )
+    params = [value for r in recipients for value in (r.email, r.full_name, r.comment, owner.pk)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def _flush(owner, chunk, result, errors):
+    """
+    Записывает пачку {email: (номер строки, Recipient)} одним upsert (см. _upsert).
+
+    Email уникален во всей таблице, поэтому адреса, принадлежащие другим
+    пользователям или ещё не удалённые фоновой задачей, не перезаписываются,
+    а попадают в отчёт об ошибках.
+    """
+    if not chunk:
+        return
+    own_existing = set(Recipient.objects.filter(owner=owner, email__in=list(chunk)).values_list('email', flat=True))
+    with transaction.atomic():
+        written = _upsert(owner, [recipient for _, recipient in chunk.values()])
+
+    rejected = [email for email in chunk if email not in written]
+    deleted = set(Recipient.all_objects.filter(email__in=rejected, is_deleted=True).values_list('email', flat=True))
+    for email in rejected:
+        number, _ = chunk[email]
+        result.error_count += 1
+        if email in deleted:
+            errors.writerow([number, email, 'Адрес удаляется, повторите импорт позже'])
+        else:
+            errors.writerow([number, email, 'Адрес принадлежит другому пользователю'])
+
+    created = len(written - own_existing)
+    result.created_count += created
+    result.updated_count += len(written & own_existing)
+
+    # Запись в обход ORM не шлёт сигналов
+    UserCounters.add(owner.pk, recipient_count=created)
+    cache.bump(owner.pk, Recipient)
+
+
+def import_recipients(owner, fileobj, name, errors, on_progress=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Импортирует получателей из файла fileobj (бинарный режим) во владение owner.
+
+    errors — csv.writer для отчёта об ошибках (колонки ERROR_REPORT_COLUMNS, заголовок
+    пишет вызывающий). on_progress(result) вызывается после каждой пачки.
+    Повтор адреса внутри файла не ошибка: сохраняется последняя строка.
+
+    Возвращает ImportResult.
+    """
+    result = ImportResult()
+    chunk = {}
+
+    for number, row in read_rows(fileobj, name):
+        result.total_rows += 1
+        try:
+            email, full_name, comment = normalize_row(row)
+        except ValidationError as e:
+            result.error_count += 1
+            errors.writerow([number, row.get('email') or '', '; '.join(e.messages)])
+            continue
+
+        chunk[email] = (number, Recipient(email=email, full_name=full_name, comment=comment, owner=owner))
+        if len(chunk) >= chunk_size:
+            _flush(owner, chunk, result, errors)
+            chunk = {}
+            if on_progress:
+                on_progress(result)
+
+    _flush(owner, chunk, result, errors)
+    if on_progress:
+        on_progress(result)
+    return result
+
+
+def run_import(recipient_import):
+    """
+    Обрабатывает загруженный файл RecipientImport, сохраняя прогресс и отчёт об ошибках.
+
+    Пачки, записанные до сбоя, остаются в базе; прогресс и отчёт сохраняются и в этом случае.
+    """
+    imports = RecipientImport.objects.filter(pk=recipient_import.pk)
+    imports.update(status='Выполняется')
+    fields = ('total_rows', 'created_count', 'updated_count', 'error_count')
+
+    def save_progress(result):
+        imports.update(**{field: getattr(result, field) for field in fields})
+        for field in fields:
+            setattr(recipient_import, field, getattr(result, field))
+
+    with tempfile.TemporaryFile() as report:
+        report_text = io.TextIOWrapper(report, encoding='utf-8', newline='')
+        errors = csv.writer(report_text)
+        errors.writerow(ERROR_REPORT_COLUMNS)
+        try:
+            with recipient_import.file.open('rb') as fileobj:
+                save_progress(import_recipients(
+                    recipient_import.owner, fileobj, recipient_import.file.name, errors, on_progress=save_progress,
+                ))
+        except Exception as e:
+            recipient_import.status = 'Ошибка'
+            recipient_import.message = str(e)
+        else:
+            recipient_import.status = 'Завершён'
+
+        report_text.flush()
+        if recipient_import.error_count or recipient_import.status == 'Ошибка':
+            report.seek(0)
+            # Имя файла случайное (report_upload_to): media отдаётся без проверки прав
+            recipient_import.error_report.save('errors.csv', File(report), save=False)
+        report_text.detach()
+
+    recipient_import.finished_at = timezone.now()
+    recipient_import.save()
+    return recipient_import
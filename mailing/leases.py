@@ -0,0 +1,110 @@
+"""
+Аренда (lease) рассылки: рассылку в каждый момент отправляет только один процесс.
+
+Каждый путь отправки — send_mailing (команда send_mailings, повторяющиеся
+рассылки) и цепочка задач send_mailing_task (mailing.scheduling) — сначала
+берёт аренду рассылки. Повторный запуск той же рассылки (второй cron,
+двойное нажатие «Запустить») аренду не получает и ничего не отправляет,
+поэтому воркеров отправки можно запускать сколько угодно.
+
+Аренда — строка MailingLease с токеном держателя и сроком MAILING_LEASE_TIMEOUT
+секунд. Держатель продлевает её во время отправки (heartbeat) не реже чем раз
+в треть срока. Если держатель упал, аренда истекает и её может взять другой;
+если аренду перехватили, прежний держатель прекращает отправку (LeaseLost).
+Цепочка задач передаёт токен продолжению, так что аренда держится от первой
+части рассылки до последней, а после каждой части записывает в аренду курсор —
+pk последнего отправленного получателя. Курсор действует только внутри цепочки:
+повторно доставленное продолжение не отправляет уже отправленное, а новый
+запуск (в том числе после падения прежней цепочки) начинает с начала.
+"""
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+
+from .models import MailingLease
+
+
+class LeaseBusy(Exception):
+    """
+    Рассылку уже отправляет другой держатель аренды.
+    """
+
+
+class LeaseLost(Exception):
+    """
+    Аренда истекла и перехвачена другим держателем: отправку нужно прекратить.
+    """
+
+
+class Lease:
+    """
+    Аренда рассылки mailing_id с токеном token (новым, если не передан).
+
+    Использование: with Lease(mailing.pk) as lease: ... lease.heartbeat() ...
+    или acquire() / renew() / release() вручную, если аренда переживает процесс.
+    """
+
+    def __init__(self, mailing_id, token=None, timeout=None):
+        self.mailing_id = mailing_id
+        self.token = token or uuid.uuid4().hex
+        self.timeout = timeout or settings.MAILING_LEASE_TIMEOUT
+        self.holder = f'{socket.gethostname()}:{os.getpid()}'[:100]
+        self.renewed_at = None
+        self.cursor = 0
+
+    def __repr__(self):
+        return f'<Lease #{self.mailing_id} {self.token}>'
+
+    def acquire(self, resume=False):
+        """
+        Берёт аренду с курсором 0.
+
+        resume=True — продолжение цепочки: только продлить аренду, которую ещё держит
+        этот токен, и прочитать её курсор в self.cursor. Если аренду сняли или
+        перехватили, продолжение ничего не отправляет.
+        """
+        if not MailingLease.acquire(self.mailing_id, self.token, self.timeout, self.holder, resume):
+            return False
+        self.renewed_at = time.monotonic()
+        self.cursor = 0
+        if resume:
+            self.cursor = MailingLease.objects.filter(
+                mailing_id=self.mailing_id, token=self.token,
+            ).values_list('cursor', flat=True).first() or 0
+        return True
+
+    def renew(self, timeout=None, cursor=None):
+        """
+        Продлевает аренду на timeout секунд (по умолчанию на срок аренды) и записывает курсор.
+        """
+        if not MailingLease.renew(self.mailing_id, self.token, timeout or self.timeout, cursor):
+            return False
+        self.renewed_at = time.monotonic()
+        if cursor is not None:
+            self.cursor = cursor
+        return True
+
+    def heartbeat(self):
+        """
+        Продлевает аренду, если с прошлого продления прошла треть срока.
+
+        Возвращает False, если аренда потеряна.
+        """
+        if self.renewed_at is not None and time.monotonic() - self.renewed_at < self.timeout / 3:
+            return True
+        return self.renew()
+
+    def release(self):
+        MailingLease.release(self.mailing_id, self.token)
+        self.renewed_at = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LeaseBusy(f'Рассылка {self.mailing_id} уже отправляется')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import Group, Permission
+from users.roles import MANAGERS_GROUP
 
 
 class Command(BaseCommand):
@@ -12,7 +13,7 @@ class Command(BaseCommand):
     help = "Создает группу Менеджеры с нужными правами"
 
     def handle(self, *args, **kwargs):
-        group, created = Group.objects.get_or_create(name="Менеджеры")
+        group, created = Group.objects.get_or_create(name=MANAGERS_GROUP)
 
         permissions = Permission.objects.filter(
             codename__in=[
@@ -0,0 +1,56 @@
+import csv
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.imports import ERROR_REPORT_COLUMNS, IMPORT_CHUNK_SIZE, ImportFormatError, import_recipients
+
+
+class Command(BaseCommand):
+    """
+    Команда для массового импорта получателей из CSV/XLSX-файла.
+
+    Файл читается потоково и записывается пачками (см. mailing.imports),
+    после каждой пачки выводится прогресс. Отклонённые строки пишутся
+    в CSV-отчёт (--errors) или в stderr.
+    """
+    help = 'Импорт получателей из CSV/XLSX (колонки email, full_name, comment)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .xlsx')
+        parser.add_argument('--owner', required=True, help='Email пользователя-владельца получателей')
+        parser.add_argument('--errors', help='Куда записать CSV-отчёт об отклонённых строках')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Размер пачки')
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(email=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        report = open(options['errors'], 'w', encoding='utf-8', newline='') if options['errors'] else sys.stderr
+        try:
+            errors = csv.writer(report)
+            errors.writerow(ERROR_REPORT_COLUMNS)
+            with open(options['path'], 'rb') as fileobj:
+                result = import_recipients(
+                    owner, fileobj, options['path'], errors,
+                    on_progress=self.report_progress, chunk_size=options['chunk_size'],
+                )
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+        finally:
+            if report is not sys.stderr:
+                report.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово. Добавлено: {result.created_count}, обновлено: {result.updated_count}, "
+            f"ошибок: {result.error_count}."
+        ))
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"Обработано строк: {result.total_rows} "
+            f"(добавлено {result.created_count}, обновлено {result.updated_count}, ошибок {result.error_count})"
+        )
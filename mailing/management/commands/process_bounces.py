@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.bounces import BOUNCE_BATCH_SIZE, process_mailbox
+
+
+class Command(BaseCommand):
+    """
+    Команда для обработки уведомлений о недоставке из ящика mbox или Maildir.
+
+    Ящик читается потоково, с позиции, на которой остановился прошлый запуск
+    (см. mailing.bounces), поэтому команду можно запускать по расписанию на
+    растущем ящике любого размера. Результаты записываются пачками, после
+    каждой пачки выводится прогресс.
+    """
+    help = 'Обработка возвратов (DSN) из ящика mbox или каталога Maildir'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файл mbox или каталог Maildir')
+        parser.add_argument('--batch-size', type=int, default=BOUNCE_BATCH_SIZE, help='Размер пачки')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            try:
+                result = process_mailbox(path, options['batch_size'], on_progress=self.report_progress)
+            except OSError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"{path}: писем {result.message_count}, уведомлений {result.bounce_count}, "
+                f"отмечено попыток {result.matched_count}, заблокировано адресов {result.suppressed_count}."
+            ))
+
+    def report_progress(self, result):
+        self.stdout.write(
+            f"Обработано писем: {result.message_count} (уведомлений {result.bounce_count}, "
+            f"отмечено попыток {result.matched_count}, пропущено {result.skipped_count})"
+        )
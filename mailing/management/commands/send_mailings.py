@@ -1,8 +1,14 @@
+import cProfile
+import io
+import pstats
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from mailing.models import Mailing, Attempt
-from django.core.mail import send_mail
-from django.conf import settings
+from mailing.leases import LeaseBusy, LeaseLost
+from mailing.models import Mailing
+from mailing.profiling import SummaryHook, timing_hook
+from mailing.scheduling import dispatch, run_recurring
+from mailing.services import send_mailing
 
 
 class Command(BaseCommand):
@@ -10,54 +16,71 @@ class Command(BaseCommand):
     Команда для отправки всех активных рассылок, у которых текущая дата попадает в указанный интервал.
 
     Для каждой валидной рассылки отправляет сообщение всем её получателям.
-    Записывает успешные и неуспешные попытки в модель Attempt.
-    Пропускает рассылки вне временного интервала и логирует ошибки.
+    Записывает успешные и неуспешные попытки в модель Attempt (пачками, см. mailing.services).
+    Рассылки вне временного интервала и отключённые менеджером не выбираются.
+    С --queue рассылки не отправляются сразу, а ставятся в очереди Celery по приоритетам
+    (см. mailing.scheduling).
+    Повторяющиеся рассылки отправляются, только если наступил их очередной запуск (next_run_at).
+    Рассылка, которую уже отправляет другой процесс (см. mailing.leases), пропускается.
+    С --profile прогон выполняется под cProfile: статистика сохраняется в файл
+    (для pstats или snakeviz), выводятся самые затратные функции и таблица
+    времени по этапам отправки на 1000 получателей (см. mailing.profiling).
     """
     help = 'Отправка всех активных рассылок (если текущая дата в пределах интервала)'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='store_true', help='Поставить рассылки в очереди Celery вместо отправки здесь',
+        )
+        parser.add_argument(
+            '--profile', nargs='?', const='send_mailings.prof', metavar='FILE',
+            help='Профилировать прогон и сохранить статистику cProfile в FILE (по умолчанию send_mailings.prof)',
+        )
+
     def handle(self, *args, **kwargs):
+        if not kwargs['profile']:
+            self.run(kwargs['queue'])
+            return
+
+        profiler = cProfile.Profile()
+        with timing_hook(SummaryHook()) as summary:
+            profiler.runcall(self.run, kwargs['queue'])
+        profiler.dump_stats(kwargs['profile'])
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+        self.stdout.write(out.getvalue())
+        self.stdout.write('\n'.join(summary.table()))
+        self.stdout.write(f"Статистика cProfile сохранена в {kwargs['profile']}")
+
+    def run(self, queue):
         now = timezone.now()
 
-        all_mailings = Mailing.objects.all()
-
-        for mailing in all_mailings:
-            if not (mailing.start_time <= now <= mailing.end_time):
-                Attempt.objects.create(
-                    mailing=mailing,
-                    status='Не успешно',
-                    server_response='Вне интервала — не отправлено'
-                )
-                self.stdout.write(self.style.WARNING(
-                    f'Пропущено: рассылка {mailing.pk} вне интервала времени.'
-                ))
-                continue
-
-            # если дошли до сюда — значит можно слать
-            for recipient in mailing.recipients.all():
-                try:
-                    send_mail(
-                        mailing.message.subject,
-                        mailing.message.body,
-                        settings.EMAIL_HOST_USER,
-                        [recipient.email],
-                        fail_silently=False,
-                    )
-                    Attempt.objects.create(
-                        mailing=mailing,
-                        status='Успешно',
-                        server_response='OK'
-                    )
-                    self.stdout.write(self.style.SUCCESS(
-                        f"Успешно отправлено: {recipient.email}"
-                    ))
-                except Exception as e:
-                    Attempt.objects.create(
-                        mailing=mailing,
-                        status='Не успешно',
-                        server_response=str(e),
-                    )
-                    self.stdout.write(self.style.ERROR(
-                        f"Ошибка доставки для {recipient.email}: {e}"
-                    ))
+        for mailing in Mailing.objects.due(now).select_related('message', 'segment'):
+            if queue:
+                name = dispatch(mailing)
+                self.stdout.write(f"Рассылка {mailing.pk} поставлена в очередь {name}")
+            else:
+                self.send(mailing)
+
+        start = dispatch if queue else self.send
+        for mailing in run_recurring(now, start=start):
+            self.stdout.write(f"Повторяющаяся рассылка {mailing.pk} запущена, следующий запуск: {mailing.next_run_at}")
 
         self.stdout.write(self.style.SUCCESS("Готово. Все рассылки обработаны."))
+
+    def send(self, mailing):
+        try:
+            send_mailing(mailing, on_result=self.report)
+        except (LeaseBusy, LeaseLost) as e:
+            self.stdout.write(self.style.WARNING(str(e)))
+
+    def report(self, recipient, attempt):
+        if attempt.status == 'Успешно':
+            self.stdout.write(self.style.SUCCESS(
+                f"Успешно отправлено: {recipient.email}"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"Ошибка доставки для {recipient.email}: {attempt.server_response}"
+            ))
@@ -0,0 +1,312 @@
+"""
+Метрики отправки рассылок в текстовом формате Prometheus (эндпоинт views.MetricsView).
+
+Счётчики и гистограммы копятся в памяти процесса и не реже чем раз в
+METRICS_FLUSH_INTERVAL секунд (а также в конце каждой отправки) прибавляются
+к общему хранилищу METRICS_STORE: хешам Redis (HINCRBYFLOAT) или памяти
+процесса для тестов. Поэтому эндпоинт показывает сумму по всем процессам
+воркеров Celery и команды send_mailings, а запись метрики не обращается к
+Redis на каждое письмо. Ошибка хранилища только пишется в лог: метрики не
+должны ломать отправку.
+
+Датчики (глубина очередей, рассылки в отправке) вычисляются при запросе эндпоинта.
+"""
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунд (как по умолчанию в клиентах Prometheus)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LE_RE = re.compile(r'(?:^|,)le="([^"]+)"$')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# -------- ХРАНИЛИЩА --------
+
+class MemoryStore:
+    """
+    Хранилище в памяти процесса (разработка и тесты). Значения общие для всех экземпляров.
+    """
+    _values = defaultdict(dict)
+    _lock = threading.Lock()
+
+    def __init__(self, **options):
+        pass
+
+    def add(self, deltas):
+        """
+        Прибавляет deltas: {(серия, метки): приращение}.
+        """
+        with self._lock:
+            for (series, labels), delta in deltas.items():
+                values = self._values[series]
+                values[labels] = values.get(labels, 0) + delta
+
+    def read(self, series):
+        """
+        Значения серий: {серия: {метки: значение}}.
+        """
+        with self._lock:
+            return {name: dict(self._values.get(name, {})) for name in series}
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class RedisStore:
+    """
+    Хранилище в Redis: серия — хеш prefix:<серия>, поле — строка меток.
+    """
+
+    def __init__(self, location, prefix='metrics'):
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.prefix = prefix
+
+    def add(self, deltas):
+        pipe = self.client.pipeline(transaction=False)
+        for (series, labels), delta in deltas.items():
+            pipe.hincrbyfloat(f'{self.prefix}:{series}', labels, delta)
+        pipe.execute()
+
+    def read(self, series):
+        pipe = self.client.pipeline(transaction=False)
+        for name in series:
+            pipe.hgetall(f'{self.prefix}:{name}')
+        return {
+            name: {labels.decode(): float(value) for labels, value in values.items()}
+            for name, values in zip(series, pipe.execute())
+        }
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.prefix}:*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+_stores = {}
+
+
+def get_store():
+    """
+    Хранилище из настройки METRICS_STORE ({'BACKEND': путь к классу, остальное — параметры}).
+    """
+    options = dict(settings.METRICS_STORE)
+    backend = options.pop('BACKEND')
+    key = (backend, tuple(sorted(options.items())))
+    if key not in _stores:
+        _stores[key] = import_string(backend)(**{name.lower(): value for name, value in options.items()})
+    return _stores[key]
+
+
+# -------- НАКОПЛЕНИЕ В ПРОЦЕССЕ --------
+
+_pending = defaultdict(float)
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def _record(items):
+    with _pending_lock:
+        for key, delta in items:
+            _pending[key] += delta
+    if time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """
+    Прибавляет накопленные в процессе значения к общему хранилищу.
+    """
+    global _flushed_at
+    with _pending_lock:
+        deltas = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    if not deltas:
+        return
+    try:
+        get_store().add(deltas)
+    except Exception:
+        logger.exception('Не удалось сохранить метрики')
+
+
+# -------- МЕТРИКИ --------
+
+REGISTRY = []
+
+
+class Metric:
+    """
+    Метрика с именем name, описанием help и именами меток labels.
+    """
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def _labels(self, values):
+        return ','.join(f'{name}="{_escape(values[name])}"' for name in self.labels)
+
+    @property
+    def series(self):
+        return [self.name]
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for series in self.series:
+            for labels, value in self._sorted(values.get(series, {})):
+                lines.append(f'{series}{{{labels}}} {_format(value)}' if labels else f'{series} {_format(value)}')
+        return lines
+
+    def _sorted(self, values):
+        return sorted(values.items())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _record([((self.name, self._labels(labels)), amount)])
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    @property
+    def series(self):
+        return [f'{self.name}_bucket', f'{self.name}_sum', f'{self.name}_count']
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        prefix = f'{labels},' if labels else ''
+        # Корзины накопительные: значение попадает во все корзины с границей не меньше его
+        items = [
+            ((f'{self.name}_bucket', f'{prefix}le="{bound}"'), 1) for bound in self.buckets if value <= bound
+        ]
+        items += [
+            ((f'{self.name}_bucket', f'{prefix}le="+Inf"'), 1),
+            ((f'{self.name}_sum', labels), value),
+            ((f'{self.name}_count', labels), 1),
+        ]
+        _record(items)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, values):
+        # Для каждого набора меток выводятся все корзины, в том числе пустые (0):
+        # без них histogram_quantile() в Prometheus считает неверно
+        label_sets = set(values.get(f'{self.name}_count', {})) | set(values.get(f'{self.name}_sum', {}))
+        buckets = dict(values.get(f'{self.name}_bucket', {}))
+        for labels in label_sets:
+            prefix = f'{labels},' if labels else ''
+            for bound in (*self.buckets, '+Inf'):
+                buckets.setdefault(f'{prefix}le="{bound}"', 0)
+        return super().render({**values, f'{self.name}_bucket': buckets})
+
+    def _sorted(self, values):
+        def key(item):
+            match = LE_RE.search(item[0])
+            if match is None:
+                return item[0], 0
+            return item[0][:match.start()], float(match.group(1))
+        return sorted(values.items(), key=key)
+
+
+EMAILS_SENT = Counter(
+    'mailing_emails_sent_total', 'Письма, принятые SMTP-сервером.', ('mailing', 'relay'),
+)
+EMAILS_FAILED = Counter(
+    'mailing_emails_failed_total', 'Письма, которые не удалось отправить.', ('mailing', 'relay'),
+)
+RELAY_RETRIES = Counter(
+    'mailing_relay_retries_total', 'Повторы письма через другой сервер после сбоя сервера relay.',
+    ('mailing', 'relay'),
+)
+SMTP_CONNECT_SECONDS = Histogram(
+    'mailing_smtp_connect_seconds', 'Время соединения с SMTP-сервером.', ('relay',),
+)
+SMTP_SEND_SECONDS = Histogram(
+    'mailing_smtp_send_seconds', 'Время отправки одного письма через открытое соединение.', ('relay',),
+)
+ATTEMPT_FLUSH_SECONDS = Histogram(
+    'mailing_attempt_flush_seconds', 'Время сохранения пачки попыток в базу.',
+)
+SEND_PHASE_SECONDS = Counter(
+    'mailing_send_phase_seconds_total', 'Время отправки по этапам (mailing.profiling).', ('phase',),
+)
+
+
+# -------- ЭКСПОРТ --------
+
+def gauges():
+    """
+    Датчики, вычисляемые при запросе: глубина очередей отправки и рассылки в отправке
+    (с действующей арендой, см. mailing.leases).
+    """
+    from django.db.models.functions import Now
+
+    from .models import MailingLease
+    from .scheduling import queue_depth
+
+    lines = [
+        '# HELP mailing_queue_depth Задачи в очереди отправки.',
+        '# TYPE mailing_queue_depth gauge',
+    ]
+    for queue in settings.MAILING_QUEUES.values():
+        depth = queue_depth(queue)
+        if depth is not None:
+            lines.append(f'mailing_queue_depth{{queue="{_escape(queue)}"}} {depth}')
+    in_flight = MailingLease.objects.filter(expires_at__gt=Now()).count()
+    lines += [
+        '# HELP mailing_sends_in_flight Рассылки, которые сейчас отправляются.',
+        '# TYPE mailing_sends_in_flight gauge',
+        f'mailing_sends_in_flight {in_flight}',
+    ]
+    return lines
+
+
+def render():
+    """
+    Все метрики в текстовом формате Prometheus.
+    """
+    flush()
+    values = get_store().read([series for metric in REGISTRY for series in metric.series])
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render(values)
+    lines += gauges()
+    return '\n'.join(lines) + '\n'
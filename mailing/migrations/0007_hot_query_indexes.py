@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0006_alter_mailing_options_alter_message_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['mailing', 'recipient', '-attempt_time'], name='attempt_mailing_recip_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attempt',
+            index=models.Index(fields=['mailing', 'status'], name='attempt_mailing_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['owner', 'is_active', 'start_time', 'end_time'], name='mailing_owner_active_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(fields=['is_active', 'start_time', 'end_time'], name='mailing_active_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['owner', 'id'], name='message_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipient',
+            index=models.Index(fields=['owner', 'id'], name='recipient_owner_id_idx'),
+        ),
+    ]
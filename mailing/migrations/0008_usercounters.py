@@ -0,0 +1,26 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0007_hot_query_indexes'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('message_count', models.PositiveBigIntegerField(default=0)),
+                ('recipient_count', models.PositiveBigIntegerField(default=0)),
+                ('mailing_count', models.PositiveBigIntegerField(default=0)),
+                ('attempt_count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
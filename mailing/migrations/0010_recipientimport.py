@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:25
+
+import django.db.models.deletion
+import mailing.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0009_mailing_owner_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipientImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to=mailing.models.import_upload_to)),
+                ('status', models.CharField(choices=[('В очереди', 'В очереди'), ('Выполняется', 'Выполняется'), ('Завершён', 'Завершён'), ('Ошибка', 'Ошибка')], default='В очереди', max_length=20)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('updated_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('error_report', models.FileField(blank=True, upload_to=mailing.models.report_upload_to)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipient_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
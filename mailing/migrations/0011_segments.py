@@ -0,0 +1,74 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0010_recipientimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='audience_snapshot',
+            field=models.ManyToManyField(blank=True, related_name='snapshot_mailings', to='mailing.recipient'),
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='snapshot_audience',
+            field=models.BooleanField(default=False, verbose_name='Сохранять состав аудитории'),
+        ),
+        migrations.AlterField(
+            model_name='mailing',
+            name='recipients',
+            field=models.ManyToManyField(blank=True, to='mailing.recipient'),
+        ),
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('email_domain', models.CharField(blank=True, max_length=255)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mailings', to='mailing.segment'),
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='segment',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='segments', to='mailing.tag'),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='recipients', to='mailing.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('owner', 'name'), name='tag_owner_name_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='segment',
+            index=models.Index(fields=['owner', 'id'], name='segment_owner_id_idx'),
+        ),
+    ]
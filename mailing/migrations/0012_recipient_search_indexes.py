@@ -0,0 +1,27 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:31
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+import mailing.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0011_segments'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        mailing.operations.AddPostgresIndex(
+            model_name='recipient',
+            index=models.Index(models.F('owner'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='text_pattern_ops'), name='recipient_email_prefix_idx'),
+        ),
+        mailing.operations.AddPostgresIndex(
+            model_name='recipient',
+            index=models.Index(models.F('owner'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='text_pattern_ops'), name='recipient_name_prefix_idx'),
+        ),
+    ]
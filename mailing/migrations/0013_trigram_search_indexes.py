@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:34
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations
+
+import mailing.operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0012_recipient_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        mailing.operations.CreateExtensionIfAvailable('pg_trgm'),
+        mailing.operations.AddIndexIfExtension(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('subject'), name='gin_trgm_ops'), name='message_subject_trgm_idx'),
+            extension='pg_trgm',
+        ),
+        mailing.operations.AddIndexIfExtension(
+            model_name='recipient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='recipient_email_trgm_idx'),
+            extension='pg_trgm',
+        ),
+        mailing.operations.AddIndexIfExtension(
+            model_name='recipient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='recipient_name_trgm_idx'),
+            extension='pg_trgm',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0013_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
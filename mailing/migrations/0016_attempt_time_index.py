@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:48
+
+from django.db import migrations, models
+
+import mailing.operations
+
+
+class Migration(migrations.Migration):
+    # Таблица попыток большая: индекс строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('mailing', '0015_mailing_status_index'),
+    ]
+
+    operations = [
+        mailing.operations.AddIndexConcurrentlyIfPostgres(
+            model_name='attempt',
+            index=models.Index(fields=['attempt_time'], name='attempt_time_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0016_attempt_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingEngagement',
+            fields=[
+                ('mailing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='engagement', serialize=False, to='mailing.mailing')),
+                ('open_count', models.PositiveBigIntegerField(default=0)),
+                ('click_count', models.PositiveBigIntegerField(default=0)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='track_engagement',
+            field=models.BooleanField(default=False, verbose_name='Отслеживать открытия и переходы'),
+        ),
+        migrations.CreateModel(
+            name='TrackingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('open', 'Открытие'), ('click', 'Переход')], max_length=10)),
+                ('url', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('mailing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_events', to='mailing.mailing')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracking_events', to='mailing.recipient')),
+            ],
+        ),
+    ]
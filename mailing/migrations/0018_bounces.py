@@ -0,0 +1,39 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0017_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BounceSource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('inode', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('message_count', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='delivery_response',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='attempt',
+            name='delivery_status',
+            field=models.CharField(blank=True, choices=[('Возврат', 'Возврат'), ('Отложено', 'Отложено')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='recipient',
+            name='is_suppressed',
+            field=models.BooleanField(default=False, verbose_name='Адрес отклоняется'),
+        ),
+    ]
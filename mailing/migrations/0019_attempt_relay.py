@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0018_bounces'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attempt',
+            name='relay',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0019_attempt_relay'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='priority',
+            field=models.CharField(choices=[('high', 'Срочная'), ('normal', 'Обычная'), ('bulk', 'Массовая')], default='normal', max_length=10, verbose_name='Приоритет'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0020_mailing_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='pacing',
+            field=models.CharField(blank=True, choices=[('', 'Сразу'), ('even', 'Равномерно по интервалу'), ('front', 'Больше в начале интервала'), ('back', 'Больше в конце интервала')], default='', max_length=10, verbose_name='Темп отправки'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:15
+
+import mailing.recurrence
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0021_mailing_pacing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailing',
+            name='cron',
+            field=models.CharField(blank=True, max_length=100, validators=[mailing.recurrence.validate_cron], verbose_name='Расписание cron'),
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Следующий запуск'),
+        ),
+        migrations.AddField(
+            model_name='mailing',
+            name='recurrence',
+            field=models.CharField(blank=True, choices=[('', 'Однократно'), ('daily', 'Ежедневно'), ('weekly', 'Еженедельно'), ('cron', 'По расписанию cron')], default='', max_length=10, verbose_name='Повторение'),
+        ),
+        migrations.AddIndex(
+            model_name='mailing',
+            index=models.Index(condition=models.Q(('is_active', True), ('next_run_at__isnull', False)), fields=['next_run_at'], name='mailing_next_run_idx'),
+        ),
+    ]
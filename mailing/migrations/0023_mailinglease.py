@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-19 00:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0022_mailing_recurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailingLease',
+            fields=[
+                ('mailing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='lease', serialize=False, to='mailing.mailing')),
+                ('token', models.CharField(max_length=32)),
+                ('holder', models.CharField(blank=True, max_length=100)),
+                ('expires_at', models.DateTimeField()),
+                ('cursor', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,7 +1,93 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, Greatest, Now
 from django.conf import settings
 from django.utils import timezone
 
+from .recurrence import Cron, validate_cron
+
+
+class Tag(models.Model):
+    """
+    A label that groups recipients of one owner (e.g. "clients", "newsletter").
+
+    Attributes:
+        name (str): Tag name, unique per owner.
+        owner (User): The user who owns the tag.
+    """
+
+    name = models.CharField(max_length=100)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='tags'
+    )
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'name'], name='tag_owner_name_uniq'),
+        ]
+
+
+# Триграммный индекс (pg_trgm) помогает только запросам от трёх символов
+TRIGRAM_MIN_LENGTH = 3
+
+
+class SearchQuerySet(models.QuerySet):
+    """
+    QuerySet with case-insensitive substring search over search_fields.
+
+    icontains compiles to UPPER(column) LIKE '%QUERY%', which the *_trgm_idx
+    GIN indexes serve when pg_trgm is installed. Trigram indexes cannot help
+    queries shorter than TRIGRAM_MIN_LENGTH, so those match by prefix instead.
+    """
+    search_fields = ()
+
+    def search(self, query):
+        query = query.strip()
+        if not query:
+            return self
+        lookup = 'icontains' if len(query) >= TRIGRAM_MIN_LENGTH else 'istartswith'
+        condition = models.Q()
+        for field in self.search_fields:
+            condition |= models.Q(**{f'{field}__{lookup}': query})
+        return self.filter(condition)
+
+
+class SoftDeleteManager(models.Manager):
+    """
+    Default manager that hides soft-deleted rows (is_deleted=True).
+
+    Soft-deleted objects are kept only until the background purge removes them
+    together with their history (see mailing.deletion); use the all_objects
+    manager to reach them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+class RecipientQuerySet(SearchQuerySet):
+    search_fields = ('email', 'full_name')
+
+    def search_prefix(self, query):
+        """
+        Recipients whose email or full name starts with query (case-insensitive).
+
+        istartswith compiles to UPPER(column) LIKE 'QUERY%', which uses the
+        recipient_*_prefix_idx indexes when filtered by owner.
+        """
+        query = query.strip()
+        if not query:
+            return self
+        return self.filter(models.Q(email__istartswith=query) | models.Q(full_name__istartswith=query))
+
 
 class Recipient(models.Model):
     """
@@ -11,7 +97,10 @@ class Recipient(models.Model):
         email (str): Unique email address of the recipient.
         full_name (str): Full name of the recipient.
         comment (str, optional): Additional comment or note about the recipient.
+        tags (QuerySet[Tag]): Tags used by segments to select the recipient.
         owner (User): The user who owns/created this recipient.
+        is_suppressed (bool): The address hard-bounced; mailings skip it (see mailing.bounces).
+        is_deleted (bool): Marked for deletion; hidden from the default manager until purged.
 
     Permissions:
         - view_all_recipients: Allows viewing recipients created by other users.
@@ -20,12 +109,18 @@ class Recipient(models.Model):
     email = models.EmailField(unique=True)
     full_name = models.CharField(max_length=255)
     comment = models.TextField(blank=True, null=True)
+    tags = models.ManyToManyField(Tag, blank=True, related_name='recipients')
 
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='recipients'
     )
+    is_suppressed = models.BooleanField(default=False, verbose_name="Адрес отклоняется")
+    is_deleted = models.BooleanField(default=False, editable=False)
+
+    objects = SoftDeleteManager.from_queryset(RecipientQuerySet)()
+    all_objects = RecipientQuerySet.as_manager()
 
     def __str__(self):
         return f'{self.full_name} ({self.email})'
@@ -34,6 +129,19 @@ class Recipient(models.Model):
         permissions = [
             ("view_all_recipients", "Может просматривать всех получателей"),
         ]
+        indexes = [
+            # Списки получателей владельца (OwnerOrManagerMixin)
+            models.Index(fields=['owner', 'id'], name='recipient_owner_id_idx'),
+            # Поиск по префиксу в выборе получателей (RecipientQuerySet.search_prefix):
+            # recipient_*_prefix_idx — (owner, UPPER(...) text_pattern_ops), только в PostgreSQL,
+            # создаются миграцией 0012 (mailing.operations.AddPostgresIndex)
+            # Поиск по подстроке (SearchQuerySet.search, поиск в админке): GIN-индексы
+            # recipient_*_trgm_idx создаются миграцией 0013, если установлен pg_trgm
+        ]
+
+
+class MessageQuerySet(SearchQuerySet):
+    search_fields = ('subject',)
 
 
 class Message(models.Model):
@@ -53,6 +161,8 @@ class Message(models.Model):
     body = models.TextField()
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    objects = MessageQuerySet.as_manager()
+
     def __str__(self):
         return self.subject
 
@@ -60,6 +170,110 @@ class Message(models.Model):
         permissions = [
             ("view_all_messages", "Может просматривать все сообщения"),
         ]
+        indexes = [
+            # Списки сообщений владельца (OwnerOrManagerMixin)
+            models.Index(fields=['owner', 'id'], name='message_owner_id_idx'),
+            # Поиск по теме (SearchQuerySet.search, поиск в админке): GIN-индекс
+            # message_subject_trgm_idx создаётся миграцией 0013, если установлен pg_trgm
+        ]
+
+
+class Segment(models.Model):
+    """
+    A saved audience: the owner's recipients matching the filters, resolved at send time.
+
+    A mailing that references a segment stores no per-recipient rows; the
+    audience is selected by a single query when the mailing is sent.
+    Empty filters match all recipients of the owner.
+
+    Attributes:
+        name (str): Segment name.
+        tags (QuerySet[Tag]): Recipients having any of these tags match.
+        email_domain (str, optional): Recipients with an email in this domain match.
+        owner (User): The user who owns the segment.
+    """
+
+    name = models.CharField(max_length=255)
+    tags = models.ManyToManyField(Tag, blank=True, related_name='segments')
+    email_domain = models.CharField(max_length=255, blank=True)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='segments'
+    )
+
+    def resolve(self):
+        """
+        Returns a queryset of the recipients matching the segment.
+
+        Tag matching is an EXISTS subquery over the recipient-tag table, so the
+        query streams without joins multiplying rows.
+        """
+        recipients = Recipient.objects.filter(owner_id=self.owner_id)
+        if self.email_domain:
+            recipients = recipients.filter(email__iendswith=f'@{self.email_domain}')
+        tag_ids = list(self.tags.values_list('pk', flat=True)) if self.pk else []
+        if tag_ids:
+            recipients = recipients.filter(models.Exists(
+                Recipient.tags.through.objects.filter(recipient_id=models.OuterRef('pk'), tag_id__in=tag_ids)
+            ))
+        return recipients
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='segment_owner_id_idx'),
+        ]
+
+
+class MailingQuerySet(SearchQuerySet):
+    """
+    QuerySet рассылок с типовыми выборками.
+    """
+    search_fields = ('message__subject',)
+
+    def due(self, now=None):
+        """
+        Активные однократные рассылки, интервал которых включает момент now.
+
+        Отбор выполняется в БД по индексу mailing_active_time_idx.
+        """
+        now = now or timezone.now()
+        return self.filter(is_active=True, recurrence='', start_time__lte=now, end_time__gte=now)
+
+    def due_runs(self, now=None):
+        """
+        Повторяющиеся рассылки, чей очередной запуск (next_run_at) наступил к моменту now.
+
+        Отбор — один проход по частичному индексу mailing_next_run_idx,
+        правила повторения при этом не вычисляются.
+        """
+        now = now or timezone.now()
+        return self.filter(is_active=True, next_run_at__lte=now)
+
+    def sync_status(self, now=None):
+        """
+        Persists status transitions as of now with one UPDATE per status.
+
+        Only rows whose stored status is out of date are matched (by the
+        mailing_status_time_idx index), so finished mailings are not rewritten.
+        Reads never depend on this: Mailing.current_status is computed from the
+        schedule. Returns the number of updated rows.
+        """
+        now = now or timezone.now()
+        transitions = [
+            ('Создана', models.Q(start_time__gt=now)),
+            ('Запущена', models.Q(start_time__lte=now, end_time__gte=now)),
+            ('Завершена', models.Q(end_time__lt=now)),
+        ]
+        statuses = [status for status, _ in transitions]
+        updated = 0
+        for status, condition in transitions:
+            stale = [other for other in statuses if other != status]
+            updated += self.filter(condition, status__in=stale).update(status=status)
+        return updated
 
 
 class Mailing(models.Model):
@@ -69,14 +283,33 @@ class Mailing(models.Model):
     Attributes:
         start_time (datetime): When the mailing should begin.
         end_time (datetime): When the mailing should end.
-        status (str): Current status of the mailing ("Создана", "Запущена", "Завершена").
+        status (str): Stored status ("Создана", "Запущена", "Завершена"), persisted
+            periodically by MailingQuerySet.sync_status; use current_status for display.
         is_active (bool): Whether the mailing is active or disabled.
         message (Message): The message to be sent.
-        recipients (QuerySet[Recipient]): Recipients included in the mailing.
+        recipients (QuerySet[Recipient]): Explicit list of recipients (used when no segment is set).
+        segment (Segment, optional): Saved audience resolved at send time instead of the explicit list.
+        snapshot_audience (bool): Whether to record the resolved segment audience on each send.
+        audience_snapshot (QuerySet[Recipient]): Recipients the segment resolved to when sent.
+        track_engagement (bool): Whether to add an open pixel and tracked links when sending.
+        priority (str): Send priority ("high", "normal", "bulk") that selects the Celery
+            queue (see mailing.scheduling).
+        pacing (str, optional): Curve ("even", "front", "back") for spreading the sends
+            across [start_time, end_time] (see mailing.pacing); empty sends at once.
+        recurrence (str, optional): Repeat rule ("daily", "weekly", "cron"); empty for a
+            one-off mailing. Daily and weekly runs repeat the local time of start_time.
+        cron (str, optional): Cron expression used when recurrence is "cron" (see mailing.recurrence).
+        next_run_at (datetime, optional): Next run of a recurring mailing within
+            [start_time, end_time]; recomputed on save and after each run.
         owner (User): The user who created the mailing.
+        is_deleted (bool): Marked for deletion; hidden from the default manager until purged.
 
     Methods:
-        update_status(): Updates the status field based on the current time.
+        get_status(now): Returns the status derived from the schedule at the given moment.
+        current_status: Status derived from the schedule right now (property).
+        audience(): Returns the recipients to send to.
+        rule(): Returns the recurrence rule as a Cron, or None for a one-off mailing.
+        get_next_run(after): Returns the first run after the given moment, or None.
 
     Permissions:
         - view_all_mailings: Allows viewing mailings from other users.
@@ -88,6 +321,25 @@ class Mailing(models.Model):
         ('Запущена', 'Запущена'),
         ('Завершена', 'Завершена'),
     ]
+    PRIORITY_CHOICES = [
+        ('high', 'Срочная'),
+        ('normal', 'Обычная'),
+        ('bulk', 'Массовая'),
+    ]
+    PACING_CHOICES = [
+        ('', 'Сразу'),
+        ('even', 'Равномерно по интервалу'),
+        ('front', 'Больше в начале интервала'),
+        ('back', 'Больше в конце интервала'),
+    ]
+    RECURRENCE_CHOICES = [
+        ('', 'Однократно'),
+        ('daily', 'Ежедневно'),
+        ('weekly', 'Еженедельно'),
+        ('cron', 'По расписанию cron'),
+    ]
+    # Изменение этих полей меняет ближайший запуск
+    SCHEDULE_FIELDS = {'start_time', 'end_time', 'is_active', 'recurrence', 'cron'}
 
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
@@ -96,33 +348,159 @@ class Mailing(models.Model):
     is_active = models.BooleanField(default=True, verbose_name="Активна")
 
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
-    recipients = models.ManyToManyField(Recipient)
+    recipients = models.ManyToManyField(Recipient, blank=True)
+    segment = models.ForeignKey(
+        Segment,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='mailings'
+    )
+    snapshot_audience = models.BooleanField(default=False, verbose_name="Сохранять состав аудитории")
+    track_engagement = models.BooleanField(default=False, verbose_name="Отслеживать открытия и переходы")
+    priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='normal', verbose_name="Приоритет")
+    pacing = models.CharField(
+        max_length=10, choices=PACING_CHOICES, default='', blank=True, verbose_name="Темп отправки",
+    )
+    recurrence = models.CharField(
+        max_length=10, choices=RECURRENCE_CHOICES, default='', blank=True, verbose_name="Повторение",
+    )
+    cron = models.CharField(max_length=100, blank=True, validators=[validate_cron], verbose_name="Расписание cron")
+    next_run_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Следующий запуск")
+    audience_snapshot = models.ManyToManyField(Recipient, blank=True, related_name='snapshot_mailings')
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='mailings'
     )
+    is_deleted = models.BooleanField(default=False, editable=False)
 
-    def update_status(self):
-        now = timezone.now()
+    objects = SoftDeleteManager.from_queryset(MailingQuerySet)()
+    all_objects = MailingQuerySet.as_manager()
 
+    def get_status(self, now=None):
+        """
+        Returns the status derived from start_time/end_time at moment now.
+        """
+        now = now or timezone.now()
         if now < self.start_time:
-            self.status = 'Создана'
-        elif self.start_time <= now <= self.end_time:
-            self.status = 'Запущена'
-        else:
-            self.status = 'Завершена'
-
-        self.save()
+            return 'Создана'
+        if now <= self.end_time:
+            return 'Запущена'
+        return 'Завершена'
+
+    @property
+    def current_status(self):
+        """
+        Status derived from the schedule right now; never stale, needs no query.
+        """
+        return self.get_status()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_schedule = instance._schedule()
+        return instance
+
+    def _schedule(self):
+        # Отложенные (deferred) поля не читаются, чтобы не делать лишних запросов
+        return {name: self.__dict__[name] for name in self.SCHEDULE_FIELDS if name in self.__dict__}
+
+    def _schedule_changed(self):
+        saved = getattr(self, '_saved_schedule', None)
+        return saved is None or self._schedule() != saved
+
+    def save(self, *args, **kwargs):
+        # Расписание могло измениться, сохранённый статус приводится в соответствие
+        self.status = self.get_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
+            kwargs['update_fields'] = update_fields = [*update_fields, 'status']
+        # next_run_at пересчитывается только при изменении расписания: иначе любое
+        # сохранение (правка темы, смена приоритета) потеряло бы наступивший, но ещё
+        # не запущенный beat запуск
+        if (update_fields is None or self.SCHEDULE_FIELDS.intersection(update_fields)) and self._schedule_changed():
+            self.next_run_at = self.get_next_run()
+            if update_fields is not None and 'next_run_at' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'next_run_at']
+        super().save(*args, **kwargs)
+        self._saved_schedule = self._schedule()
+
+    def rule(self):
+        """
+        Returns the recurrence rule as a Cron, or None for a one-off mailing.
+        """
+        if self.recurrence == 'cron':
+            return Cron(self.cron) if self.cron else None
+        start = timezone.localtime(self.start_time)
+        if self.recurrence == 'daily':
+            return Cron(f'{start.minute} {start.hour} * * *')
+        if self.recurrence == 'weekly':
+            return Cron(f'{start.minute} {start.hour} * * {start.isoweekday() % 7}')
+        return None
+
+    def get_next_run(self, after=None):
+        """
+        Returns the first run strictly after moment after (default: now) that falls
+        within [start_time, end_time], or None.
+        """
+        rule = self.rule()
+        if rule is None:
+            return None
+        after = max(after or timezone.now(), self.start_time - timedelta(microseconds=1))
+        return rule.next_after(after, until=self.end_time)
+
+    def audience(self):
+        """
+        Returns a queryset of the recipients to send to: the resolved segment
+        if one is set, otherwise the explicit recipients list.
+        """
+        if self.segment_id:
+            return self.segment.resolve()
+        return self.recipients.all()
 
     def __str__(self):
-        return f"{self.message.subject} ({self.status})"
+        return f"{self.message.subject} ({self.current_status})"
 
     class Meta:
         permissions = [
             ("view_all_mailings", "Может просматривать все рассылки"),
             ("disable_mailings", "Может отключать рассылки"),
         ]
+        indexes = [
+            # Постраничный список рассылок владельца (по убыванию id)
+            models.Index(fields=['owner', 'id'], name='mailing_owner_id_idx'),
+            # Рассылки владельца с фильтром по активности и интервалу
+            models.Index(
+                fields=['owner', 'is_active', 'start_time', 'end_time'],
+                name='mailing_owner_active_time_idx',
+            ),
+            # Поиск рассылок с устаревшим статусом (MailingQuerySet.sync_status)
+            models.Index(fields=['status', 'start_time', 'end_time'], name='mailing_status_time_idx'),
+            # Выбор рассылок к отправке (send_mailings)
+            models.Index(
+                fields=['is_active', 'start_time', 'end_time'],
+                name='mailing_active_time_idx',
+            ),
+            # Повторяющиеся рассылки, чей запуск наступил (MailingQuerySet.due_runs)
+            models.Index(
+                fields=['next_run_at'],
+                name='mailing_next_run_idx',
+                condition=models.Q(is_active=True, next_run_at__isnull=False),
+            ),
+        ]
+
+
+class AttemptQuerySet(models.QuerySet):
+
+    def visible(self):
+        """
+        Attempts whose mailing and recipient are not soft-deleted.
+
+        Attempts of deleted objects stay in the table until the background purge
+        and must not show up in lists, exports or counters meanwhile.
+        """
+        return self.filter(mailing__is_deleted=False, recipient__is_deleted=False)
 
 
 class Attempt(models.Model):
@@ -133,6 +511,11 @@ class Attempt(models.Model):
         attempt_time (datetime): Timestamp when the attempt was made.
         status (str): Result of the attempt ("Успешно", "Не успешно").
         server_response (str): Raw response from the email server.
+        delivery_status (str, optional): Outcome reported later by a delivery status
+            notification ("Возврат", "Отложено"); empty if none arrived.
+        delivery_response (str, optional): Status code and diagnostic text from that notification.
+        relay (str, optional): Name of the SMTP relay from EMAIL_RELAYS that handled the
+            message (the last one tried if all failed); empty if none was reached.
         mailing (Mailing): The associated mailing.
         recipient (Recipient): The recipient the attempt was sent to.
     """
@@ -140,12 +523,348 @@ class Attempt(models.Model):
         ('Успешно', 'Успешно'),
         ('Не успешно', 'Не успешно'),
     ]
+    DELIVERY_STATUS_CHOICES = [
+        ('Возврат', 'Возврат'),
+        ('Отложено', 'Отложено'),
+    ]
 
     attempt_time = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     server_response = models.TextField()
+    delivery_status = models.CharField(max_length=20, choices=DELIVERY_STATUS_CHOICES, blank=True)
+    delivery_response = models.TextField(blank=True)
+    relay = models.CharField(max_length=100, blank=True)
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE)
     recipient = models.ForeignKey('Recipient', on_delete=models.CASCADE)
 
+    objects = AttemptQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.mailing} — {self.status} at {self.attempt_time}"
+
+    class Meta:
+        indexes = [
+            # Последняя попытка по получателю в рамках рассылки (MailingStatsView)
+            models.Index(
+                fields=['mailing', 'recipient', '-attempt_time'],
+                name='attempt_mailing_recip_time_idx',
+            ),
+            # Подсчёт успешных/неуспешных попыток рассылки
+            models.Index(fields=['mailing', 'status'], name='attempt_mailing_status_idx'),
+            # Дерево дат и фильтр по периоду в админке (MIN/MAX и диапазоны по attempt_time)
+            models.Index(fields=['attempt_time'], name='attempt_time_idx'),
+        ]
+
+
+class TrackingEvent(models.Model):
+    """
+    An open or a click recorded by the tracking endpoints.
+
+    Rows are written in batches by the tracking consumer (see mailing/tracking.py),
+    never by the request that received the event.
+
+    Attributes:
+        mailing (Mailing): The mailing the tracked email belonged to.
+        recipient (Recipient): The recipient who opened the email or followed the link.
+        kind (str): "open" or "click".
+        url (str): Original link target for clicks, empty for opens.
+        created_at (datetime): When the event happened (not when it was stored).
+    """
+    KIND_CHOICES = [
+        ('open', 'Открытие'),
+        ('click', 'Переход'),
+    ]
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='tracking_events')
+    recipient = models.ForeignKey(Recipient, on_delete=models.CASCADE, related_name='tracking_events')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    url = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.mailing_id} — {self.recipient_id}'
+
+
+class MailingEngagement(models.Model):
+    """
+    Per-mailing open and click counters maintained by the tracking consumer.
+
+    Attributes:
+        mailing (Mailing): The mailing (primary key).
+        open_count (int): Number of recorded opens.
+        click_count (int): Number of recorded clicks.
+        last_event_at (datetime, optional): Time of the latest recorded event.
+    """
+
+    mailing = models.OneToOneField(
+        Mailing,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='engagement'
+    )
+    open_count = models.PositiveBigIntegerField(default=0)
+    click_count = models.PositiveBigIntegerField(default=0)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def add(cls, mailing_id, last_event_at=None, **deltas):
+        """
+        Atomically shifts counters by the given deltas, e.g. add(mailing_id, open_count=10).
+
+        The row is created on first use.
+        """
+        values = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if last_event_at is not None:
+            # GREATEST в PostgreSQL пропускает NULL, а в SQLite возвращает NULL
+            last = models.Value(last_event_at)
+            values['last_event_at'] = Greatest(Coalesce('last_event_at', last), last)
+        if not values:
+            return
+        if not cls.objects.filter(mailing_id=mailing_id).update(**values):
+            cls.objects.get_or_create(mailing_id=mailing_id)
+            cls.objects.filter(mailing_id=mailing_id).update(**values)
+
+
+class BounceSource(models.Model):
+    """
+    Read position in an mbox file processed by the process_bounces command.
+
+    Attributes:
+        path (str): Absolute path of the mailbox file.
+        offset (int): Byte offset just past the last processed message.
+        inode (int, optional): Inode of the file at that offset; a different inode
+            or a file shorter than offset means it was rotated and is read from the start.
+        message_count (int): Total number of messages processed.
+        updated_at (datetime): When the position was last saved.
+    """
+
+    path = models.CharField(max_length=1024, unique=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    inode = models.PositiveBigIntegerField(null=True, blank=True)
+    message_count = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} @ {self.offset}"
+
+
+class MailingLease(models.Model):
+    """
+    Exclusive right to send a mailing, held by one process at a time.
+
+    The holder identifies itself with a random token and renews the lease before
+    expires_at; a lapsed lease (crashed holder) can be taken by anyone. Expiry is
+    compared with the database clock, so the workers' clocks do not matter.
+    The cursor belongs to the run holding the lease: only a continuation of the
+    same task chain (acquire with resume=True) picks it up, so a redelivered
+    continuation does not resend; any fresh acquisition starts again from 0.
+    See mailing.leases.
+
+    Attributes:
+        mailing (Mailing): The leased mailing (primary key).
+        token (str): Token of the current holder.
+        holder (str): Host and pid of the current holder, for diagnostics.
+        expires_at (datetime): When the lease lapses unless renewed.
+        cursor (int): Primary key of the last recipient sent by the chain of
+            send tasks (mailing.scheduling); 0 before the first chunk.
+    """
+
+    mailing = models.OneToOneField(
+        Mailing,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='lease'
+    )
+    token = models.CharField(max_length=32)
+    holder = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField()
+    cursor = models.BigIntegerField(default=0)
+
+    @classmethod
+    def acquire(cls, mailing_id, token, timeout, holder='', resume=False):
+        """
+        Takes the lease for token, or extends it if token already holds it.
+
+        Returns False while another holder's lease is valid. One conditional
+        UPDATE that also resets the cursor; the row is inserted on first use
+        (a concurrent insert loses). With resume=True only a row still held by
+        token (expired or not) is extended and its cursor is kept.
+        """
+        expires_at = Now() + timedelta(seconds=timeout)
+        if resume:
+            return bool(
+                cls.objects.filter(mailing_id=mailing_id, token=token)
+                .update(holder=holder, expires_at=expires_at)
+            )
+        taken = cls.objects.filter(
+            models.Q(token=token) | models.Q(expires_at__lt=Now()), mailing_id=mailing_id,
+        ).update(token=token, holder=holder, expires_at=expires_at, cursor=0)
+        if taken:
+            return True
+        try:
+            with transaction.atomic():
+                cls.objects.create(mailing_id=mailing_id, token=token, holder=holder, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def renew(cls, mailing_id, token, timeout, cursor=None):
+        """
+        Extends the lease by timeout seconds from now and stores cursor if given.
+
+        False if token no longer holds the lease.
+        """
+        values = {'expires_at': Now() + timedelta(seconds=timeout)}
+        if cursor is not None:
+            values['cursor'] = cursor
+        return bool(cls.objects.filter(mailing_id=mailing_id, token=token).update(**values))
+
+    @classmethod
+    def release(cls, mailing_id, token):
+        """
+        Gives the lease up if token still holds it.
+        """
+        cls.objects.filter(mailing_id=mailing_id, token=token).delete()
+
+    def __str__(self):
+        return f'#{self.mailing_id} — {self.holder} до {self.expires_at}'
+
+
+class UserCounters(models.Model):
+    """
+    Per-user counter cache for the home page statistics.
+
+    Counters are maintained incrementally by signals (see mailing/signals.py)
+    and by explicit add() calls on bulk paths that bypass signals. A missing
+    row is rebuilt from the database on first access.
+
+    Attributes:
+        user (User): Owner of the counters (primary key).
+        message_count (int): Number of messages owned by the user.
+        recipient_count (int): Number of recipients owned by the user.
+        mailing_count (int): Number of mailings owned by the user.
+        attempt_count (int): Number of attempts made by the user's mailings.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters'
+    )
+    message_count = models.PositiveBigIntegerField(default=0)
+    recipient_count = models.PositiveBigIntegerField(default=0)
+    mailing_count = models.PositiveBigIntegerField(default=0)
+    attempt_count = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Returns the counters of the user, rebuilding them if they do not exist yet.
+        """
+        try:
+            return cls.objects.get(user=user)
+        except cls.DoesNotExist:
+            return cls.rebuild(user.pk)
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """
+        Recomputes all counters of the user with COUNT queries.
+        """
+        counters, _ = cls.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'message_count': Message.objects.filter(owner_id=user_id).count(),
+                'recipient_count': Recipient.objects.filter(owner_id=user_id).count(),
+                'mailing_count': Mailing.objects.filter(owner_id=user_id).count(),
+                'attempt_count': Attempt.objects.visible().filter(mailing__owner_id=user_id).count(),
+            },
+        )
+        return counters
+
+    @classmethod
+    def add(cls, user_id, **deltas):
+        """
+        Atomically shifts counters by the given deltas, e.g. add(user_id, attempt_count=500).
+
+        Never creates a row when decrementing: the user may be in the middle of
+        a cascade delete. A missing row on increment is rebuilt from the database,
+        which already includes the new objects.
+        """
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas or user_id is None:
+            return
+        updated = cls.objects.filter(user_id=user_id).update(**{
+            field: Greatest(models.F(field) + delta, 0) for field, delta in deltas.items()
+        })
+        if not updated and all(delta > 0 for delta in deltas.values()):
+            cls.rebuild(user_id)
+
+
+def import_upload_to(instance, filename):
+    """
+    Random name for an uploaded import file: the media directory is served without permission checks.
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return f'imports/{uuid.uuid4().hex}.{extension}'
+
+
+def report_upload_to(instance, filename):
+    """
+    Random name for an import error report: it holds addresses and the media directory is public.
+    """
+    return f'imports/errors/{uuid.uuid4().hex}.csv'
+
+
+class RecipientImport(models.Model):
+    """
+    Bulk import of recipients from an uploaded CSV/XLSX file.
+
+    The file is processed in the background (mailing.tasks.import_recipients_task)
+    in chunks; counters are updated after every chunk so the page can show progress.
+
+    Attributes:
+        owner (User): The user who uploaded the file and will own the recipients.
+        file (File): The uploaded CSV or XLSX file.
+        status (str): Processing state.
+        total_rows (int): Data rows read so far.
+        created_count (int): Recipients created.
+        updated_count (int): Existing recipients of the owner that were updated.
+        error_count (int): Rows rejected (invalid or owned by another user).
+        error_report (File, optional): CSV with the rejected rows.
+        message (str, optional): Reason of a failed import.
+        created_at (datetime): Upload time.
+        finished_at (datetime, optional): Processing end time.
+    """
+
+    STATUS_CHOICES = [
+        ('В очереди', 'В очереди'),
+        ('Выполняется', 'Выполняется'),
+        ('Завершён', 'Завершён'),
+        ('Ошибка', 'Ошибка'),
+    ]
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recipient_imports'
+    )
+    file = models.FileField(upload_to=import_upload_to)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='В очереди')
+    total_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error_report = models.FileField(upload_to=report_upload_to, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ('Завершён', 'Ошибка')
+
+    def __str__(self):
+        return f'Импорт #{self.pk} ({self.status})'
@@ -0,0 +1,131 @@
+"""
+Операции миграций, которые зависят от PostgreSQL и его расширений.
+
+Классы операторов (text_pattern_ops) есть только в PostgreSQL, а расширение
+pg_trgm — не на каждом сервере, поэтому такие индексы создаются только там,
+где их можно создать. В состояние моделей такие индексы не входят, поэтому
+миграции проходят на любой базе, а поиск (SearchQuerySet.search) работает
+и без индексов — просто медленнее.
+
+Индексы больших таблиц строятся без блокировки записи (CONCURRENTLY) там,
+где это есть, то есть тоже только в PostgreSQL.
+"""
+import logging
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import DatabaseError, migrations, transaction
+from django.db.migrations.operations.base import Operation
+
+logger = logging.getLogger(__name__)
+
+
+def extension_installed(schema_editor, name):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return cursor.fetchone() is not None
+
+
+class CreateExtensionIfAvailable(Operation):
+    """
+    CREATE EXTENSION IF NOT EXISTS, если расширение доступно на сервере и есть права.
+
+    Иначе миграция проходит с предупреждением в логе, а зависящие от
+    расширения операции (AddIndexIfExtension) пропускаются.
+    """
+
+    reversible = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def deconstruct(self):
+        return self.__class__.__qualname__, [self.name], {}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_available_extensions WHERE name = %s', [self.name])
+            available = cursor.fetchone() is not None
+        if not available:
+            logger.warning('Расширение %s недоступно на сервере, зависящие от него индексы не создаются', self.name)
+            return
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(f'CREATE EXTENSION IF NOT EXISTS {schema_editor.quote_name(self.name)}')
+        except DatabaseError as e:
+            logger.warning('Не удалось создать расширение %s: %s', self.name, e)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # Расширением могут пользоваться и другие приложения, оно не удаляется
+        pass
+
+    def describe(self):
+        return f'Creates extension {self.name} if available'
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """
+    AddIndex для индексов, которые есть только в PostgreSQL (классы операторов, GIN).
+
+    Индекс создаётся только в PostgreSQL и не входит в состояние моделей
+    (в Meta.indexes его нет): иначе SQLite, пересоздавая таблицу при
+    добавлении поля, пытался бы создать и его.
+    """
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def supported(self, schema_editor):
+        return schema_editor.connection.vendor == 'postgresql'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if self.supported(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(self.index.name)}')
+
+
+class AddIndexIfExtension(AddPostgresIndex):
+    """
+    AddPostgresIndex, который создаёт индекс только при установленном расширении extension.
+    """
+
+    def __init__(self, model_name, index, extension):
+        super().__init__(model_name, index)
+        self.extension = extension
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        kwargs['extension'] = self.extension
+        return self.__class__.__qualname__, args, kwargs
+
+    def supported(self, schema_editor):
+        return extension_installed(schema_editor, self.extension)
+
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    """
+    AddIndexConcurrently в PostgreSQL и обычный AddIndex на остальных базах.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,58 @@
+"""
+Равномерная (или по кривой) отправка рассылки в пределах [start_time, end_time].
+
+Кривая — доля аудитории, которая должна быть отправлена к моменту t
+(t от 0 в начале интервала до 1 в конце). Задача отправки (см. mailing.scheduling)
+каждые PACING_INTERVAL секунд берёт квоту paced_quota и откладывает
+продолжение до следующего такта.
+
+Квота каждый раз пересчитывается от фактически оставшихся получателей
+и оставшегося времени: если отправка отстала (медленный SMTP, очередь,
+перерыв воркера), недоотправленное распределяется по остатку интервала
+по той же кривой, а не уходит одним всплеском.
+"""
+import math
+from datetime import timedelta
+
+from django.utils import timezone
+
+CURVES = {
+    # Одинаковое число писем в каждый такт
+    'even': lambda t: t,
+    # Больше писем в начале интервала
+    'front': lambda t: 1 - (1 - t) ** 2,
+    # Больше писем в конце интервала
+    'back': lambda t: t ** 2,
+}
+
+
+def progress(mailing, moment):
+    """
+    Доля прошедшего интервала рассылки к моменту moment, от 0 до 1.
+    """
+    duration = (mailing.end_time - mailing.start_time).total_seconds()
+    if duration <= 0:
+        return 1.0
+    elapsed = (moment - mailing.start_time).total_seconds()
+    return min(max(elapsed / duration, 0.0), 1.0)
+
+
+def paced_quota(mailing, remaining, interval, now=None):
+    """
+    Сколько из remaining оставшихся получателей отправить за ближайшие interval секунд.
+
+    Остаток делится по кривой mailing.pacing между текущим моментом и концом
+    интервала; такт, захватывающий конец интервала, получает весь остаток.
+    """
+    if remaining <= 0:
+        return 0
+    now = now or timezone.now()
+    curve = CURVES[mailing.pacing]
+    t0 = progress(mailing, now)
+    t1 = progress(mailing, now + timedelta(seconds=interval))
+    done = curve(t0)
+    if t1 >= 1 or done >= 1:
+        return remaining
+    share = (curve(t1) - done) / (1 - done)
+    # Округление отбрасывает погрешность float (0.1 ** 2 * 1000 = 10.000000000000002)
+    return min(remaining, max(math.ceil(round(remaining * share, 6)), 1))
@@ -0,0 +1,152 @@
+"""
+Время этапов отправки рассылки и подключаемые обработчики (hooks) этих замеров.
+
+Отправка (services._send — и в send_mailings, и в задачах после «Запустить»)
+делится на этапы PHASES: выборка получателей из базы, сборка письма, SMTP,
+сохранение попыток и прочее (аренда, отчёт команды). Замер — один вызов
+perf_counter на этап письма; обработчики вызываются один раз в конце отправки
+(или части рассылки) с суммами по этапам, поэтому на каждое письмо не тратится
+ничего, кроме сложения.
+
+Обработчики — классы из настройки SEND_TIMING_HOOKS с методом
+on_send(mailing, recipients, timings) и объекты, временно добавленные через
+with timing_hook(hook) (так send_mailings --profile собирает сводку).
+Ошибка обработчика только пишется в лог.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PHASES = {
+    'fetch': 'Выборка получателей',
+    'build': 'Сборка письма',
+    'smtp': 'SMTP',
+    'save': 'Сохранение попыток',
+    'other': 'Прочее',
+}
+
+_extra_hooks = ContextVar('send_timing_hooks', default=())
+
+
+class PhaseTimer:
+    """
+    Суммы времени по этапам одной отправки.
+
+    lap(phase) относит к этапу время с предыдущей отметки; iterate() относит
+    к этапу fetch время получения каждого элемента и считает их в recipients.
+    """
+
+    def __init__(self):
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.recipients = 0
+        self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] += now - self.mark
+        self.mark = now
+
+    def iterate(self, iterable, phase='fetch'):
+        for item in iterable:
+            self.lap(phase)
+            self.recipients += 1
+            yield item
+        self.lap(phase)
+
+    def report(self, mailing):
+        """
+        Передаёт замеры обработчикам.
+        """
+        for hook in get_hooks():
+            try:
+                hook.on_send(mailing, self.recipients, dict(self.timings))
+            except Exception:
+                logger.exception('Ошибка обработчика замеров %r', hook)
+
+
+class LogTimingHook:
+    """
+    Пишет замеры каждой отправки в лог mailing.profiling одной JSON-строкой.
+    """
+
+    def on_send(self, mailing, recipients, timings):
+        logger.info(json.dumps({
+            'mailing': mailing.pk,
+            'recipients': recipients,
+            **{f'{phase}_ms': round(seconds * 1000, 2) for phase, seconds in timings.items()},
+        }))
+
+
+class MetricsTimingHook:
+    """
+    Прибавляет замеры к метрике mailing_send_phase_seconds_total (mailing.metrics).
+    """
+
+    def on_send(self, mailing, recipients, timings):
+        for phase, seconds in timings.items():
+            metrics.SEND_PHASE_SECONDS.inc(seconds, phase=phase)
+
+
+class SummaryHook:
+    """
+    Копит замеры всех отправок для сводной таблицы (send_mailings --profile).
+    """
+
+    def __init__(self):
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.recipients = 0
+        self.sends = 0
+
+    def on_send(self, mailing, recipients, timings):
+        self.sends += 1
+        self.recipients += recipients
+        for phase, seconds in timings.items():
+            self.timings[phase] += seconds
+
+    def table(self):
+        """
+        Строки таблицы: этап, всего секунд, доля, миллисекунд на 1000 получателей.
+        """
+        total = sum(self.timings.values())
+        lines = [f'{"Этап":<22}{"Всего, с":>10}{"Доля":>8}{"мс на 1000":>12}']
+        for phase, seconds in [*self.timings.items(), ('total', total)]:
+            share = seconds / total * 100 if total else 0
+            per_thousand = seconds * 1000 * 1000 / self.recipients if self.recipients else 0
+            title = PHASES.get(phase, 'Всего')
+            lines.append(f'{title:<22}{seconds:>10.3f}{share:>7.1f}%{per_thousand:>12.1f}')
+        lines.append(f'Отправок: {self.sends}, получателей: {self.recipients}')
+        return lines
+
+
+_hooks = {}
+
+
+def get_hooks():
+    """
+    Обработчики из настройки SEND_TIMING_HOOKS и добавленные через timing_hook().
+    """
+    paths = tuple(settings.SEND_TIMING_HOOKS)
+    if paths not in _hooks:
+        _hooks[paths] = [import_string(path)() for path in paths]
+    return [*_hooks[paths], *_extra_hooks.get()]
+
+
+@contextmanager
+def timing_hook(hook):
+    """
+    Добавляет обработчик замеров на время блока (в текущем контексте).
+    """
+    token = _extra_hooks.set((*_extra_hooks.get(), hook))
+    try:
+        yield hook
+    finally:
+        _extra_hooks.reset(token)
@@ -0,0 +1,126 @@
+"""
+Правила повторения рассылок: ежедневно, еженедельно или по выражению cron.
+
+Выражение cron — пять полей «минута час день месяц день_недели» (поддерживаются
+*, списки через запятую, диапазоны a-b и шаг /n; воскресенье — 0 или 7)
+или псевдонимы @hourly, @daily, @weekly, @monthly. Как в cron, если заданы
+и день месяца, и день недели, подходит любой из них.
+
+Время в правиле — местное (TIME_ZONE). При переходе на летнее время
+несуществующее время сдвигается вперёд на величину перехода (02:30 → 03:30),
+при переходе на зимнее повторяющееся время срабатывает один раз, в первый.
+
+Ближайший запуск хранится в Mailing.next_run_at и пересчитывается после
+каждого запуска (mailing.scheduling.run_recurring), поэтому правила не
+вычисляются при каждом поиске рассылок к отправке.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+
+# (название, минимум, максимум) для полей выражения
+FIELDS = [
+    ('минута', 0, 59),
+    ('час', 0, 23),
+    ('день', 1, 31),
+    ('месяц', 1, 12),
+    ('день недели', 0, 7),
+]
+
+# Дальше этого срока подходящих дат не ищем (29 февраля в заданный день недели повторяется за 28 лет)
+SEARCH_DAYS = 366 * 28
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        value_range, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(value) for value in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+        except ValueError:
+            raise ValidationError(f'Поле «{name}»: не удалось разобрать «{part}».') from None
+        if step < 1 or not low <= start <= end <= high:
+            raise ValidationError(f'Поле «{name}»: допустимы значения от {low} до {high}.')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """
+    Разобранное выражение cron. Ошибка в выражении — ValidationError.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = ALIASES.get(self.expression, self.expression).split()
+        if len(fields) != len(FIELDS):
+            raise ValidationError('Выражение cron состоит из пяти полей: минута час день месяц день_недели.')
+        parsed = [_parse_field(text, *spec) for text, spec in zip(fields, FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = (sorted(values) for values in parsed)
+        # В cron воскресенье — 0 или 7, в datetime.isoweekday() — 7
+        self.weekdays = {day or 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def __repr__(self):
+        return f'<Cron {self.expression}>'
+
+    def matches_date(self, date):
+        if date.month not in self.months:
+            return False
+        day = date.day in self.days
+        weekday = date.isoweekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment, until=None, tz=None):
+        """
+        Ближайший после moment момент запуска (aware datetime) или None, если его нет до until.
+        """
+        tz = tz or timezone.get_default_timezone()
+        date = moment.astimezone(tz).date()
+        last = until.astimezone(tz).date() if until else date + timedelta(days=SEARCH_DAYS)
+        while date <= last:
+            if self.matches_date(date):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = _aware(datetime(date.year, date.month, date.day, hour, minute), tz)
+                        # Во второй раз повторяющегося часа местное время меньше уже прошедшего
+                        if candidate > moment:
+                            return candidate if until is None or candidate <= until else None
+            date += timedelta(days=1)
+        return None
+
+
+def _aware(naive, tz):
+    """
+    Местное время naive в зоне tz: несуществующее сдвигается вперёд, повторяющееся — первое.
+    """
+    aware = naive.replace(tzinfo=tz, fold=0)
+    if aware.astimezone(dt_timezone.utc).astimezone(tz).replace(tzinfo=None) != naive:
+        # В переход на летнее время fold=0 даёт смещение до перехода: 02:30 → 03:30 по новому времени
+        return aware.astimezone(dt_timezone.utc).astimezone(tz)
+    return aware
+
+
+def validate_cron(value):
+    """
+    Валидатор поля Mailing.cron.
+    """
+    if value:
+        Cron(value)
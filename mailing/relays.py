@@ -0,0 +1,188 @@
+"""
+Пул SMTP-серверов для отправки рассылок (настройка EMAIL_RELAYS).
+
+Каждое письмо уходит через сервер, выбранный случайно с учётом веса (WEIGHT)
+среди исправных серверов, не исчерпавших лимит RATE писем в секунду.
+Счётчики лимитов и отметки о сбоях хранятся в общем кэше (Redis), поэтому
+лимиты соблюдаются всеми процессами отправки вместе. Сервер, с которым не
+удалось соединиться, авторизоваться или который оборвал сессию, выводится
+из ротации на RELAY_COOLDOWN секунд, а письмо повторяется через другой.
+Если исправных серверов не осталось, пробуются все: пул не хуже одного сервера.
+
+Соединение с сервером открывается один раз на отправку рассылки и
+переиспользуется для всех её писем. Время соединения и отправки письма
+учитывается в метриках (mailing.metrics).
+"""
+import random
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection
+
+from . import metrics
+
+
+def is_relay_error(error):
+    """
+    Ошибка относится к серверу (соединение, авторизация, временный отказ), а не к письму.
+
+    Отказ в адресе получателя и постоянный отказ в самом письме (5xx после DATA)
+    повторились бы на любом сервере. smtplib.SMTPException — подкласс OSError.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(error, smtplib.SMTPDataError) and error.smtp_code >= 500:
+        return False
+    return isinstance(error, OSError)
+
+
+class RelayUnavailable(Exception):
+    """
+    В пуле нет ни одного сервера, через который можно отправить письмо.
+    """
+
+
+class Relay:
+    """
+    Один SMTP-сервер пула с весом и лимитом писем в секунду (None — без лимита).
+    """
+
+    def __init__(self, name, host, port=25, user='', password='', use_tls=False, use_ssl=False,
+                 weight=1, rate=None, timeout=30):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.weight = weight
+        self.rate = rate
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f'<Relay {self.name} {self.host}:{self.port}>'
+
+    def get_connection(self):
+        return get_connection(
+            host=self.host, port=self.port, username=self.user or '', password=self.password or '',
+            use_tls=self.use_tls, use_ssl=self.use_ssl, timeout=self.timeout,
+        )
+
+    @property
+    def down_key(self):
+        return f'relay:down:{self.name}'
+
+    def mark_down(self, reason):
+        cache.set(self.down_key, reason, settings.RELAY_COOLDOWN)
+
+    def acquire(self, now=None):
+        """
+        Занимает место в лимите текущей секунды. False, если лимит исчерпан.
+        """
+        if not self.rate:
+            return True
+        key = f'relay:rate:{self.name}:{int(now or time.time())}'
+        cache.add(key, 0, 2)
+        return cache.incr(key) <= self.rate
+
+
+def load_relays():
+    """
+    Серверы из настройки EMAIL_RELAYS (ключи — параметры Relay в верхнем регистре).
+    """
+    return [
+        Relay(**{key.lower(): value for key, value in options.items()})
+        for options in settings.EMAIL_RELAYS
+    ]
+
+
+class RelayPool:
+    """
+    Распределение писем по серверам пула с открытыми соединениями.
+
+    Использование: pool.send(email) для каждого письма, затем pool.close().
+    last_relay — сервер последней попытки (в том числе неудачной), retried —
+    серверы, после сбоя которых последнее письмо повторялось через другой.
+    """
+
+    def __init__(self, relays=None):
+        self.relays = load_relays() if relays is None else relays
+        if not self.relays:
+            raise RelayUnavailable('Не настроены SMTP-серверы (EMAIL_RELAYS)')
+        self.connections = {}
+        self.last_relay = None
+        self.retried = []
+
+    def choose(self, exclude=()):
+        """
+        Сервер для следующего письма; ждёт следующей секунды, если все упёрлись в лимит.
+
+        None, если кроме exclude серверов нет.
+        """
+        candidates = [relay for relay in self.relays if relay.name not in exclude]
+        down = cache.get_many([relay.down_key for relay in candidates])
+        healthy = [relay for relay in candidates if relay.down_key not in down]
+        candidates = healthy or candidates
+        while candidates:
+            waiting = list(candidates)
+            while waiting:
+                relay = random.choices(waiting, weights=[relay.weight for relay in waiting])[0]
+                if relay.acquire():
+                    return relay
+                waiting.remove(relay)
+            time.sleep(1 - time.time() % 1)
+        return None
+
+    def connection(self, relay):
+        if relay.name not in self.connections:
+            connection = relay.get_connection()
+            with metrics.SMTP_CONNECT_SECONDS.time(relay=relay.name):
+                connection.open()
+            self.connections[relay.name] = connection
+        return self.connections[relay.name]
+
+    def discard(self, relay):
+        connection = self.connections.pop(relay.name, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def send(self, email):
+        """
+        Отправляет письмо (EmailMessage) через сервер пула, при сбое сервера — через следующий.
+
+        Возвращает использованный Relay. Ошибки самого письма (см. is_relay_error)
+        пробрасываются сразу; если не удалось ни через один сервер,
+        пробрасывается последняя ошибка.
+        """
+        self.last_relay = None
+        self.retried = []
+        tried = set()
+        while True:
+            relay = self.choose(exclude=tried)
+            if relay is None:
+                raise RelayUnavailable('Ни один SMTP-сервер не принял письмо')
+            self.last_relay = relay
+            tried.add(relay.name)
+            try:
+                email.connection = self.connection(relay)
+                with metrics.SMTP_SEND_SECONDS.time(relay=relay.name):
+                    email.send(fail_silently=False)
+                return relay
+            except Exception as e:
+                if not is_relay_error(e):
+                    raise
+                self.discard(relay)
+                relay.mark_down(str(e))
+                if len(tried) == len(self.relays):
+                    raise
+                self.retried.append(relay.name)
+
+    def close(self):
+        for relay in self.relays:
+            self.discard(relay)
@@ -0,0 +1,262 @@
+"""
+Очереди отправки рассылок по приоритетам.
+
+Рассылка отправляется задачей send_mailing_task частями: после каждой части
+задача ставит продолжение в конец своей очереди. Поэтому одновременно идущие
+рассылки чередуются, и рассылка на миллион адресов не занимает воркер целиком.
+
+Очередь (MAILING_QUEUES) выбирается по Mailing.priority: срочные рассылки и
+рассылки с аудиторией не больше SMALL_MAILING_SIZE идут в очередь high,
+массовые — в bulk, остальные — в normal. На каждую очередь запускается
+отдельный воркер со своей concurrency, поэтому срочная рассылка начинается
+через секунды, даже пока идёт массовая.
+
+Деление между владельцами: размер части (SEND_CHUNK_SIZE) делится на число
+рассылок владельца, идущих в той же очереди, поэтому владелец с десятью
+рассылками получает ту же долю очереди, что и владелец с одной.
+
+Рассылка с Mailing.pacing отправляется не сразу, а тактами по кривой
+(см. mailing.pacing).
+
+Цепочка задач рассылки держит её аренду (mailing.leases): повторный запуск
+той же рассылки, пока идёт отправка, сразу завершается.
+
+Повторяющиеся рассылки (Mailing.recurrence) запускает run_recurring по
+сохранённому next_run_at (см. mailing.recurrence).
+
+Глубина очередей и время ожидания задачи в очереди — queue_stats().
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from kombu.exceptions import ChannelError
+
+from .leases import Lease, LeaseLost
+from .models import Mailing
+from .pacing import paced_quota
+from .services import send_mailing_chunk
+
+logger = logging.getLogger(__name__)
+
+# Часть не меньше этого числа получателей, сколько бы рассылок ни шло у владельца
+MIN_CHUNK_SIZE = 50
+
+# Счётчики живут дольше самой длинной рассылки; утерянная задача перестаёт влиять через сутки
+ACTIVE_TIMEOUT = 60 * 60 * 24
+
+
+def queue_for(mailing):
+    """
+    Имя очереди Celery для рассылки.
+    """
+    queues = settings.MAILING_QUEUES
+    if mailing.priority == 'bulk':
+        return queues['bulk']
+    if mailing.priority == 'high':
+        return queues['high']
+    # Маленькие рассылки не ждут за большими: число получателей считается с ограничением
+    audience = mailing.audience().filter(is_suppressed=False).order_by()
+    if audience[:settings.SMALL_MAILING_SIZE + 1].count() <= settings.SMALL_MAILING_SIZE:
+        return queues['high']
+    return queues['normal']
+
+
+def _active_key(queue, owner_id):
+    return f'send:active:{queue}:{owner_id}'
+
+
+def _enqueue(mailing_id, queue, after=0, countdown=0, **pace):
+    from .tasks import send_mailing_task
+
+    send_mailing_task.apply_async(
+        (mailing_id,),
+        {'after': after, 'queue': queue, 'enqueued_at': time.time() + countdown, **pace},
+        queue=queue,
+        countdown=countdown or None,
+    )
+
+
+def dispatch(mailing):
+    """
+    Ставит отправку рассылки в очередь её приоритета после фиксации транзакции.
+
+    Возвращает имя очереди.
+    """
+    queue = queue_for(mailing)
+    mailing_id, owner_id = mailing.pk, mailing.owner_id
+
+    def start():
+        # Счётчик активных отправок — вместе с постановкой в очередь: после отката он не растёт
+        key = _active_key(queue, owner_id)
+        cache.add(key, 0, ACTIVE_TIMEOUT)
+        cache.incr(key)
+        _enqueue(mailing_id, queue)
+
+    transaction.on_commit(start)
+    return queue
+
+
+def run_recurring(now=None, start=None):
+    """
+    Запускает повторяющиеся рассылки, чей next_run_at наступил, и переносит next_run_at.
+
+    Строки блокируются с SKIP LOCKED, а next_run_at сохраняется до запуска,
+    поэтому параллельные вызовы не запускают рассылку дважды; пропущенные
+    (например, пока планировщик стоял) запуски схлопываются в один.
+    start(mailing) запускает отправку, по умолчанию — dispatch.
+    Возвращает запущенные рассылки.
+    """
+    now = now or timezone.now()
+    start = start or dispatch
+    with transaction.atomic():
+        mailings = list(
+            Mailing.objects.due_runs(now).select_related('message', 'segment')
+            .select_for_update(skip_locked=True, of=('self',))
+        )
+        for mailing in mailings:
+            mailing.next_run_at = mailing.get_next_run(now)
+        Mailing.objects.bulk_update(mailings, ['next_run_at'])
+    for mailing in mailings:
+        start(mailing)
+    return mailings
+
+
+def _finish(mailing, queue):
+    key = _active_key(queue, mailing.owner_id)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def chunk_size(queue, owner_id):
+    """
+    Размер следующей части: SEND_CHUNK_SIZE, делённый на число идущих рассылок владельца в очереди.
+    """
+    active = cache.get(_active_key(queue, owner_id)) or 1
+    return max(settings.SEND_CHUNK_SIZE // active, MIN_CHUNK_SIZE)
+
+
+def note_wait(queue, seconds):
+    """
+    Учитывает время, которое задача провела в очереди.
+    """
+    prefix = f'queue:wait:{queue}'
+    cache.set(f'{prefix}:last', seconds, None)
+    for name, delta in (('count', 1), ('total_ms', int(seconds * 1000))):
+        cache.add(f'{prefix}:{name}', 0, None)
+        cache.incr(f'{prefix}:{name}', delta)
+
+
+def send_next_chunk(mailing_id, after=0, queue=None, enqueued_at=None, tick_end=None, quota=None, lease=None):
+    """
+    Отправляет очередную часть рассылки и ставит продолжение в конец очереди.
+
+    Первая часть берёт аренду рассылки (mailing.leases) и передаёт её токен lease
+    продолжениям; если аренду держит другая цепочка (повторный запуск), задача
+    ничего не отправляет. После каждой части аренда продлевается на время ожидания
+    в очереди и запоминает курсор, поэтому повторно доставленное продолжение
+    не отправляет письма второй раз.
+
+    Для рассылки с pacing в начале каждого такта (PACING_INTERVAL секунд)
+    считается квота (mailing.pacing.paced_quota); tick_end и остаток квоты quota
+    передаются продолжению. Когда квота такта исчерпана, продолжение
+    откладывается до начала следующего такта.
+    Отключённая, удалённая или вышедшая за интервал рассылка прекращается.
+    Возвращает (успешных, неуспешных) по этой части.
+    """
+    if enqueued_at is not None:
+        note_wait(queue, max(time.time() - enqueued_at, 0))
+    mailing = Mailing.objects.select_related('message', 'segment').filter(pk=mailing_id).first()
+    if mailing is None:
+        return 0, 0
+    continuation = lease is not None
+    lease = Lease(mailing.pk, lease)
+    if not mailing.is_active or mailing.current_status != 'Запущена':
+        lease.release()
+        _finish(mailing, queue)
+        return 0, 0
+    # Продолжение не берёт аренду заново: если её сняли или перехватили, цепочка закончена
+    if not lease.acquire(resume=continuation):
+        logger.info('Рассылка %s уже отправляется другой задачей, повторный запуск пропущен', mailing.pk)
+        _finish(mailing, queue)
+        return 0, 0
+    # Продолжение доставлено повторно: уже отправленное цепочкой не повторяется
+    after = max(after, lease.cursor)
+
+    limit = chunk_size(queue, mailing.owner_id)
+    if mailing.pacing:
+        if tick_end is None or time.time() >= tick_end:
+            remaining = mailing.audience().filter(is_suppressed=False, pk__gt=after).count()
+            quota = paced_quota(mailing, remaining, settings.PACING_INTERVAL)
+            tick_end = time.time() + settings.PACING_INTERVAL
+        if not quota:
+            lease.release()
+            _finish(mailing, queue)
+            return 0, 0
+        limit = min(limit, quota)
+
+    try:
+        success_count, fail_count, last_pk = send_mailing_chunk(mailing, after, limit, lease)
+    except LeaseLost:
+        logger.warning('Аренда рассылки %s перехвачена другой задачей, отправка прекращена', mailing.pk)
+        _finish(mailing, queue)
+        return 0, 0
+    if last_pk is None:
+        lease.release()
+        _finish(mailing, queue)
+    elif not mailing.pacing:
+        lease.renew(cursor=last_pk)
+        _enqueue(mailing.pk, queue, after=last_pk, lease=lease.token)
+    else:
+        quota -= success_count + fail_count
+        # Отставание догоняется сразу в пределах квоты такта, иначе ждём следующего такта
+        countdown = 0 if quota > 0 else max(tick_end - time.time(), 0)
+        # Аренда не должна истечь, пока продолжение ждёт следующего такта
+        lease.renew(countdown + lease.timeout, cursor=last_pk)
+        _enqueue(
+            mailing.pk, queue, after=last_pk, countdown=countdown, tick_end=tick_end, quota=quota, lease=lease.token,
+        )
+    return success_count, fail_count
+
+
+def queue_depth(queue):
+    """
+    Число задач в очереди брокера (None, если брокер недоступен).
+    """
+    from config.celery import app
+
+    try:
+        with app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(queue, passive=True).message_count
+    except ChannelError:
+        # Брокер удаляет пустую очередь
+        return 0
+    except Exception:
+        logger.warning('Не удалось получить глубину очереди %s', queue, exc_info=True)
+        return None
+
+
+def queue_stats():
+    """
+    Глубина и время ожидания по каждому приоритету:
+    {priority: {'queue', 'depth', 'last_wait', 'avg_wait', 'tasks'}}; время — в секундах.
+    """
+    stats = {}
+    for priority, queue in settings.MAILING_QUEUES.items():
+        prefix = f'queue:wait:{queue}'
+        values = cache.get_many([f'{prefix}:last', f'{prefix}:count', f'{prefix}:total_ms'])
+        count = values.get(f'{prefix}:count') or 0
+        stats[priority] = {
+            'queue': queue,
+            'depth': queue_depth(queue),
+            'last_wait': values.get(f'{prefix}:last'),
+            'avg_wait': values.get(f'{prefix}:total_ms', 0) / count / 1000 if count else None,
+            'tasks': count,
+        }
+    return stats
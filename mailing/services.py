@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+
+from . import cache, metrics
+from .bounces import MAILING_HEADER
+from .leases import Lease, LeaseLost
+from .profiling import PhaseTimer
+from .relays import RelayPool
+from .tracking import render_tracked
+from .models import Attempt, Mailing, UserCounters
+
+ATTEMPT_BATCH_SIZE = 500
+
+
+def save_attempts(mailing, attempts):
+    """
+    Сохраняет попытки одной пачкой и обновляет счётчик и версию кэша списков владельца рассылки.
+
+    bulk_create не шлёт post_save, поэтому это делается явно.
+    """
+    if not attempts:
+        return
+    with metrics.ATTEMPT_FLUSH_SECONDS.time():
+        Attempt.objects.bulk_create(attempts, batch_size=ATTEMPT_BATCH_SIZE)
+    UserCounters.add(mailing.owner_id, attempt_count=len(attempts))
+    cache.bump(mailing.owner_id, Attempt)
+
+
+def save_snapshot(mailing, recipients):
+    """
+    Добавляет получателей в зафиксированный состав аудитории рассылки.
+
+    Повторная фиксация тех же получателей (повторный запуск) не создаёт дублей.
+    """
+    if not recipients:
+        return
+    through = Mailing.audience_snapshot.through
+    through.objects.bulk_create(
+        [through(mailing_id=mailing.pk, recipient_id=recipient.pk) for recipient in recipients],
+        batch_size=ATTEMPT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def _send(mailing, recipients, on_result=None, lease=None):
+    """
+    Отправляет сообщение рассылки получателям из queryset recipients.
+
+    Результаты писем учитываются в метриках (mailing.metrics), время этапов
+    отправки передаётся обработчикам замеров (mailing.profiling).
+    Перед каждым письмом продлевается аренда lease (см. mailing.leases); если
+    она потеряна, отправка прекращается и после сохранения уже сделанных
+    попыток выбрасывается LeaseLost.
+    Возвращает (успешных, неуспешных, последний получатель или None).
+    """
+    message = mailing.message
+    snapshot = bool(mailing.segment_id and mailing.snapshot_audience)
+    attempts = []
+    success_count = fail_count = 0
+    recipient = None
+    lost = False
+    pool = RelayPool()
+    timer = PhaseTimer()
+
+    # Замеры и метрики уходят и при ошибке посреди отправки: иначе сбойная отправка в них не видна
+    try:
+        try:
+            for recipient in timer.iterate(recipients.iterator(chunk_size=ATTEMPT_BATCH_SIZE)):
+                if lease is not None and not lease.heartbeat():
+                    lost = True
+                    break
+                timer.lap('other')
+                body, html_message = message.body, None
+                if mailing.track_engagement:
+                    body, html_message = render_tracked(message.body, mailing, recipient)
+                email = EmailMultiAlternatives(
+                    message.subject,
+                    body,
+                    settings.EMAIL_HOST_USER,
+                    [recipient.email],
+                    headers={MAILING_HEADER: str(mailing.pk)},
+                )
+                if html_message:
+                    email.attach_alternative(html_message, 'text/html')
+                timer.lap('build')
+                try:
+                    pool.send(email)
+                    status, server_response = 'Успешно', 'OK'
+                    success_count += 1
+                except Exception as e:
+                    status, server_response = 'Не успешно', str(e)
+                    fail_count += 1
+                timer.lap('smtp')
+                relay = pool.last_relay.name if pool.last_relay else ''
+                counter = metrics.EMAILS_SENT if status == 'Успешно' else metrics.EMAILS_FAILED
+                counter.inc(mailing=mailing.pk, relay=relay)
+                for retried in pool.retried:
+                    metrics.RELAY_RETRIES.inc(mailing=mailing.pk, relay=retried)
+                attempt = Attempt(
+                    mailing=mailing, recipient=recipient, status=status, server_response=server_response, relay=relay,
+                )
+
+                attempts.append(attempt)
+                if on_result:
+                    on_result(recipient, attempt)
+                timer.lap('other')
+
+                if len(attempts) >= ATTEMPT_BATCH_SIZE:
+                    if snapshot:
+                        save_snapshot(mailing, [attempt.recipient for attempt in attempts])
+                    save_attempts(mailing, attempts)
+                    attempts = []
+                    timer.lap('save')
+        finally:
+            pool.close()
+            timer.lap('smtp')
+
+        if snapshot:
+            save_snapshot(mailing, [attempt.recipient for attempt in attempts])
+        save_attempts(mailing, attempts)
+        timer.lap('save')
+    finally:
+        timer.report(mailing)
+        metrics.flush()
+    if lost:
+        raise LeaseLost(f'Аренда рассылки {mailing.pk} перехвачена, отправка прекращена')
+    return success_count, fail_count, recipient
+
+
+def send_mailing(mailing, on_result=None):
+    """
+    Отправляет сообщение рассылки всей её аудитории (см. Mailing.audience).
+
+    Аудитория читается потоково; попытки копятся в памяти и сохраняются пачками
+    по ATTEMPT_BATCH_SIZE. Для рассылки по сегменту с snapshot_audience теми же
+    пачками фиксируется состав аудитории.
+    Если передан on_result, он вызывается как on_result(recipient, attempt)
+    после каждой отправки.
+    При track_engagement каждому получателю уходит своя версия письма со
+    ссылками отслеживания и HTML-частью с пикселем открытия (см. mailing.tracking).
+    Адреса с постоянными возвратами (is_suppressed) пропускаются, а в письмо
+    добавляется заголовок X-Mailing-ID для сопоставления возвратов (см. mailing.bounces).
+    Письма распределяются по SMTP-серверам пула (см. mailing.relays), сервер
+    записывается в попытку.
+    На время отправки берётся аренда рассылки (см. mailing.leases): если рассылку
+    уже отправляет другой процесс, выбрасывается LeaseBusy.
+
+    Возвращает кортеж (успешных, неуспешных).
+    """
+    with Lease(mailing.pk) as lease:
+        success_count, fail_count, _ = _send(
+            mailing, mailing.audience().filter(is_suppressed=False), on_result, lease,
+        )
+    return success_count, fail_count
+
+
+def send_mailing_chunk(mailing, after, limit, lease=None):
+    """
+    Отправляет следующие limit получателей аудитории с pk больше after (как send_mailing).
+
+    Аудитория обходится по возрастанию pk, следующая часть начинается после
+    последнего отправленного получателя. Аренду lease берёт и продлевает
+    вызывающий (см. mailing.scheduling). Возвращает
+    (успешных, неуспешных, pk последнего получателя или None, если аудитория закончилась).
+    """
+    recipients = mailing.audience().filter(is_suppressed=False, pk__gt=after).order_by('pk')[:limit]
+    success_count, fail_count, last = _send(mailing, recipients, lease=lease)
+    done = success_count + fail_count < limit
+    return success_count, fail_count, None if done else last.pk
+
+
+def reject_mailing(mailing, reason):
+    """
+    Записывает неуспешную попытку с причиной reason для каждого получателя рассылки.
+    """
+    attempts = []
+    for recipient in mailing.audience().filter(is_suppressed=False).iterator(chunk_size=ATTEMPT_BATCH_SIZE):
+        attempts.append(Attempt(mailing=mailing, recipient=recipient, status='Не успешно', server_response=reason))
+        if len(attempts) >= ATTEMPT_BATCH_SIZE:
+            save_attempts(mailing, attempts)
+            attempts = []
+    save_attempts(mailing, attempts)
@@ -0,0 +1,161 @@
+import functools
+import re
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cache
+from .models import Attempt, Mailing, Message, Recipient, UserCounters
+
+COUNTER_FIELDS = {
+    Message: 'message_count',
+    Recipient: 'recipient_count',
+    Mailing: 'mailing_count',
+}
+
+
+def bump_on_commit(owner_id, model):
+    """
+    Увеличивает версию списков владельца после фиксации транзакции: иначе
+    параллельный запрос успеет закэшировать страницу со старыми данными под новой версией.
+    """
+    transaction.on_commit(functools.partial(cache.bump, owner_id, model))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Recipient)
+@receiver(post_save, sender=Mailing)
+def count_created_object(sender, instance, created, **kwargs):
+    """
+    Увеличивает счётчик владельца при создании сообщения, получателя или рассылки.
+    """
+    if created:
+        UserCounters.add(instance.owner_id, **{COUNTER_FIELDS[sender]: 1})
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Recipient)
+@receiver(post_delete, sender=Mailing)
+def count_deleted_object(sender, instance, **kwargs):
+    """
+    Уменьшает счётчик владельца при удалении сообщения, получателя или рассылки.
+
+    Помеченные удалёнными объекты уже вычтены в mailing.deletion.soft_delete.
+    """
+    if getattr(instance, 'is_deleted', False):
+        return
+    UserCounters.add(instance.owner_id, **{COUNTER_FIELDS[sender]: -1})
+
+
+@receiver(post_save, sender=Attempt)
+def count_created_attempt(sender, instance, created, **kwargs):
+    """
+    Увеличивает счётчик попыток владельца рассылки.
+
+    Пакетные вставки (bulk_create) сигналов не шлют и вызывают UserCounters.add сами.
+    """
+    if created:
+        UserCounters.add(instance.mailing.owner_id, attempt_count=1)
+
+
+@receiver(pre_delete, sender=Mailing)
+def uncount_mailing_attempts(sender, instance, **kwargs):
+    """
+    Вычитает попытки рассылки до каскадного удаления и инвалидирует списки попыток.
+
+    На Attempt нет post_delete-обработчика, поэтому каскад удаляет попытки
+    одним DELETE, не загружая их в память.
+    Для помеченных удалёнными рассылок это уже сделал soft_delete.
+    """
+    if instance.is_deleted:
+        return
+    attempt_count = Attempt.objects.filter(mailing=instance, recipient__is_deleted=False).count()
+    UserCounters.add(instance.owner_id, attempt_count=-attempt_count)
+    bump_on_commit(instance.owner_id, Attempt)
+
+
+@receiver(pre_delete, sender=Recipient)
+def uncount_recipient_attempts(sender, instance, **kwargs):
+    """
+    Вычитает попытки по получателю у владельцев соответствующих рассылок
+    и инвалидирует их списки попыток.
+    Для помеченных удалёнными получателей это уже сделал soft_delete.
+    """
+    if instance.is_deleted:
+        return
+    per_owner = (
+        Attempt.objects.filter(recipient=instance, mailing__is_deleted=False)
+        .values('mailing__owner')
+        .annotate(total=Count('id'))
+    )
+    for row in per_owner:
+        UserCounters.add(row['mailing__owner'], attempt_count=-row['total'])
+        bump_on_commit(row['mailing__owner'], Attempt)
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Recipient)
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Recipient)
+@receiver(post_delete, sender=Mailing)
+def bump_list_cache(sender, instance, **kwargs):
+    """
+    Инвалидирует закэшированные списки владельца после изменения объекта.
+    """
+    bump_on_commit(instance.owner_id, sender)
+
+
+@receiver(post_save, sender=Attempt)
+def bump_attempt_list_cache(sender, instance, **kwargs):
+    """
+    Инвалидирует закэшированные списки попыток владельца рассылки.
+    """
+    bump_on_commit(instance.mailing.owner_id, Attempt)
+
+
+@functools.lru_cache(maxsize=256)
+def _like_regex(pattern, escape):
+    parts = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == escape:
+            parts.append(re.escape(next(chars, '')))
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts), re.DOTALL | re.IGNORECASE)
+
+
+def _sqlite_like(pattern, value, escape=None):
+    if pattern is None or value is None:
+        return None
+    return _like_regex(pattern, escape).fullmatch(str(value)) is not None
+
+
+def _sqlite_case(method):
+    def convert(value):
+        return getattr(value, method)() if isinstance(value, str) else value
+    return convert
+
+
+@receiver(connection_created)
+def unicode_case_for_sqlite(sender, connection, **kwargs):
+    """
+    В SQLite UPPER, LOWER и LIKE без учёта регистра работают только с ASCII.
+
+    Заменяет их версиями для Юникода, чтобы поиск (SearchQuerySet.search,
+    поиск в админке) находил кириллицу и без PostgreSQL.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name in ('upper', 'lower'):
+        connection.connection.create_function(name, 1, _sqlite_case(name), deterministic=True)
+    connection.connection.create_function('like', 2, _sqlite_like, deterministic=True)
+    connection.connection.create_function('like', 3, _sqlite_like, deterministic=True)
@@ -1,7 +1,74 @@
 from celery import shared_task
+from django.apps import apps
 from time import sleep
 
+from .deletion import purge, purge_deleted
+from .scheduling import run_recurring, send_next_chunk
+from .tracking import consume_events
+from .imports import run_import
+from .models import Mailing, RecipientImport
+
+
 @shared_task
 def send_test_email():
     sleep(5)
     print("Письмо отправлено (ну типа)")
+
+
+@shared_task
+def import_recipients_task(import_id):
+    """
+    Фоновая обработка загруженного файла с получателями (см. mailing.imports).
+    """
+    run_import(RecipientImport.objects.select_related('owner').get(pk=import_id))
+
+
+@shared_task
+def purge_object_task(model_label, pk):
+    """
+    Окончательное удаление помеченной рассылки или получателя (см. mailing.deletion).
+    """
+    model = apps.get_model(model_label)
+    obj = model.all_objects.filter(pk=pk, is_deleted=True).first()
+    if obj is not None:
+        purge(obj)
+
+
+@shared_task
+def purge_deleted_task():
+    """
+    Периодическая досборка помеченных объектов, чьи задачи на удаление не выполнились.
+    """
+    purge_deleted()
+
+
+@shared_task
+def sync_mailing_status_task():
+    """
+    Периодическое сохранение смены статусов рассылок несколькими UPDATE (см. MailingQuerySet.sync_status).
+    """
+    return Mailing.objects.sync_status()
+
+
+@shared_task
+def consume_tracking_events_task():
+    """
+    Запись накопленных событий открытий и переходов пачками (см. mailing.tracking).
+    """
+    return consume_events()
+
+
+@shared_task
+def send_mailing_task(mailing_id, after=0, queue=None, enqueued_at=None, tick_end=None, quota=None, lease=None):
+    """
+    Отправка очередной части рассылки в очереди её приоритета (см. mailing.scheduling).
+    """
+    return send_next_chunk(mailing_id, after, queue, enqueued_at, tick_end, quota, lease)
+
+
+@shared_task
+def run_recurring_mailings_task():
+    """
+    Периодический запуск повторяющихся рассылок, чей запуск наступил (см. mailing.scheduling.run_recurring).
+    """
+    return len(run_recurring())
@@ -1,2 +1,2074 @@
+import csv
+import io
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, models
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config.cache import TwoTierCache
+from config.testing import LocalInvalidationBus, QueryBudgetMixin, redis_available
+
+from . import audience, imports, metrics
+from .admin_tools import EstimatedCountPaginator
+from .bounces import iter_mbox, parse_bounce, process_mailbox
+from .deletion import purge_deleted, soft_delete
+from .forms import MailingForm
+from .imports import import_recipients, run_import
+from .leases import Lease, LeaseBusy, LeaseLost
+from .pacing import paced_quota
+from .profiling import PHASES, SummaryHook, timing_hook
+from .recurrence import Cron
+from .relays import Relay
+from .scheduling import chunk_size, dispatch, queue_for, run_recurring, send_next_chunk
+from .models import (
+    Attempt, BounceSource, Mailing, MailingEngagement, MailingLease, Message, Recipient, RecipientImport, Segment, Tag,
+    TrackingEvent, UserCounters,
+)
+from .services import send_mailing, send_mailing_chunk
+from .tracking import MemoryBuffer, click_url, consume_events, open_url, render_tracked
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN-планы проверяются только на PostgreSQL')
+class QueryPlanTests(TestCase):
+    """
+    Регрессионные тесты планов запросов.
+
+    На засеянных данных строит EXPLAIN для ключевых запросов из mailing/views.py
+    и send_mailings при выключенном enable_seqscan. Если для запроса нет
+    подходящего индекса, планировщик всё равно выберет Seq Scan — тест упадёт.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.users = [User.objects.create_user(email=f'user{i}@example.com', password='pass') for i in range(3)]
+        cls.user = cls.users[0]
+
+        messages = Message.objects.bulk_create(
+            Message(subject=f'Тема {i}', body='Текст', owner=cls.users[i % 3]) for i in range(30)
+        )
+        recipients = Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=cls.users[i % 3])
+            for i in range(300)
+        )
+        mailings = Mailing.objects.bulk_create(
+            Mailing(
+                start_time=now - timedelta(days=i % 5),
+                end_time=now + timedelta(days=(i % 3) - 1),
+                is_active=bool(i % 4),
+                message=messages[i],
+                owner=messages[i].owner,
+            )
+            for i in range(30)
+        )
+        Mailing.recipients.through.objects.bulk_create(
+            Mailing.recipients.through(mailing_id=mailing.pk, recipient_id=recipient.pk)
+            for mailing in mailings
+            for recipient in recipients[:50]
+        )
+        Attempt.objects.bulk_create(
+            Attempt(
+                mailing=mailing,
+                recipient=recipient,
+                status='Успешно' if recipient.pk % 2 else 'Не успешно',
+                server_response='OK',
+            )
+            for mailing in mailings
+            for recipient in recipients[:50]
+        )
+        cls.mailing = mailings[0]
+        cls.recipient = recipients[0]
+
+        with connection.cursor() as cursor:
+            for model in (Message, Recipient, Mailing, Mailing.recipients.through, Attempt):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def assertNoSeqScan(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan, msg=f'\n{queryset.query}\n{plan}')
+
+    # -------- OwnerOrManagerMixin / HomeView --------
+
+    def test_owner_message_list(self):
+        self.assertNoSeqScan(Message.objects.filter(owner=self.user))
+
+    def test_owner_recipient_list(self):
+        self.assertNoSeqScan(Recipient.objects.filter(owner=self.user))
+
+    def test_owner_mailing_list(self):
+        self.assertNoSeqScan(Mailing.objects.filter(owner=self.user))
+
+    def test_owner_attempt_list(self):
+        self.assertNoSeqScan(Attempt.objects.filter(mailing__owner=self.user))
+
+    def test_owner_keyset_pages(self):
+        for model in (Message, Recipient, Mailing):
+            with self.subTest(model=model.__name__):
+                self.assertNoSeqScan(model.objects.filter(owner=self.user, pk__lt=10 ** 6).order_by('-pk')[:51])
+
+    # -------- RecipientSearchView --------
+
+    def test_recipient_prefix_search(self):
+        self.assertNoSeqScan(Recipient.objects.filter(owner=self.user).search_prefix('r29').order_by('-pk')[:21])
+
+    # -------- SearchQuerySet.search (списки, админка) --------
+
+    def test_trigram_search(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm не установлен, триграммные индексы не создаются')
+        # Без фильтра по владельцу (как в админке) подходят только триграммные индексы
+        self.assertNoSeqScan(Recipient.objects.search('ample'))
+        self.assertNoSeqScan(Message.objects.search('ема 1'))
+
+    # -------- MailingStatsView --------
+
+    def test_last_attempt_per_recipient(self):
+        self.assertNoSeqScan(
+            Attempt.objects.filter(mailing=self.mailing, recipient=self.recipient).order_by('-attempt_time')[:1]
+        )
+
+    def test_attempt_status_count(self):
+        self.assertNoSeqScan(Attempt.objects.filter(mailing=self.mailing, status='Успешно'))
+
+    def test_mailing_recipients(self):
+        self.assertNoSeqScan(self.mailing.recipients.all())
+
+    # -------- send_mailings --------
+
+    def test_due_mailings(self):
+        self.assertNoSeqScan(Mailing.objects.due().select_related('message'))
+
+    def test_due_recurring_runs(self):
+        self.assertNoSeqScan(Mailing.objects.due_runs().select_related('message'))
+
+
+class UserCountersTests(TestCase):
+    """
+    Счётчики главной страницы совпадают с COUNT(*) после создания, пакетной отправки и удаления.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        self.recipients = [
+            Recipient.objects.create(email=f'c{i}@example.com', full_name=f'Получатель {i}', owner=self.user)
+            for i in range(3)
+        ]
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(hours=1),
+            message=self.message,
+            owner=self.user,
+        )
+        self.mailing.recipients.set(self.recipients)
+
+    def assertCountersAccurate(self):
+        counters = UserCounters.objects.get(user=self.user)
+        self.assertEqual(counters.message_count, Message.objects.filter(owner=self.user).count())
+        self.assertEqual(counters.recipient_count, Recipient.objects.filter(owner=self.user).count())
+        self.assertEqual(counters.mailing_count, Mailing.objects.filter(owner=self.user).count())
+        self.assertEqual(counters.attempt_count, Attempt.objects.visible().filter(mailing__owner=self.user).count())
+
+    def test_counters_follow_creates_bulk_sends_and_deletes(self):
+        self.assertCountersAccurate()
+
+        send_mailing(self.mailing)
+        self.assertEqual(UserCounters.objects.get(user=self.user).attempt_count, 3)
+        self.assertCountersAccurate()
+
+        self.recipients[0].delete()
+        self.assertCountersAccurate()
+
+        self.message.delete()
+        self.assertCountersAccurate()
+        self.assertEqual(UserCounters.objects.get(user=self.user).attempt_count, 0)
+
+    def test_soft_delete_uncounts_once(self):
+        send_mailing(self.mailing)
+
+        self.assertTrue(soft_delete(self.recipients[0]))
+        self.assertFalse(soft_delete(self.recipients[0]))
+        self.assertCountersAccurate()
+        self.assertEqual(self.mailing.recipients.count(), 2)
+
+        soft_delete(self.mailing)
+        self.assertCountersAccurate()
+        self.assertFalse(Mailing.objects.exists())
+        # История остаётся до фонового удаления
+        self.assertEqual(Attempt.objects.count(), 3)
+
+        self.assertEqual(purge_deleted(batch_size=2), 2)
+        self.assertCountersAccurate()
+        self.assertFalse(Attempt.objects.exists())
+        self.assertFalse(Mailing.all_objects.exists())
+        self.assertEqual(Recipient.all_objects.count(), 2)
+
+    def test_home_view_reads_counters(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('mailing:home'))
+        self.assertEqual(response.context['recipient_count'], 3)
+        self.assertEqual(response.context['mailing_count'], 1)
+
+
+class ExportTests(TestCase):
+    """
+    Потоковые выгрузки попыток и отчёта по рассылкам: форматы, фильтры и видимость по владельцу.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='owner@example.com', password='pass')
+        cls.other = User.objects.create_user(email='other@example.com', password='pass')
+        cls.manager = User.objects.create_user(email='manager@example.com', password='pass')
+        cls.manager.groups.add(Group.objects.create(name='Менеджеры'))
+
+        now = timezone.now()
+        cls.mailings = {}
+        cls.attempts = {}
+        for owner in (cls.user, cls.other):
+            message = Message.objects.create(subject=f'Тема {owner.email}', body='Текст', owner=owner)
+            recipient = Recipient.objects.create(email=f'to-{owner.email}', owner=owner)
+            mailing = Mailing.objects.create(
+                start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=owner,
+            )
+            cls.mailings[owner] = mailing
+            cls.attempts[owner] = [
+                Attempt.objects.create(mailing=mailing, recipient=recipient, status=status, server_response=response)
+                for status, response in (('Успешно', '250'), ('Не успешно', '550'))
+            ]
+        # Первая попытка каждой рассылки — 10 марта, вторая — 12 марта (по Москве)
+        for first, second in cls.attempts.values():
+            Attempt.objects.filter(pk=first.pk).update(attempt_time=datetime(2026, 3, 10, 9, tzinfo=dt_timezone.utc))
+            Attempt.objects.filter(pk=second.pk).update(attempt_time=datetime(2026, 3, 12, 9, tzinfo=dt_timezone.utc))
+
+    def export(self, name, user=None, **params):
+        self.client.force_login(user or self.user)
+        response = self.client.get(reverse(f'mailing:{name}'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def attempt_ids(self, **params):
+        rows = list(csv.DictReader(io.StringIO(self.export('attempt-export', **params))))
+        return [int(row['id']) for row in rows]
+
+    def test_attempts_csv(self):
+        first, second = self.attempts[self.user]
+        rows = list(csv.reader(io.StringIO(self.export('attempt-export'))))
+        self.assertEqual(rows[0], [
+            'id', 'attempt_time', 'status', 'server_response',
+            'mailing_id', 'subject', 'recipient_email', 'owner_email',
+        ])
+        self.assertEqual(rows[1], [
+            str(first.pk), '2026-03-10T09:00:00+00:00', 'Успешно', '250',
+            str(self.mailings[self.user].pk), 'Тема owner@example.com', 'to-owner@example.com', 'owner@example.com',
+        ])
+        self.assertEqual([row[0] for row in rows[1:]], [str(first.pk), str(second.pk)])
+
+    def test_attempts_ndjson(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('mailing:attempt-export'), {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('attempts.ndjson', response['Content-Disposition'])
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], [attempt.pk for attempt in self.attempts[self.user]])
+        self.assertEqual(records[1]['status'], 'Не успешно')
+        self.assertEqual(records[1]['subject'], 'Тема owner@example.com')
+
+    def test_attempts_are_scoped_to_owner(self):
+        own = [attempt.pk for attempt in self.attempts[self.user]]
+        self.assertEqual(self.attempt_ids(), own)
+        # Фильтр по чужой рассылке или чужому владельцу не открывает чужие попытки
+        self.assertEqual(self.attempt_ids(mailing=self.mailings[self.other].pk), [])
+        self.assertEqual(self.attempt_ids(owner=self.other.pk), [])
+
+    def test_manager_exports_everything(self):
+        every = sorted(attempt.pk for attempts in self.attempts.values() for attempt in attempts)
+        self.assertEqual(self.attempt_ids(user=self.manager), every)
+        other = [attempt.pk for attempt in self.attempts[self.other]]
+        self.assertEqual(self.attempt_ids(user=self.manager, owner=self.other.pk), other)
+        self.assertEqual(self.attempt_ids(user=self.manager, mailing=self.mailings[self.other].pk), other)
+
+    def test_attempt_filters(self):
+        first, second = self.attempts[self.user]
+        self.assertEqual(self.attempt_ids(mailing=self.mailings[self.user].pk), [first.pk, second.pk])
+        self.assertEqual(self.attempt_ids(owner=self.user.pk), [first.pk, second.pk])
+        self.assertEqual(self.attempt_ids(status='Не успешно'), [second.pk])
+        self.assertEqual(self.attempt_ids(date_from='2026-03-11'), [second.pk])
+        self.assertEqual(self.attempt_ids(date_to='2026-03-11'), [first.pk])
+        self.assertEqual(self.attempt_ids(date_from='2026-03-10', date_to='2026-03-10'), [first.pk])
+
+    def test_invalid_filters(self):
+        self.client.force_login(self.user)
+        params = {'date_from': '2026-03-12', 'date_to': '2026-03-10'}
+        response = self.client.get(reverse('mailing:attempt-export'), params)
+        self.assertEqual(response.status_code, 400)
+
+    def test_mailing_report(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('mailing-report-export'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], str(self.mailings[self.user].pk))
+        self.assertEqual((rows[0]['success_count'], rows[0]['fail_count']), ('1', '1'))
+        self.assertEqual(rows[0]['last_attempt_time'], '2026-03-12T09:00:00+00:00')
+
+    def test_mailing_report_filters(self):
+        def report(**params):
+            rows = csv.DictReader(io.StringIO(self.export('mailing-report-export', user=self.manager, **params)))
+            return [(int(row['id']), row['success_count'], row['fail_count']) for row in rows]
+
+        own, other = self.mailings[self.user].pk, self.mailings[self.other].pk
+        self.assertEqual(report(), [(own, '1', '1'), (other, '1', '1')])
+        self.assertEqual(report(mailing=other), [(other, '1', '1')])
+        self.assertEqual(report(owner=self.user.pk), [(own, '1', '1')])
+        self.assertEqual(report(owner=self.user.pk, status='Успешно'), [(own, '1', '0')])
+        self.assertEqual(report(owner=self.user.pk, date_from='2026-03-11'), [(own, '0', '1')])
+        self.assertEqual(report(owner=self.user.pk, date_to='2026-03-10'), [(own, '1', '0')])
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджет SQL-запросов для вьюх из mailing/urls.py.
+
+    В каждом списке несколько объектов, поэтому N+1 по строкам сразу выходит за бюджет.
+    Кэш очищается перед каждым запросом: бюджет считается для холодного кэша.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create_user(email='owner@example.com', password='pass')
+        cls.manager = User.objects.create_user(email='manager@example.com', password='pass')
+        cls.manager.groups.add(Group.objects.create(name='Менеджеры'))
+
+        cls.messages = [Message.objects.create(subject=f'Тема {i}', body='Текст', owner=cls.user) for i in range(5)]
+        cls.recipients = [
+            Recipient.objects.create(email=f'b{i}@example.com', full_name=f'Получатель {i}', owner=cls.user)
+            for i in range(5)
+        ]
+        cls.mailings = []
+        for message in cls.messages:
+            mailing = Mailing.objects.create(
+                start_time=now - timedelta(hours=1),
+                end_time=now + timedelta(hours=1),
+                message=message,
+                owner=cls.user,
+            )
+            mailing.recipients.set(cls.recipients)
+            send_mailing(mailing)
+            cls.mailings.append(mailing)
+        UserCounters.rebuild(cls.manager.pk)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_owner_pages(self):
+        mailing, message, recipient = self.mailings[0], self.messages[0], self.recipients[0]
+        budgets = [
+            (4, reverse('mailing:recipient_list')),
+            (2, reverse('mailing:recipient_create')),
+            (5, reverse('mailing:recipient_update', args=[recipient.pk])),
+            (4, reverse('mailing:recipient_delete', args=[recipient.pk])),
+            (3, reverse('mailing:recipient_search') + '?q=r'),
+            (4, reverse('mailing:message-list')),
+            (2, reverse('mailing:message-create')),
+            (4, reverse('mailing:message-update', args=[message.pk])),
+            (4, reverse('mailing:message-delete', args=[message.pk])),
+            (4, reverse('mailing:mailing-list')),
+            (5, reverse('mailing:mailing-create')),
+            (6, reverse('mailing:mailing-detail', args=[mailing.pk])),
+            (8, reverse('mailing:mailing-update', args=[mailing.pk])),
+            (4, reverse('mailing:mailing-delete', args=[mailing.pk])),
+            (6, reverse('mailing:mailing-stats', args=[mailing.pk])),
+            (4, reverse('mailing:attempt-list')),
+            (4, reverse('mailing:attempt-export')),
+            (4, reverse('mailing:mailing-report-export')),
+            (3, reverse('mailing:home')),
+            (4, reverse('mailing:segment_list')),
+            (3, reverse('mailing:segment_create')),
+        ]
+        self.client.force_login(self.user)
+        for budget, url in budgets:
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.assertQueryBudget(budget, url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_manager_pages(self):
+        mailing = self.mailings[0]
+        budgets = [
+            (4, reverse('mailing:recipient_list')),
+            (4, reverse('mailing:message-list')),
+            (4, reverse('mailing:mailing-list')),
+            (6, reverse('mailing:mailing-detail', args=[mailing.pk])),
+            (6, reverse('mailing:mailing-stats', args=[mailing.pk])),
+            (4, reverse('mailing:attempt-list')),
+            (3, reverse('mailing:home')),
+        ]
+        self.client.force_login(self.manager)
+        for budget, url in budgets:
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.assertQueryBudget(budget, url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_launch(self):
+        self.client.force_login(self.user)
+        url = reverse('mailing:mailing-launch', args=[self.mailings[0].pk])
+        response = self.assertQueryBudget(8, url, method='post')
+        self.assertEqual(response.status_code, 302)
+
+    def test_toggle_status(self):
+        self.client.force_login(self.manager)
+        url = reverse('mailing:mailing-toggle-status', args=[self.mailings[0].pk])
+        response = self.assertQueryBudget(5, url, method='post')
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(
+    REQUEST_INSTRUMENTATION=True,
+    REQUEST_INSTRUMENTATION_HEADERS=True,
+)
+class RequestInstrumentationTests(TestCase):
+    """
+    Middleware инструментирования отдаёт метрики в заголовках ответа.
+    """
+
+    def test_headers(self):
+        user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.client.force_login(user)
+        with self.assertLogs('config.instrumentation', level='INFO') as logs:
+            response = self.client.get(reverse('mailing:recipient_list'))
+
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('"path": "/recipients/"', logs.output[0])
+
+    def test_streaming_response_logged_when_consumed(self):
+        user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.client.force_login(user)
+        with self.assertNoLogs('config.instrumentation', level='INFO'):
+            response = self.client.get(reverse('mailing:attempt-export'))
+        with self.assertLogs('config.instrumentation', level='INFO') as logs:
+            b''.join(response.streaming_content)
+
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['path'], '/attempts/export/')
+        # Выборка попыток выполняется при чтении потока, после возврата из вьюхи
+        self.assertGreater(data['queries'], int(response['X-DB-Queries']))
+
+
+class OwnerCachedListTests(TestCase):
+    """
+    Закэшированные списки обновляются сразу после изменений и не видны другим пользователям.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+
+    def emails(self, user):
+        self.client.force_login(user)
+        response = self.client.get(reverse('mailing:recipient_list'))
+        return [recipient.email for recipient in response.context['object_list']]
+
+    def test_list_is_invalidated_by_changes(self):
+        # Версии списков увеличиваются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            recipient = Recipient.objects.create(email='a@example.com', full_name='А', owner=self.user)
+        self.assertEqual(self.emails(self.user), ['a@example.com'])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipient.objects.create(email='b@example.com', full_name='Б', owner=self.user)
+        # Версия увеличивается только при фиксации: до неё страница отдаётся из кэша
+        self.assertEqual(self.emails(self.user), ['a@example.com'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.emails(self.user), ['b@example.com', 'a@example.com'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipient.delete()
+        self.assertEqual(self.emails(self.user), ['b@example.com'])
+
+    def test_lists_are_scoped_by_user(self):
+        Recipient.objects.create(email='a@example.com', full_name='А', owner=self.user)
+        self.assertEqual(self.emails(self.user), ['a@example.com'])
+        self.assertEqual(self.emails(self.other), [])
+
+
+class RoleResolutionTests(TestCase):
+    """
+    Роль кэшируется между запросами и сбрасывается при изменении состава группы.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.group = Group.objects.create(name='Менеджеры')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_role_is_cached(self):
+        self.assertFalse(self.fresh_user().is_manager)
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(user.is_manager)
+
+    def test_membership_changes_invalidate_role(self):
+        self.assertFalse(self.fresh_user().is_manager)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertTrue(self.fresh_user().is_manager)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(self.fresh_user().is_manager)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.add(self.user)
+        self.assertTrue(self.fresh_user().is_manager)
+
+        # Участники собираются до очистки, а роли сбрасываются после фиксации
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.clear()
+        self.assertFalse(self.fresh_user().is_manager)
+
+    def test_role_is_invalidated_after_commit(self):
+        self.assertFalse(self.fresh_user().is_manager)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.groups.add(self.group)
+            # До фиксации роль не сбрасывается: параллельный запрос ещё видит старый состав групп
+            self.assertFalse(self.fresh_user().is_manager)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertTrue(self.fresh_user().is_manager)
+
+
+class TwoTierCacheTests(TestCase):
+    """
+    Локальный уровень отдаёт частые ключи из памяти и остаётся согласованным между процессами.
+    """
+
+    def make_cache(self, **options):
+        options = {
+            'REMOTE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'INVALIDATION_BUS': 'config.testing.LocalInvalidationBus',
+            'CHANNEL': f'test-{self._testMethodName}',
+            'LOCAL_PREFIXES': ('role:',),
+            **options,
+        }
+        cache_ = TwoTierCache(f'two-tier-{self._testMethodName}', {'OPTIONS': options})
+        self.addCleanup(cache_.bus.close)
+        return cache_
+
+    def setUp(self):
+        # Два «процесса» с общим удалённым уровнем
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+        self.addCleanup(self.first.clear)
+
+    def test_writes_invalidate_other_processes(self):
+        self.first.set('role:1', 'user')
+        self.assertEqual(self.second.get('role:1'), 'user')
+        self.assertEqual(self.second.get('role:1'), 'user')
+        self.assertEqual(self.second.stats()['local_hits'], 1)
+
+        self.first.set('role:1', 'manager')
+        self.assertEqual(self.second.get('role:1'), 'manager')
+
+        self.first.delete('role:1')
+        self.assertIsNone(self.second.get('role:1'))
+
+        self.second.set('role:1', 'user')
+        self.first.set('role:counter', 1)
+        self.assertEqual(self.second.get('role:counter'), 1)
+        self.first.incr('role:counter')
+        self.assertEqual(self.second.get_many(['role:counter', 'role:1']), {'role:counter': 2, 'role:1': 'user'})
+
+    def test_only_local_prefixes_are_kept_in_memory(self):
+        self.first.set('list:page', [1, 2])
+        self.assertEqual(self.first.get('list:page'), [1, 2])
+        self.assertEqual(len(self.first.local), 0)
+        self.assertEqual(self.first.stats()['remote_only'], 1)
+
+    def test_local_tier_is_bounded_and_expires(self):
+        cache_ = self.make_cache(LOCAL_MAX_ENTRIES=2, LOCAL_TIMEOUT=0.05)
+        for user_id in range(3):
+            cache_.set(f'role:{user_id}', user_id)
+            cache_.get(f'role:{user_id}')
+        self.assertEqual(len(cache_.local), 2)
+        self.assertFalse(cache_.local.get(cache_.make_key('role:0'))[0])
+
+        time.sleep(0.06)
+        self.assertEqual(cache_.get('role:2'), 2)
+        self.assertEqual(cache_.stats()['local_hits'], 0)
+
+    def test_hit_ratios(self):
+        self.first.set('role:1', 'user')
+        self.first.get('role:1')
+        self.first.get('role:1')
+        self.first.get('role:2')
+        stats = self.first.stats()
+        self.assertEqual(stats['local_hit_ratio'], 1 / 3)
+        self.assertEqual(stats['remote_hit_ratio'], 1 / 2)
+        self.assertEqual(stats['hit_ratio'], 2 / 3)
+
+    def test_closed_bus_unsubscribes(self):
+        channel = f'test-{self._testMethodName}'
+        self.assertEqual(len(LocalInvalidationBus._subscribers[channel]), 2)
+        self.second.bus.close()
+        self.assertEqual(len(LocalInvalidationBus._subscribers[channel]), 1)
+
+        # Закрытая шина больше не получает инвалидаций
+        self.second.local.set(self.second.make_key('role:1'), 'stale')
+        self.first.set('role:1', 'manager')
+        self.assertEqual(self.second.local.get(self.second.make_key('role:1')), (True, 'stale'))
+
+
+class RecipientImportTests(TestCase):
+    """
+    Импорт пачками: создание и обновление своих получателей, отчёт об ошибках, счётчики.
+    """
+
+    CSV = (
+        'email;full_name;comment\n'
+        'new@Example.COM;Новый;\n'
+        'own@example.com;Обновлённый;коммент\n'
+        'not-an-email;Плохой;\n'
+        'foreign@example.com;Чужой;\n'
+        '\n'
+        'dup@example.com;Первый;\n'
+        'dup@example.com;Второй;\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        Recipient.objects.create(email='own@example.com', full_name='Старый', owner=self.user)
+        Recipient.objects.create(email='foreign@example.com', full_name='Чужой', owner=self.other)
+
+    def test_import_upserts_in_chunks(self):
+        report = io.StringIO()
+        progress = []
+        result = import_recipients(
+            self.user, io.BytesIO(self.CSV.encode()), 'list.csv', csv.writer(report),
+            on_progress=lambda result: progress.append(result.total_rows), chunk_size=2,
+        )
+
+        # Повтор dup@ попал в следующую пачку и считается обновлением
+        self.assertEqual(
+            (result.total_rows, result.created_count, result.updated_count, result.error_count), (6, 2, 2, 2)
+        )
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(
+            dict(Recipient.objects.filter(owner=self.user).values_list('email', 'full_name')),
+            {'new@example.com': 'Новый', 'own@example.com': 'Обновлённый', 'dup@example.com': 'Второй'},
+        )
+        self.assertEqual(Recipient.objects.get(email='foreign@example.com').full_name, 'Чужой')
+        self.assertEqual([row[0] for row in csv.reader(io.StringIO(report.getvalue()))], ['4', '5'])
+        self.assertEqual(UserCounters.for_user(self.user).recipient_count, 3)
+
+    def test_upload_runs_in_background(self):
+        self.client.force_login(self.user)
+        with self.settings(MEDIA_ROOT=self.media_root):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(reverse('mailing:recipient_import'), {
+                    'file': SimpleUploadedFile('list.csv', self.CSV.encode(), content_type='text/csv'),
+                })
+            recipient_import = RecipientImport.objects.get()
+            self.assertRedirects(response, reverse('mailing:recipient_import_detail', args=[recipient_import.pk]))
+            self.assertEqual(len(callbacks), 1)
+
+            run_import(recipient_import)
+            recipient_import.refresh_from_db()
+            self.assertEqual(recipient_import.status, 'Завершён')
+            self.assertEqual((recipient_import.created_count, recipient_import.error_count), (2, 2))
+
+            response = self.client.get(reverse('mailing:recipient_import_errors', args=[recipient_import.pk]))
+            self.assertIn('Адрес принадлежит другому пользователю', b''.join(response.streaming_content).decode())
+
+            self.client.force_login(self.other)
+            response = self.client.get(reverse('mailing:recipient_import_detail', args=[recipient_import.pk]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_error_report_name_is_not_guessable(self):
+        # Отчёт лежит в публичном media: имя не должно выводиться из pk импорта
+        with self.settings(MEDIA_ROOT=self.media_root):
+            names = []
+            for _ in range(2):
+                recipient_import = RecipientImport.objects.create(
+                    owner=self.user, file=SimpleUploadedFile('list.csv', self.CSV.encode()),
+                )
+                run_import(recipient_import)
+                names.append(recipient_import.error_report.name)
+        for name in names:
+            self.assertRegex(name, r'^imports/errors/[0-9a-f]{32}\.csv$')
+            self.assertNotIn('import_', name)
+        self.assertNotEqual(*names)
+
+    def test_rejects_unknown_format(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('mailing:recipient_import'), {
+            'file': SimpleUploadedFile('list.txt', b'email\n'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(RecipientImport.objects.exists())
+
+    def test_management_command(self):
+        path = f'{self.media_root}/list.csv'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.CSV)
+        out = io.StringIO()
+        call_command('import_recipients', path, owner='owner@example.com', errors=f'{path}.errors', stdout=out)
+        self.assertIn('Добавлено: 2, обновлено: 1, ошибок: 2', out.getvalue())
+
+    def test_xlsx(self):
+        workbook = openpyxl.Workbook()
+        for row in [('Email', 'Full_Name', 'Comment'), ('x@example.com', 'Из таблицы', None), (None, None, None),
+                    ('own@example.com', 'Обновлённый', 'коммент')]:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        content.seek(0)
+
+        result = import_recipients(self.user, content, 'list.xlsx', csv.writer(io.StringIO()))
+        self.assertEqual((result.total_rows, result.created_count, result.updated_count), (2, 1, 1))
+        self.assertEqual(
+            dict(Recipient.objects.filter(owner=self.user).values_list('email', 'full_name')),
+            {'x@example.com': 'Из таблицы', 'own@example.com': 'Обновлённый'},
+        )
+
+    def test_concurrent_foreign_insert_is_not_overwritten(self):
+        upsert = imports._upsert
+
+        def insert_first(owner, recipients):
+            # Другой пользователь добавляет адрес между проверкой владельцев и записью пачки
+            Recipient.objects.create(email='new@example.com', full_name='Успел первым', owner=self.other)
+            return upsert(owner, recipients)
+
+        report = io.StringIO()
+        csv_text = 'email,full_name\nnew@example.com,Новый\nown@example.com,Обновлённый\n'
+        with mock.patch('mailing.imports._upsert', side_effect=insert_first):
+            result = import_recipients(self.user, io.BytesIO(csv_text.encode()), 'list.csv', csv.writer(report))
+
+        self.assertEqual((result.created_count, result.updated_count, result.error_count), (0, 1, 1))
+        self.assertEqual(Recipient.objects.get(email='new@example.com').full_name, 'Успел первым')
+        self.assertIn('new@example.com,Адрес принадлежит другому пользователю', report.getvalue())
+        self.assertEqual(UserCounters.for_user(self.user).recipient_count, 1)
+
+
+class SegmentTests(TestCase):
+    """
+    Сегменты: аудитория вычисляется при отправке, без строк получателей у рассылки.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.clients = Tag.objects.create(owner=self.user, name='клиенты')
+        self.partners = Tag.objects.create(owner=self.user, name='партнёры')
+        self.first = Recipient.objects.create(email='a@corp.example', full_name='А', owner=self.user)
+        self.second = Recipient.objects.create(email='b@mail.example', full_name='Б', owner=self.user)
+        self.third = Recipient.objects.create(email='c@corp.example', full_name='В', owner=self.user)
+        Recipient.objects.create(email='d@corp.example', full_name='Г', owner=self.other)
+        self.first.tags.add(self.clients, self.partners)
+        self.second.tags.add(self.partners)
+        self.message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+
+    def test_resolve_filters(self):
+        segment = Segment.objects.create(owner=self.user, name='Все')
+        self.assertEqual(segment.resolve().count(), 3)
+
+        segment.tags.add(self.clients, self.partners)
+        self.assertEqual(
+            sorted(segment.resolve().values_list('email', flat=True)), ['a@corp.example', 'b@mail.example']
+        )
+
+        segment.email_domain = 'corp.example'
+        self.assertEqual(list(segment.resolve().values_list('email', flat=True)), ['a@corp.example'])
+
+    def test_send_resolves_segment_and_snapshots(self):
+        segment = Segment.objects.create(owner=self.user, name='Корпоративные', email_domain='corp.example')
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1),
+            message=self.message, segment=segment, snapshot_audience=True, owner=self.user,
+        )
+        self.assertEqual(send_mailing(mailing), (2, 0))
+        self.assertFalse(mailing.recipients.exists())
+        self.assertEqual(set(mailing.audience_snapshot.all()), {self.first, self.third})
+
+        # Повторная отправка не дублирует снимок
+        send_mailing(mailing)
+        self.assertEqual(mailing.audience_snapshot.count(), 2)
+        self.assertEqual(Attempt.objects.filter(mailing=mailing).count(), 4)
+
+    def test_form_requires_one_audience_and_is_owner_scoped(self):
+        segment = Segment.objects.create(owner=self.user, name='Все')
+        foreign = Segment.objects.create(owner=self.other, name='Чужой')
+        self.client.force_login(self.user)
+        data = {
+            'start_time': '2030-01-01T10:00', 'end_time': '2030-01-02T10:00', 'message': self.message.pk,
+            'priority': 'normal',
+        }
+
+        response = self.client.post(reverse('mailing:mailing-create'), data)
+        self.assertContains(response, 'Укажите сегмент или выберите получателей.')
+
+        response = self.client.post(reverse('mailing:mailing-create'), {**data, 'segment': foreign.pk})
+        self.assertIn('segment', response.context['form'].errors)
+
+        response = self.client.post(reverse('mailing:mailing-create'), {**data, 'segment': segment.pk})
+        self.assertRedirects(response, reverse('mailing:mailing-list'))
+        self.assertEqual(Mailing.objects.get().segment, segment)
+
+    def test_recipient_form_creates_tags(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('mailing:recipient_create'), {
+            'email': 'new@example.com', 'full_name': 'Новый', 'tag_names': 'клиенты, новые',
+        })
+        self.assertRedirects(response, reverse('mailing:recipient_list'))
+        recipient = Recipient.objects.get(email='new@example.com')
+        self.assertEqual(sorted(recipient.tags.values_list('name', flat=True)), ['клиенты', 'новые'])
+        self.assertEqual(Tag.objects.filter(owner=self.user).count(), 3)
+
+
+class RecipientSearchTests(TestCase):
+    """
+    Поиск получателей для формы рассылки и рендер только выбранных получателей.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.recipients = Recipient.objects.bulk_create(
+            Recipient(email=f'ivan{i}@example.com', full_name=f'Иван {i}', owner=self.user) for i in range(25)
+        )
+        Recipient.objects.create(email='petr@example.com', full_name='Пётр', owner=self.user)
+        Recipient.objects.create(email='ivan@other.example', full_name='Иван чужой', owner=self.other)
+        self.client.force_login(self.user)
+
+    def search(self, **params):
+        return self.client.get(reverse('mailing:recipient_search'), params).json()
+
+    def test_search_is_paginated_and_owner_scoped(self):
+        first = self.search(q='IVAN')
+        self.assertEqual(len(first['results']), 20)
+        second = self.search(q='ivan', after=first['next'])
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        texts = [item['text'] for item in first['results'] + second['results']]
+        self.assertNotIn('Иван чужой (ivan@other.example)', texts)
+
+        self.assertEqual([item['text'] for item in self.search(q='пёт')['results']], ['Пётр (petr@example.com)'])
+
+    def test_form_renders_only_selected_recipients(self):
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), message=message, owner=self.user,
+        )
+        mailing.recipients.set(self.recipients[:2])
+
+        response = self.client.get(reverse('mailing:mailing-update', args=[mailing.pk]))
+        self.assertContains(response, 'data-search-url="/recipients/search/"')
+        self.assertContains(response, 'ivan0@example.com')
+        self.assertContains(response, 'ivan1@example.com')
+        self.assertNotContains(response, 'ivan2@example.com')
+        self.assertNotContains(response, 'petr@example.com')
+
+        response = self.client.get(reverse('mailing:mailing-create'))
+        self.assertNotContains(response, 'ivan0@example.com')
+
+
+class ListSearchTests(TestCase):
+    """
+    Поиск ?q= в списках: подстрока от трёх символов, префикс для коротких запросов.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        Recipient.objects.create(email='anna@corp.example', full_name='Анна Смирнова', owner=self.user)
+        Recipient.objects.create(email='boris@mail.example', full_name='Борис', owner=self.user)
+        Recipient.objects.create(email='anna@other.example', full_name='Анна', owner=self.other)
+        now = timezone.now()
+        for subject in ('Скидки недели', 'Новости'):
+            message = Message.objects.create(subject=subject, body='Текст', owner=self.user)
+            Mailing.objects.create(start_time=now, end_time=now + timedelta(days=1), message=message, owner=self.user)
+        self.client.force_login(self.user)
+
+    def found(self, url_name, query):
+        response = self.client.get(reverse(url_name), {'q': query})
+        self.assertEqual(response.context['search_query'], query)
+        return [str(obj) for obj in response.context['object_list']]
+
+    def test_recipient_search(self):
+        self.assertEqual(self.found('mailing:recipient_list', 'СМИРН'), ['Анна Смирнова (anna@corp.example)'])
+        self.assertEqual(self.found('mailing:recipient_list', 'corp.'), ['Анна Смирнова (anna@corp.example)'])
+        # Короткий запрос — по началу строки
+        self.assertEqual(self.found('mailing:recipient_list', 'бо'), ['Борис (boris@mail.example)'])
+        self.assertEqual(self.found('mailing:recipient_list', 'ор'), [])
+
+    def test_message_and_mailing_search(self):
+        self.assertEqual(self.found('mailing:message-list', 'недел'), ['Скидки недели'])
+        self.assertEqual(self.found('mailing:mailing-list', 'ОВОСТ'), ['Новости (Запущена)'])
+
+    def test_search_is_kept_in_pagination(self):
+        Recipient.objects.bulk_create(
+            Recipient(email=f'anna{i}@corp.example', full_name='Анна', owner=self.user) for i in range(60)
+        )
+        response = self.client.get(reverse('mailing:recipient_list'), {'q': 'anna'})
+        self.assertIn('q=anna', response.context['next_query'])
+
+    def test_admin_mailing_search_by_id(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        mailing = Mailing.objects.first()
+        response = self.client.get(reverse('admin:mailing_mailing_changelist'), {'q': str(mailing.pk)})
+        self.assertEqual(list(response.context['cl'].result_list), [mailing])
+        response = self.client.get(reverse('admin:mailing_mailing_changelist'), {'q': 'скидки'})
+        self.assertEqual([obj.message.subject for obj in response.context['cl'].result_list], ['Скидки недели'])
+
+
+class AudienceBulkTests(TestCase):
+    """
+    Пакетные операции со списком получателей: один SQL-запрос, только получатели владельца.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.other = User.objects.create_user(email='other@example.com', password='pass')
+        self.recipients = [
+            Recipient.objects.create(email=f'r{i}@corp.example', full_name=f'Получатель {i}', owner=self.user)
+            for i in range(5)
+        ]
+        self.foreign = Recipient.objects.create(email='x@corp.example', full_name='Чужой', owner=self.other)
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), message=message, owner=self.user,
+        )
+        self.source = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), message=message, owner=self.user,
+        )
+
+    def test_add_is_single_statement_and_idempotent(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(audience.add_all(self.mailing), 5)
+        self.assertNotIn(self.foreign, self.mailing.recipients.all())
+
+        self.assertEqual(audience.add_all(self.mailing), 0)
+        self.assertEqual(self.mailing.recipients.count(), 5)
+
+    def test_add_by_filter_segment_and_copy(self):
+        self.assertEqual(audience.add_matching(self.mailing, 'r1@'), 1)
+        # Чужой получатель из того же домена не добавляется
+        segment = Segment.objects.create(owner=self.user, name='Корпоративные', email_domain='corp.example')
+        self.assertEqual(audience.add_segment(self.mailing, segment), 4)
+
+        self.source.recipients.add(self.recipients[0], self.foreign)
+        self.assertEqual(audience.copy_from(self.mailing, self.source), 0)
+        self.mailing.recipients.clear()
+        self.assertEqual(audience.copy_from(self.mailing, self.source), 1)
+
+    def test_remove(self):
+        audience.add_all(self.mailing)
+        with self.assertNumQueries(1):
+            self.assertEqual(audience.remove_matching(self.mailing, 'r1@'), 1)
+        self.assertEqual(self.mailing.recipients.count(), 4)
+        self.assertEqual(audience.clear(self.mailing), 4)
+        self.assertFalse(self.mailing.recipients.exists())
+
+    def test_view(self):
+        url = reverse('mailing:mailing-audience', args=[self.mailing.pk])
+        self.client.force_login(self.user)
+
+        response = self.client.post(url, {'action': 'add_matching'})
+        self.assertIn('query', response.context['form'].errors)
+
+        response = self.client.post(url, {'action': 'add_all'})
+        self.assertRedirects(response, reverse('mailing:mailing-detail', args=[self.mailing.pk]))
+        self.assertEqual(self.mailing.recipients.count(), 5)
+
+        # Чужая рассылка недоступна
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.post(url, {'action': 'clear'}).status_code, 404)
+        self.assertEqual(self.mailing.recipients.count(), 5)
+
+    def test_detail_shows_preview(self):
+        audience.add_all(self.mailing)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('mailing:mailing-detail', args=[self.mailing.pk]))
+        self.assertEqual(response.context['recipient_count'], 5)
+        self.assertEqual(response.context['recipient_more'], 0)
+
+
+class SoftDeleteViewTests(TestCase):
+    """
+    Удаление из интерфейса и админки только помечает объект и ставит фоновое удаление.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        self.recipient = Recipient.objects.create(email='r@example.com', full_name='Получатель', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), message=message, owner=self.user,
+        )
+        self.mailing.recipients.add(self.recipient)
+
+    def test_delete_view_marks_and_schedules_purge(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('mailing:mailing-delete', args=[self.mailing.pk]))
+        self.assertRedirects(response, reverse('mailing:mailing-list'))
+        self.assertTrue(Mailing.all_objects.get(pk=self.mailing.pk).is_deleted)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.client.get(reverse('mailing:mailing-detail', args=[self.mailing.pk])).status_code, 404)
+
+    def test_admin_delete_uses_same_path(self):
+        admin_user = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(admin_user)
+        url = reverse('admin:mailing_recipient_delete', args=[self.recipient.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'post': 'yes'})
+        self.assertTrue(Recipient.all_objects.get(pk=self.recipient.pk).is_deleted)
+        self.assertFalse(self.mailing.recipients.exists())
+
+    def test_email_of_deleted_recipient_is_reserved_until_purge(self):
+        soft_delete(self.recipient)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('mailing:recipient_create'), {
+            'email': 'r@example.com', 'full_name': 'Снова',
+        })
+        self.assertContains(response, 'Получатель с этим email удаляется')
+
+
+class MailingStatusTests(TestCase):
+    """
+    Статус рассылки вычисляется при чтении, а сохраняется пакетными UPDATE.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailings = {
+            status: Mailing.objects.create(
+                start_time=now + start, end_time=now + end, message=message, owner=self.user,
+            )
+            for status, start, end in [
+                ('Создана', timedelta(hours=1), timedelta(hours=2)),
+                ('Запущена', timedelta(hours=-1), timedelta(hours=1)),
+                ('Завершена', timedelta(hours=-2), timedelta(hours=-1)),
+            ]
+        }
+
+    def test_status_computed_on_read(self):
+        for status, mailing in self.mailings.items():
+            self.assertEqual(mailing.current_status, status)
+            self.assertEqual(mailing.status, status)
+
+    def test_detail_view_does_not_write(self):
+        self.client.force_login(self.user)
+        mailing = self.mailings['Запущена']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('mailing:mailing-detail', args=[mailing.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if q['sql'].startswith('UPDATE "mailing_mailing"')])
+
+    def test_sync_status_updates_only_stale_rows(self):
+        later = timezone.now() + timedelta(hours=3)
+        self.assertEqual(Mailing.objects.sync_status(), 0)
+        with self.assertNumQueries(3):
+            self.assertEqual(Mailing.objects.sync_status(later), 2)
+        self.assertEqual(set(Mailing.objects.values_list('status', flat=True)), {'Завершена'})
+
+
+class ScalableAdminTests(QueryBudgetMixin, TestCase):
+    """
+    Админка больших таблиц: фильтры с автодополнением, оценка числа строк, пакетные действия.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='pass')
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailings = [
+            Mailing.objects.create(
+                start_time=now - timedelta(days=40 * i), end_time=now + timedelta(days=1),
+                message=message, owner=self.user,
+            )
+            for i in range(3)
+        ]
+        recipients = [
+            Recipient.objects.create(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user)
+            for i in range(5)
+        ]
+        Attempt.objects.bulk_create([
+            Attempt(mailing=mailing, recipient=recipient, status='Успешно', server_response='OK')
+            for mailing in self.mailings for recipient in recipients
+        ])
+        self.client.force_login(self.admin)
+
+    def test_changelists_have_flat_query_count(self):
+        mailing = self.mailings[0]
+        for budget, url, params in [
+            (8, reverse('admin:mailing_attempt_changelist'), {}),
+            (9, reverse('admin:mailing_attempt_changelist'), {'mailing__id__exact': mailing.pk}),
+            (8, reverse('admin:mailing_mailing_changelist'), {}),
+            (8, reverse('admin:mailing_recipient_changelist'), {'owner__id__exact': self.user.pk}),
+        ]:
+            with self.subTest(url=url, params=params):
+                url = f'{url}?{"&".join(f"{key}={value}" for key, value in params.items())}'
+                response = self.assertQueryBudget(budget, url)
+                self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse('admin:mailing_attempt_changelist'), {'mailing__id__exact': mailing.pk})
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_autocomplete_filter_source(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'mailing', 'model_name': 'attempt', 'field_name': 'mailing', 'term': 'Тем',
+        })
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_estimated_count(self):
+        queryset = Attempt.objects.order_by('pk')
+        with mock.patch('mailing.admin_tools.table_row_estimate', return_value=5_000_000):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 5_000_000)
+        # Малая оценка заменяется точным числом
+        with mock.patch('mailing.admin_tools.table_row_estimate', return_value=10):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 15)
+
+    def test_bulk_disable_is_single_update(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('admin:mailing_mailing_changelist'), {
+                'action': 'disable_mailings', '_selected_action': [mailing.pk for mailing in self.mailings],
+            })
+        self.assertFalse(Mailing.objects.filter(is_active=True).exists())
+        updates = [q for q in context.captured_queries if q['sql'].startswith('UPDATE "mailing_mailing"')]
+        self.assertEqual(len(updates), 1)
+
+
+@override_settings(TRACKING_BUFFER={'BACKEND': 'mailing.tracking.MemoryBuffer'}, SITE_URL='http://testserver')
+class TrackingTests(TestCase):
+    """
+    Открытия и переходы: эндпоинты пишут только в буфер, потребитель сохраняет пачками.
+    """
+
+    def setUp(self):
+        MemoryBuffer().clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(
+            subject='Тема', body='Подробности: https://example.com/news?id=1.\nДо встречи', owner=self.user,
+        )
+        self.recipient = Recipient.objects.create(email='r@example.com', full_name='Получатель', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1),
+            message=message, owner=self.user, track_engagement=True,
+        )
+        self.mailing.recipients.add(self.recipient)
+
+    def test_render_tracked(self):
+        text, html = render_tracked(self.mailing.message.body, self.mailing, self.recipient)
+        self.assertNotIn('https://example.com/news', text)
+        self.assertIn('http://testserver/t/c/', text)
+        self.assertIn('>https://example.com/news?id=1</a>.<br>', html)
+        self.assertIn(open_url(self.mailing, self.recipient), html)
+
+    def test_endpoints_do_not_query_database(self):
+        url = click_url(self.mailing, self.recipient, 'https://example.com/news?id=1')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertRedirects(response, 'https://example.com/news?id=1', fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            response = self.client.get(open_url(self.mailing, self.recipient))
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(TrackingEvent.objects.count(), 0)
+
+    def test_tampered_token(self):
+        url = click_url(self.mailing, self.recipient, 'https://example.com/')
+        self.assertEqual(self.client.get(url[:-3] + 'abc/').status_code, 404)
+        # Пиксель отдаётся всегда, но событие не записывается
+        response = self.client.get(reverse('mailing:track-open', args=['bad']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(consume_events(), 0)
+
+    def test_consume_events_in_batches(self):
+        for _ in range(3):
+            self.client.get(open_url(self.mailing, self.recipient))
+        self.client.get(click_url(self.mailing, self.recipient, 'https://example.com/'))
+        # События удалённой рассылки отбрасываются
+        self.client.get(open_url(Mailing(pk=self.mailing.pk + 100), self.recipient))
+
+        self.assertEqual(consume_events(batch_size=2), 4)
+        engagement = MailingEngagement.objects.get(mailing=self.mailing)
+        self.assertEqual((engagement.open_count, engagement.click_count), (3, 1))
+        self.assertIsNotNone(engagement.last_event_at)
+        self.assertEqual(TrackingEvent.objects.filter(kind='click', url='https://example.com/').count(), 1)
+        self.assertEqual(consume_events(), 0)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('mailing:mailing-stats', args=[self.mailing.pk]))
+        self.assertContains(response, 'Открытий: 3')
+
+    def test_send_mailing_adds_pixel(self):
+        self.assertEqual(send_mailing(self.mailing), (1, 0))
+        sent = mail.outbox[0]
+        self.assertIn('/t/c/', sent.body)
+        html, mimetype = sent.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('/t/o/', html)
+
+
+def make_dsn(email, status='5.1.1', action='failed', mailing_id=None):
+    """
+    Уведомление о недоставке в формате Postfix (multipart/report).
+    """
+    original = f'X-Mailing-ID: {mailing_id}\n' if mailing_id else ''
+    return (
+        'From MAILER-DAEMON Mon Jan  6 10:00:00 2025\n'
+        'From: MAILER-DAEMON@mx.example.com\n'
+        'Subject: Undelivered Mail Returned to Sender\n'
+        'MIME-Version: 1.0\n'
+        'Content-Type: multipart/report; report-type=delivery-status; boundary="B"\n'
+        '\n'
+        '--B\n'
+        'Content-Type: text/plain\n'
+        '\n'
+        'I\'m sorry to have to inform you that your message could not be delivered.\n'
+        '\n'
+        '--B\n'
+        'Content-Type: message/delivery-status\n'
+        '\n'
+        'Reporting-MTA: dns; mx.example.com\n'
+        '\n'
+        f'Final-Recipient: rfc822; {email}\n'
+        f'Action: {action}\n'
+        f'Status: {status}\n'
+        'Diagnostic-Code: smtp; 550 5.1.1 <user>: Recipient address\n'
+        '    rejected: User unknown\n'
+        '\n'
+        '--B\n'
+        'Content-Type: text/rfc822-headers\n'
+        '\n'
+        f'{original}'
+        'Subject: Новости\n'
+        '\n'
+        '--B--\n'
+        '\n'
+    )
+
+
+class BounceTests(TestCase):
+    """
+    Обработка возвратов: потоковое чтение mbox/Maildir с позиции и пакетная запись.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Новости', body='Текст', owner=self.user)
+        self.recipients = [
+            Recipient.objects.create(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user)
+            for i in range(4)
+        ]
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=self.user,
+        )
+        self.mailing.recipients.add(*self.recipients)
+        send_mailing(self.mailing)
+
+    def write_mbox(self, *messages, mode='w'):
+        path = f'{self.dir}/bounces.mbox'
+        with open(path, mode) as mbox:
+            mbox.write(''.join(messages))
+        return path
+
+    def test_parse_fast_path_and_fallbacks(self):
+        bounce, = parse_bounce(make_dsn('R0@Example.COM', mailing_id=7).encode())
+        self.assertEqual(bounce.email, 'R0@example.com')
+        self.assertEqual((bounce.mailing_id, bounce.action, bounce.status), (7, 'failed', '5.1.1'))
+        self.assertEqual(bounce.diagnostic, 'smtp; 550 5.1.1 <user>: Recipient address rejected: User unknown')
+
+        exim = b'From: Mail Delivery System <Mailer-Daemon@mx>\nX-Failed-Recipients: r1@example.com\n\nfailed\n'
+        self.assertEqual([b.email for b in parse_bounce(exim)], ['r1@example.com'])
+        self.assertEqual(parse_bounce(b'Subject: hello\n\nnot a bounce\n'), [])
+
+    def test_mbox_incremental(self):
+        path = self.write_mbox(
+            make_dsn('r0@example.com', mailing_id=self.mailing.pk),
+            make_dsn('r1@example.com', status='4.4.1', action='delayed'),
+            'From someone Mon Jan  6 10:00:00 2025\nSubject: hello\n\nnot a bounce\n\n',
+        )
+        # Число запросов не зависит от числа писем в пачке
+        with self.assertNumQueries(11):
+            result = process_mailbox(path)
+        self.assertEqual((result.message_count, result.bounce_count, result.matched_count), (3, 2, 2))
+        self.assertEqual(result.suppressed_count, 1)
+
+        attempts = {a.recipient.email: a for a in Attempt.objects.select_related('recipient')}
+        self.assertEqual(attempts['r0@example.com'].delivery_status, 'Возврат')
+        self.assertTrue(attempts['r0@example.com'].delivery_response.startswith('5.1.1 smtp; 550'))
+        self.assertEqual(attempts['r1@example.com'].delivery_status, 'Отложено')
+        self.assertEqual(attempts['r2@example.com'].delivery_status, '')
+        self.assertEqual(
+            list(Recipient.objects.filter(is_suppressed=True).values_list('email', flat=True)), ['r0@example.com'],
+        )
+
+        # Следующий запуск читает только новые письма; незаконченное письмо ждёт следующего
+        source = BounceSource.objects.get()
+        self.assertEqual(source.offset, os.path.getsize(path))
+        partial = make_dsn('r3@example.com').rstrip('\n')
+        self.write_mbox(make_dsn('r2@example.com'), partial, mode='a')
+        result = process_mailbox(path)
+        self.assertEqual((result.message_count, result.suppressed_count), (1, 1))
+        self.write_mbox('\n\n', mode='a')
+        self.assertEqual(process_mailbox(path).suppressed_count, 1)
+        self.assertEqual(BounceSource.objects.get().message_count, 5)
+
+        # Заблокированным адресам рассылка больше не отправляется
+        mail.outbox = []
+        self.assertEqual(send_mailing(self.mailing), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['r1@example.com'])
+        self.assertEqual(mail.outbox[0].extra_headers['X-Mailing-ID'], str(self.mailing.pk))
+
+    def test_iter_mbox_caps_message_size(self):
+        path = self.write_mbox(make_dsn('r0@example.com'), make_dsn('r1@example.com'))
+        with open(path, 'rb') as mbox:
+            messages = list(iter_mbox(mbox, max_bytes=100))
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(all(len(raw) < 200 for _, raw in messages))
+        self.assertEqual(messages[-1][0], os.path.getsize(path))
+
+    def test_maildir(self):
+        for name in ('new', 'cur', 'tmp'):
+            os.mkdir(f'{self.dir}/{name}')
+        with open(f'{self.dir}/new/1.mx', 'w') as message:
+            message.write(make_dsn('r0@example.com', mailing_id=self.mailing.pk).split('\n', 1)[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_mailbox(self.dir)
+        self.assertEqual(result.suppressed_count, 1)
+        self.assertEqual(os.listdir(f'{self.dir}/new'), [])
+        self.assertEqual(os.listdir(f'{self.dir}/cur'), ['1.mx:2,S'])
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Минимальный SMTP-сервер на localhost: принимает письма и запоминает получателей.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(f'{line}\r\n'.encode())
+
+        def handle(self):
+            self.reply('220 sink')
+            for line in self.rfile:
+                command = line.decode().strip().upper()
+                if command.startswith(('EHLO', 'HELO')):
+                    self.reply('250 sink')
+                elif command.startswith('RCPT TO:'):
+                    self.server.received.append(line.decode().strip()[8:].strip('<>'))
+                    self.reply('250 OK')
+                elif command == 'DATA':
+                    self.reply('354 go ahead')
+                    for data in self.rfile:
+                        if data in (b'.\r\n', b'.\n'):
+                            break
+                    self.reply('250 queued')
+                elif command == 'QUIT':
+                    self.reply('221 bye')
+                    return
+                else:
+                    self.reply('250 OK')
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), self.Handler)
+        self.received = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend')
+class RelayPoolTests(TestCase):
+    """
+    Распределение писем по пулу SMTP-серверов на локальных серверах-приёмниках.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.sinks = [SMTPSink(), SMTPSink()]
+        for sink in self.sinks:
+            self.addCleanup(sink.stop)
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=self.user,
+        )
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(40)
+        )
+        audience.add_all(self.mailing)
+
+    def relays(self, *relays):
+        return override_settings(EMAIL_RELAYS=[
+            {'NAME': name, 'HOST': '127.0.0.1', 'PORT': port, **options} for name, port, options in relays
+        ])
+
+    def test_weighted_distribution(self):
+        with self.relays(('a', self.sinks[0].port, {'WEIGHT': 3}), ('b', self.sinks[1].port, {'WEIGHT': 1})):
+            self.assertEqual(send_mailing(self.mailing), (40, 0))
+        counts = dict(Attempt.objects.values_list('relay').annotate(total=models.Count('id')))
+        self.assertEqual(counts['a'], len(self.sinks[0].received))
+        self.assertEqual(counts['a'] + counts['b'], 40)
+        self.assertGreater(counts['a'], counts['b'])
+
+    def test_unhealthy_relay_leaves_rotation(self):
+        with self.relays(('dead', closed_port(), {'WEIGHT': 100}), ('live', self.sinks[0].port, {})):
+            self.assertEqual(send_mailing(self.mailing), (40, 0))
+        self.assertEqual(set(Attempt.objects.values_list('relay', flat=True)), {'live'})
+        self.assertEqual(len(self.sinks[0].received), 40)
+        self.assertIsNotNone(cache.get('relay:down:dead'))
+
+    def test_all_relays_down(self):
+        with self.relays(('dead', closed_port(), {})):
+            self.assertEqual(send_mailing(self.mailing), (0, 40))
+        self.assertEqual(set(Attempt.objects.values_list('relay', flat=True)), {'dead'})
+
+    def test_rate_limit(self):
+        relay = Relay('limited', '127.0.0.1', rate=2)
+        self.assertEqual([relay.acquire(now=100) for _ in range(3)], [True, True, False])
+        self.assertTrue(relay.acquire(now=101))
+        # Лимит одного сервера переводит остальные письма секунды на другой
+        with mock.patch('mailing.relays.time.time', return_value=200.0), self.relays(
+            ('a', self.sinks[0].port, {'WEIGHT': 1000, 'RATE': 5}), ('b', self.sinks[1].port, {}),
+        ):
+            self.assertEqual(send_mailing(self.mailing), (40, 0))
+        self.assertEqual((len(self.sinks[0].received), len(self.sinks[1].received)), (5, 35))
+
+
+class SchedulingTests(TestCase):
+    """
+    Очереди отправки по приоритетам: выбор очереди, отправка частями, деление между владельцами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.manager = User.objects.create_user(email='manager@example.com', password='pass')
+        self.manager.groups.add(Group.objects.create(name='Менеджеры'))
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(5)
+        )
+        now = timezone.now()
+        self.mailings = [
+            Mailing.objects.create(
+                start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1),
+                message=message, owner=self.user,
+            )
+            for _ in range(2)
+        ]
+        for mailing in self.mailings:
+            audience.add_all(mailing)
+        enqueue = mock.patch('mailing.tasks.send_mailing_task.apply_async')
+        self.apply_async = enqueue.start()
+        self.addCleanup(enqueue.stop)
+
+    def test_queue_for(self):
+        mailing = self.mailings[0]
+        self.assertEqual(queue_for(mailing), 'mailing_high')
+        with override_settings(SMALL_MAILING_SIZE=4):
+            self.assertEqual(queue_for(mailing), 'mailing_normal')
+            mailing.priority = 'high'
+            self.assertEqual(queue_for(mailing), 'mailing_high')
+        mailing.priority = 'bulk'
+        self.assertEqual(queue_for(mailing), 'mailing_bulk')
+
+    @override_settings(SEND_CHUNK_SIZE=4)
+    @mock.patch('mailing.scheduling.MIN_CHUNK_SIZE', 1)
+    def test_chunks_interleave_and_share(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for mailing in self.mailings:
+                self.assertEqual(dispatch(mailing), 'mailing_high')
+        # У владельца две рассылки в очереди: каждая получает половину части
+        self.assertEqual(chunk_size('mailing_high', self.user.pk), 2)
+
+        queue = [call.args[:2] for call in self.apply_async.call_args_list]
+        self.assertEqual([args for args, kwargs in queue], [(mailing.pk,) for mailing in self.mailings])
+        order = []
+        while queue:
+            args, kwargs = queue.pop(0)
+            self.apply_async.reset_mock()
+            send_next_chunk(*args, **kwargs)
+            order.append(args[0])
+            queue += [call.args[:2] for call in self.apply_async.call_args_list]
+
+        first, second = (mailing.pk for mailing in self.mailings)
+        self.assertEqual(order, [first, second, first, second, first, second])
+        self.assertEqual(Attempt.objects.filter(mailing=self.mailings[0]).count(), 5)
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertIsNone(cache.get(f'send:active:mailing_high:{self.user.pk}'))
+
+    def test_rolled_back_dispatch_is_not_counted(self):
+        # Транзакция откатилась: задача не поставлена, и счётчик владельца не должен расти
+        with self.captureOnCommitCallbacks() as callbacks:
+            dispatch(self.mailings[0])
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(f'send:active:mailing_high:{self.user.pk}'))
+        self.apply_async.assert_not_called()
+
+    def test_disabled_mailing_stops(self):
+        mailing = self.mailings[0]
+        dispatch(mailing)
+        Mailing.objects.filter(pk=mailing.pk).update(is_active=False)
+        self.assertEqual(send_next_chunk(mailing.pk, queue='mailing_high', enqueued_at=time.time() - 2), (0, 0))
+        self.apply_async.assert_not_called()
+        self.assertGreaterEqual(cache.get('queue:wait:mailing_high:last'), 2)
+
+    def test_launch_enqueues_by_priority(self):
+        self.client.force_login(self.user)
+        mailing = self.mailings[0]
+        Mailing.objects.filter(pk=mailing.pk).update(priority='bulk')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mailing:mailing-launch', args=[mailing.pk]))
+        self.assertEqual(self.apply_async.call_args.kwargs['queue'], 'mailing_bulk')
+        self.assertEqual(Attempt.objects.count(), 0)
+
+    def test_queue_stats_view(self):
+        url = reverse('mailing:mailing-queue-stats')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.manager)
+        with mock.patch('mailing.scheduling.queue_depth', return_value=3):
+            stats = self.client.get(url).json()
+        self.assertEqual(set(stats), {'high', 'normal', 'bulk'})
+        self.assertEqual(stats['bulk']['depth'], 3)
+
+
+class PacingTests(TestCase):
+    """
+    Отправка рассылки тактами по интервалу: квота такта и откладывание продолжения.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(6)
+        )
+        self.now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=self.now, end_time=self.now + timedelta(minutes=10),
+            message=message, owner=self.user, pacing='even',
+        )
+        audience.add_all(self.mailing)
+
+    def test_even_quota(self):
+        # 1000 писем на 10 тактов по минуте
+        self.assertEqual(paced_quota(self.mailing, 1000, 60, now=self.now), 100)
+        self.assertEqual(paced_quota(self.mailing, 500, 60, now=self.now + timedelta(minutes=5)), 100)
+        # Последний такт забирает остаток
+        self.assertEqual(paced_quota(self.mailing, 37, 60, now=self.now + timedelta(minutes=9, seconds=30)), 37)
+        self.assertEqual(paced_quota(self.mailing, 3, 60, now=self.now), 1)
+        self.assertEqual(paced_quota(self.mailing, 0, 60, now=self.now), 0)
+
+    def test_catches_up_when_behind(self):
+        # Половина интервала прошла, а отправлено ничего: остаток делится на пять тактов
+        self.assertEqual(paced_quota(self.mailing, 1000, 60, now=self.now + timedelta(minutes=5)), 200)
+
+    def test_curves(self):
+        self.mailing.pacing = 'front'
+        front = paced_quota(self.mailing, 1000, 60, now=self.now)
+        self.mailing.pacing = 'back'
+        back = paced_quota(self.mailing, 1000, 60, now=self.now)
+        self.assertEqual((front, back), (190, 10))
+
+    @override_settings(PACING_INTERVAL=60)
+    @mock.patch('mailing.tasks.send_mailing_task.apply_async')
+    def test_send_waits_for_next_tick(self, apply_async):
+        # Интервал 4,5 минуты: квота первого такта — 2 письма из 6, второго — 1 из 4
+        Mailing.objects.filter(pk=self.mailing.pk).update(
+            start_time=self.now - timedelta(seconds=1), end_time=self.now + timedelta(minutes=4, seconds=30),
+        )
+        self.assertEqual(send_next_chunk(self.mailing.pk, queue='mailing_high'), (2, 0))
+        pace = apply_async.call_args.args[1]
+        self.assertEqual(pace['quota'], 0)
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 55)
+
+        # Следующий такт: продолжение с места остановки, квота пересчитана
+        pace['tick_end'] = time.time()
+        self.assertEqual(send_next_chunk(self.mailing.pk, **pace), (1, 0))
+        self.assertEqual(Attempt.objects.filter(mailing=self.mailing).values('recipient').distinct().count(), 3)
+
+
+@override_settings(TIME_ZONE='Europe/Moscow')
+class RecurrenceTests(TestCase):
+    """
+    Повторяющиеся рассылки: разбор cron, местное время с переходами часов, запуск по next_run_at.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        self.message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        self.recipient = Recipient.objects.create(email='r@example.com', full_name='Получатель', owner=self.user)
+        self.msk = timezone.get_default_timezone()
+
+    def at(self, *args):
+        return datetime(*args, tzinfo=self.msk)
+
+    def test_parse(self):
+        cron = Cron('*/15 9-18 * * 1-5,7')
+        self.assertEqual(cron.minutes, [0, 15, 30, 45])
+        self.assertEqual(cron.hours, list(range(9, 19)))
+        self.assertEqual(cron.weekdays, {1, 2, 3, 4, 5, 7})
+        self.assertEqual(Cron('@weekly').weekdays, {7})
+        for expression in ('* * * *', '60 * * * *', '* * 0 * *', '*/0 * * * *', 'a * * * *'):
+            with self.subTest(expression=expression), self.assertRaises(ValidationError):
+                Cron(expression)
+
+    def test_day_of_month_or_weekday(self):
+        # 2026-03-01 — воскресенье: подходит и 13-е число, и любая пятница
+        cron = Cron('0 12 13 * 5')
+        self.assertEqual(cron.next_after(self.at(2026, 3, 1)), self.at(2026, 3, 6, 12))
+        self.assertEqual(cron.next_after(self.at(2026, 3, 12, 12)), self.at(2026, 3, 13, 12))
+
+    def test_moscow_time(self):
+        # С 2014 года Москва круглый год в UTC+3
+        run = Cron('0 9 * * *').next_after(self.at(2026, 7, 1, 10))
+        self.assertEqual(run, datetime(2026, 7, 2, 6, tzinfo=dt_timezone.utc))
+        self.assertEqual(Cron('0 9 * * *').next_after(self.at(2026, 12, 1, 10)).utcoffset(), timedelta(hours=3))
+
+    def test_spring_forward(self):
+        # 28.03.2010 в Москве часы переводились с 02:00 на 03:00: 02:30 не существует
+        run = Cron('30 2 * * *').next_after(self.at(2010, 3, 27, 12))
+        self.assertEqual(run, datetime(2010, 3, 27, 23, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual((run.astimezone(self.msk).hour, run.astimezone(self.msk).minute), (3, 30))
+
+    def test_fall_back_runs_once(self):
+        # 31.10.2010 часы переводились с 03:00 на 02:00: 02:30 было дважды.
+        # Время в повторяющемся часе по PEP 495 не равно времени в другой зоне, сравниваем в UTC
+        cron = Cron('30 2 * * *')
+        first = cron.next_after(self.at(2010, 10, 30, 12))
+        self.assertEqual(first.astimezone(dt_timezone.utc), datetime(2010, 10, 30, 22, 30, tzinfo=dt_timezone.utc))
+        second = cron.next_after(first)
+        self.assertEqual(second.astimezone(dt_timezone.utc), datetime(2010, 10, 31, 23, 30, tzinfo=dt_timezone.utc))
+        # Из второго прохода повторяющегося часа следующий запуск не уходит в прошлое
+        hourly = Cron('0 * * * *')
+        moment = datetime(2010, 10, 30, 23, 10, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            hourly.next_after(moment).astimezone(dt_timezone.utc), datetime(2010, 10, 31, 0, tzinfo=dt_timezone.utc),
+        )
+
+    def make_mailing(self, **kwargs):
+        mailing = Mailing.objects.create(message=self.message, owner=self.user, **kwargs)
+        mailing.recipients.add(self.recipient)
+        return mailing
+
+    def test_next_run_within_window(self):
+        start = self.at(2030, 1, 7, 9, 30)
+        mailing = self.make_mailing(start_time=start, end_time=start + timedelta(days=15), recurrence='weekly')
+        self.assertEqual(mailing.next_run_at, start)
+        self.assertEqual(mailing.get_next_run(start), start + timedelta(days=7))
+        self.assertIsNone(mailing.get_next_run(start + timedelta(days=14)))
+
+        mailing.recurrence = ''
+        mailing.save(update_fields=['recurrence'])
+        self.assertIsNone(Mailing.objects.get(pk=mailing.pk).next_run_at)
+
+    def test_save_keeps_due_run(self):
+        now = timezone.now()
+        mailing = self.make_mailing(
+            start_time=now - timedelta(days=1), end_time=now + timedelta(days=1), recurrence='cron', cron='0 * * * *',
+        )
+        # Запуск наступил, но beat его ещё не забрал
+        due = now - timedelta(seconds=30)
+        Mailing.objects.filter(pk=mailing.pk).update(next_run_at=due)
+
+        mailing = Mailing.objects.get(pk=mailing.pk)
+        mailing.priority = 'high'
+        mailing.save()
+        self.assertEqual(Mailing.objects.get(pk=mailing.pk).next_run_at, due)
+
+        # Изменённое расписание пересчитывает запуск
+        mailing.cron = '*/5 * * * *'
+        mailing.save()
+        self.assertGreater(Mailing.objects.get(pk=mailing.pk).next_run_at, now)
+
+    def test_run_recurring(self):
+        now = timezone.now()
+        mailing = self.make_mailing(
+            start_time=now - timedelta(days=1), end_time=now + timedelta(days=1), recurrence='cron', cron='* * * * *',
+        )
+        one_off = self.make_mailing(start_time=now - timedelta(days=1), end_time=now + timedelta(days=1))
+        self.assertIsNone(one_off.next_run_at)
+        # Повторяющиеся рассылки не отправляются при каждом проходе send_mailings
+        self.assertEqual(list(Mailing.objects.due(now)), [one_off])
+
+        later = now + timedelta(minutes=5)
+        started = []
+        with self.assertNumQueries(4):
+            self.assertEqual(run_recurring(later, start=started.append), [mailing])
+        self.assertEqual(started, [mailing])
+        mailing.refresh_from_db()
+        self.assertGreater(mailing.next_run_at, later)
+        self.assertLessEqual(mailing.next_run_at, later + timedelta(minutes=1))
+        # Повторный вызов в ту же минуту ничего не запускает
+        self.assertEqual(run_recurring(later, start=started.append), [])
+
+    def test_form_requires_cron(self):
+        data = {
+            'start_time': '2030-01-07T09:30', 'end_time': '2030-02-07T09:30', 'message': self.message.pk,
+            'recipients': [self.recipient.pk], 'priority': 'normal', 'recurrence': 'cron', 'cron': '',
+        }
+        form = MailingForm(data, owner=self.user)
+        self.assertIn('cron', form.errors)
+        form = MailingForm({**data, 'cron': '0 9 * * 70'}, owner=self.user)
+        self.assertIn('cron', form.errors)
+        form = MailingForm({**data, 'cron': '0 9 * * 1-5'}, owner=self.user)
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class LeaseTests(TestCase):
+    """
+    Аренда рассылки: повторный запуск не отправляет писем, истёкшую аренду можно перехватить.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(5)
+        )
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=self.user,
+        )
+        audience.add_all(self.mailing)
+
+    def expire(self):
+        MailingLease.objects.filter(mailing=self.mailing).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_acquire_renew_release(self):
+        first, second = Lease(self.mailing.pk), Lease(self.mailing.pk)
+        self.assertTrue(first.acquire())
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+
+        # Держатель упал: после истечения аренду берёт другой, прежний её больше не продлит
+        self.expire()
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.renew())
+        first.release()
+        self.assertEqual(MailingLease.objects.get(mailing=self.mailing).token, second.token)
+        second.release()
+        self.assertFalse(MailingLease.objects.exists())
+
+    def test_send_mailing_busy(self):
+        with Lease(self.mailing.pk):
+            with self.assertRaises(LeaseBusy):
+                send_mailing(self.mailing)
+            out = io.StringIO()
+            call_command('send_mailings', stdout=out)
+            self.assertIn('уже отправляется', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_mailing(self.mailing), (5, 0))
+        self.assertFalse(MailingLease.objects.exists())
+
+    def test_lost_lease_stops_sending(self):
+        lease = Lease(self.mailing.pk)
+        lease.acquire()
+        self.expire()
+        Lease(self.mailing.pk).acquire()
+        # Следующий heartbeat обращается к базе и обнаруживает перехват
+        lease.renewed_at = None
+        with self.assertRaises(LeaseLost):
+            send_mailing_chunk(self.mailing, 0, 10, lease)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(SEND_CHUNK_SIZE=3)
+    @mock.patch('mailing.scheduling.MIN_CHUNK_SIZE', 1)
+    @mock.patch('mailing.tasks.send_mailing_task.apply_async')
+    def test_double_launch_sends_once(self, apply_async):
+        self.client.force_login(self.user)
+        url = reverse('mailing:mailing-launch', args=[self.mailing.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+            self.client.post(url)
+        queue = [call.args[:2] for call in apply_async.call_args_list]
+        self.assertEqual(len(queue), 2)
+        self.run_queue(apply_async, queue)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(Attempt.objects.filter(mailing=self.mailing).count(), 5)
+        self.assertFalse(MailingLease.objects.exists())
+
+    def run_queue(self, apply_async, queue):
+        while queue:
+            args, kwargs = queue.pop(0)
+            apply_async.reset_mock()
+            send_next_chunk(*args, **kwargs)
+            queue += [call.args[:2] for call in apply_async.call_args_list]
+
+    @override_settings(SEND_CHUNK_SIZE=3)
+    @mock.patch('mailing.scheduling.MIN_CHUNK_SIZE', 1)
+    @mock.patch('mailing.tasks.send_mailing_task.apply_async')
+    def test_new_run_after_crash_sends_whole_audience(self, apply_async):
+        self.client.force_login(self.user)
+        url = reverse('mailing:mailing-launch', args=[self.mailing.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        args, kwargs = apply_async.call_args.args[:2]
+        send_next_chunk(*args, **kwargs)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertNotEqual(MailingLease.objects.get(mailing=self.mailing).cursor, 0)
+
+        # Воркер упал вместе с продолжением, аренда с курсором истекла: новый запуск отправляет всем
+        self.expire()
+        mail.outbox = []
+        apply_async.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        self.run_queue(apply_async, [call.args[:2] for call in apply_async.call_args_list])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'r{i}@example.com' for i in range(5)])
+        self.assertFalse(MailingLease.objects.exists())
+
+        # Так же и для отправки без задач (send_mailings, повторяющиеся рассылки)
+        lease = Lease(self.mailing.pk)
+        lease.acquire()
+        lease.renew(cursor=Recipient.objects.order_by('pk').values_list('pk', flat=True)[2])
+        self.expire()
+        self.assertEqual(send_mailing(self.mailing), (5, 0))
+
+    @override_settings(SEND_CHUNK_SIZE=2)
+    @mock.patch('mailing.scheduling.MIN_CHUNK_SIZE', 1)
+    @mock.patch('mailing.tasks.send_mailing_task.apply_async')
+    def test_redelivered_continuation_does_not_resend(self, apply_async):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mailing:mailing-launch', args=[self.mailing.pk]))
+        args, kwargs = apply_async.call_args.args[:2]
+        apply_async.reset_mock()
+        send_next_chunk(*args, **kwargs)
+        continuation = apply_async.call_args.args[:2]
+
+        # Продолжение выполняется дважды (повторная доставка брокером): вторая копия идёт после курсора
+        self.run_queue(apply_async, [continuation, continuation])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'r{i}@example.com' for i in range(5)])
+        self.assertFalse(MailingLease.objects.exists())
+
+
+@override_settings(
+    METRICS_STORE={'BACKEND': 'mailing.metrics.MemoryStore'}, METRICS_TOKEN='secret',
+    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+)
+class MetricsTests(TestCase):
+    """
+    Метрики отправки: счётчики по рассылке и серверу, гистограммы, эндпоинт Prometheus.
+    """
+
+    def setUp(self):
+        cache.clear()
+        metrics.flush()
+        metrics.MemoryStore().clear()
+        self.sink = SMTPSink()
+        self.addCleanup(self.sink.stop)
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=self.user,
+        )
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(10)
+        )
+        audience.add_all(self.mailing)
+
+    def scrape(self):
+        response = self.client.get(reverse('mailing:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_send_counters(self):
+        relays = [
+            {'NAME': 'dead', 'HOST': '127.0.0.1', 'PORT': closed_port(), 'WEIGHT': 1000},
+            {'NAME': 'live', 'HOST': '127.0.0.1', 'PORT': self.sink.port},
+        ]
+        with override_settings(EMAIL_RELAYS=relays), mock.patch('mailing.scheduling.queue_depth', return_value=7):
+            self.assertEqual(send_mailing(self.mailing), (10, 0))
+            text = self.scrape()
+        pk = self.mailing.pk
+        self.assertIn(f'mailing_emails_sent_total{{mailing="{pk}",relay="live"}} 10', text)
+        self.assertIn(f'mailing_relay_retries_total{{mailing="{pk}",relay="dead"}} 1', text)
+        self.assertIn('# TYPE mailing_smtp_send_seconds histogram', text)
+        self.assertIn('mailing_smtp_send_seconds_bucket{relay="live",le="+Inf"} 10', text)
+        self.assertIn('mailing_smtp_send_seconds_count{relay="live"} 10', text)
+        # Соединение открывается один раз на отправку
+        self.assertIn('mailing_smtp_connect_seconds_count{relay="live"} 1', text)
+        self.assertIn('mailing_attempt_flush_seconds_count 1', text)
+        self.assertIn('mailing_queue_depth{queue="mailing_bulk"} 7', text)
+        self.assertIn('mailing_sends_in_flight 0', text)
+        # Корзины накопительные и идут по возрастанию границы
+        buckets = [
+            int(line.rsplit(' ', 1)[1]) for line in text.splitlines()
+            if line.startswith('mailing_smtp_send_seconds_bucket{relay="live"')
+        ]
+        self.assertEqual(len(buckets), len(metrics.BUCKETS) + 1)
+        self.assertEqual(buckets, sorted(buckets))
+
+    def test_histogram_renders_empty_buckets(self):
+        # Все значения больше первых границ: их корзины выводятся с нулём
+        metrics.SMTP_SEND_SECONDS.observe(0.3, relay='slow')
+        metrics.ATTEMPT_FLUSH_SECONDS.observe(20)
+        with mock.patch('mailing.scheduling.queue_depth', return_value=None):
+            text = self.scrape()
+        for bound in metrics.BUCKETS:
+            expected = 1 if bound >= 0.3 else 0
+            self.assertIn(f'mailing_smtp_send_seconds_bucket{{relay="slow",le="{bound}"}} {expected}', text)
+            self.assertIn(f'mailing_attempt_flush_seconds_bucket{{le="{bound}"}} 0', text)
+        self.assertIn('mailing_attempt_flush_seconds_bucket{le="+Inf"} 1', text)
+        # Гистограмма без наблюдений не выводит серий
+        self.assertNotIn('mailing_smtp_connect_seconds_bucket', text)
+
+    def test_access(self):
+        url = reverse('mailing:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        manager = User.objects.create_user(email='manager@example.com', password='pass')
+        manager.groups.add(Group.objects.create(name='Менеджеры'))
+        self.client.force_login(manager)
+        with mock.patch('mailing.scheduling.queue_depth', return_value=None):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    @skipUnless(redis_available(), 'Redis недоступен')
+    def test_redis_store_sums_processes(self):
+        # Каждый процесс прибавляет свои значения к одним и тем же хешам Redis
+        stores = [metrics.RedisStore(f'{settings.REDIS_URL}/3', prefix='metrics-test') for _ in range(2)]
+        self.addCleanup(stores[0].clear)
+        stores[0].add({('mailing_emails_sent_total', 'mailing="1",relay="a"'): 3})
+        stores[1].add({
+            ('mailing_emails_sent_total', 'mailing="1",relay="a"'): 4,
+            ('mailing_attempt_flush_seconds_sum', ''): 0.5,
+        })
+        self.assertEqual(
+            stores[0].read(['mailing_emails_sent_total', 'mailing_attempt_flush_seconds_sum']),
+            {
+                'mailing_emails_sent_total': {'mailing="1",relay="a"': 7.0},
+                'mailing_attempt_flush_seconds_sum': {'': 0.5},
+            },
+        )
+
+
+class ProfilingTests(TestCase):
+    """
+    Замеры этапов отправки: обработчики, лог и send_mailings --profile.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='pass')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.user)
+        now = timezone.now()
+        self.mailing = Mailing.objects.create(
+            start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1), message=message, owner=self.user,
+        )
+        Recipient.objects.bulk_create(
+            Recipient(email=f'r{i}@example.com', full_name=f'Получатель {i}', owner=self.user) for i in range(8)
+        )
+        audience.add_all(self.mailing)
+
+    def test_hooks_receive_phase_timings(self):
+        with timing_hook(SummaryHook()) as summary, self.assertLogs('mailing.profiling', 'INFO') as logs:
+            send_mailing(self.mailing)
+        self.assertEqual((summary.sends, summary.recipients), (1, 8))
+        self.assertEqual(set(summary.timings), set(PHASES))
+        self.assertTrue(all(seconds > 0 for seconds in summary.timings.values()))
+        self.assertIn('"recipients": 8', logs.output[0])
+
+        # Вне блока обработчик больше не вызывается
+        send_mailing(self.mailing)
+        self.assertEqual(summary.sends, 1)
+
+    def test_failed_send_is_reported(self):
+        def fail(recipient, attempt):
+            raise RuntimeError('сбой')
+
+        with timing_hook(SummaryHook()) as summary, mock.patch('mailing.metrics.flush') as flush:
+            with self.assertRaises(RuntimeError):
+                send_mailing(self.mailing, on_result=fail)
+        self.assertEqual((summary.sends, summary.recipients), (1, 1))
+        flush.assert_called()
+
+    def test_profile_option(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'run.prof')
+        out = io.StringIO()
+        call_command('send_mailings', profile=path, stdout=out)
+        output = out.getvalue()
+        self.assertTrue(os.path.getsize(path))
+        self.assertIn('cumulative', output)
+        self.assertIn('мс на 1000', output)
+        self.assertIn('Отправок: 1, получателей: 8', output)
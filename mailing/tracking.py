@@ -0,0 +1,299 @@
+"""
+Отслеживание открытий писем и переходов по ссылкам.
+
+При отправке рассылки с track_engagement (services.send_mailing) ссылки в
+тексте письма заменяются подписанными адресами перехода, а в HTML-версию
+добавляется пиксель открытия. Эндпоинты (views.TrackOpenView, TrackClickView)
+только проверяют подпись и дописывают событие в буфер: поток Redis или память
+процесса. PostgreSQL в запросе не участвует, поэтому всплеск открытий после
+большой рассылки не нагружает базу.
+
+Фоновая задача (consume_tracking_events_task) забирает события пачками,
+вставляет их одним bulk_create и обновляет счётчики рассылок (MailingEngagement).
+Доставка «хотя бы один раз»: если потребитель упал после вставки, но до
+подтверждения, пачка будет обработана повторно.
+"""
+import base64
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone as dt_timezone
+from itertools import count
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import Mailing, MailingEngagement, Recipient, TrackingEvent
+
+logger = logging.getLogger(__name__)
+
+SALT = 'mailing.tracking'
+
+# Ссылка без завершающей пунктуации предложения
+URL_RE = re.compile(r'''https?://[^\s<>"']*[^\s<>"'.,;:!?)]''')
+
+# Прозрачный GIF 1x1
+PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+COUNTER_FIELDS = {
+    'open': 'open_count',
+    'click': 'click_count',
+}
+
+
+# -------- ТОКЕНЫ И ССЫЛКИ --------
+
+def make_token(mailing_id, recipient_id, url=None):
+    """
+    Подписанный токен события: рассылка, получатель и (для перехода) адрес ссылки.
+    """
+    payload = [mailing_id, recipient_id] if url is None else [mailing_id, recipient_id, url]
+    return signing.dumps(payload, salt=SALT, compress=True)
+
+
+def parse_token(token):
+    """
+    Возвращает (mailing_id, recipient_id, url или None). При неверной подписи — signing.BadSignature.
+    """
+    payload = signing.loads(token, salt=SALT)
+    mailing_id, recipient_id, *rest = payload
+    return int(mailing_id), int(recipient_id), (rest[0] if rest else None)
+
+
+def absolute_url(path):
+    return settings.SITE_URL.rstrip('/') + path
+
+
+def click_url(mailing, recipient, url):
+    return absolute_url(reverse('mailing:track-click', args=[make_token(mailing.pk, recipient.pk, url)]))
+
+
+def open_url(mailing, recipient):
+    return absolute_url(reverse('mailing:track-open', args=[make_token(mailing.pk, recipient.pk)]))
+
+
+def render_tracked(body, mailing, recipient):
+    """
+    Текст и HTML письма для получателя: ссылки ведут через адрес перехода,
+    в HTML добавлен пиксель открытия. Возвращает (text, html).
+    """
+    text_parts, html_parts = [], []
+    position = 0
+    for match in URL_RE.finditer(body):
+        tracked = click_url(mailing, recipient, match.group(0))
+        text_parts += [body[position:match.start()], tracked]
+        html_parts += [
+            escape(body[position:match.start()]),
+            f'<a href="{escape(tracked)}">{escape(match.group(0))}</a>',
+        ]
+        position = match.end()
+    text_parts.append(body[position:])
+    html_parts.append(escape(body[position:]))
+
+    html = ''.join(html_parts).replace('\n', '<br>\n')
+    html += f'\n<img src="{escape(open_url(mailing, recipient))}" width="1" height="1" alt="">'
+    return ''.join(text_parts), html
+
+
+# -------- БУФЕРЫ СОБЫТИЙ --------
+
+class MemoryBuffer:
+    """
+    Буфер событий в памяти процесса.
+
+    Подходит для разработки и тестов: потребитель должен работать в том же
+    процессе, что и эндпоинты. События общие для всех экземпляров.
+    """
+    _events = deque()
+    _pending = {}
+    _ids = count(1)
+    _lock = threading.Lock()
+
+    def __init__(self, **options):
+        pass
+
+    def append(self, event):
+        self._events.append(event)
+
+    def claim(self, count):
+        """
+        Забирает до count событий. Возвращает [(id, событие)]; до ack() они считаются в обработке.
+        """
+        claimed = []
+        with self._lock:
+            while self._events and len(claimed) < count:
+                event_id = next(self._ids)
+                event = self._events.popleft()
+                self._pending[event_id] = event
+                claimed.append((event_id, event))
+        return claimed
+
+    def ack(self, ids):
+        with self._lock:
+            for event_id in ids:
+                self._pending.pop(event_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._pending.clear()
+
+
+class RedisStreamBuffer:
+    """
+    Буфер событий в потоке Redis (XADD / XREADGROUP / XACK).
+
+    Потребители читают через группу, поэтому их может быть несколько.
+    События, взятые упавшим потребителем и не подтверждённые за CLAIM_IDLE
+    миллисекунд, забираются заново (XAUTOCLAIM). Длина потока ограничена
+    MAXLEN (приблизительно), чтобы при остановленном потребителе Redis не рос без предела.
+    """
+
+    def __init__(self, location, stream='mailing:tracking', group='tracking', maxlen=1_000_000, claim_idle=60_000):
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.stream = stream
+        self.group = group
+        self.maxlen = maxlen
+        self.claim_idle = claim_idle
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        self._group_ready = False
+
+    def append(self, event):
+        self.client.xadd(self.stream, event, maxlen=self.maxlen, approximate=True)
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        import redis
+
+        try:
+            self.client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def claim(self, count):
+        self._ensure_group()
+        entries = self.client.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle, start_id='0-0', count=count,
+        )[1]
+        if not entries:
+            response = self.client.xreadgroup(self.group, self.consumer, {self.stream: '>'}, count=count)
+            entries = response[0][1] if response else []
+        return [
+            (entry_id, {key.decode(): value.decode() for key, value in fields.items()})
+            for entry_id, fields in entries
+            if fields
+        ]
+
+    def ack(self, ids):
+        if not ids:
+            return
+        pipe = self.client.pipeline()
+        pipe.xack(self.stream, self.group, *ids)
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+
+
+_buffers = {}
+
+
+def get_buffer():
+    """
+    Буфер из настройки TRACKING_BUFFER ({'BACKEND': путь к классу, остальное — параметры}).
+    """
+    options = dict(settings.TRACKING_BUFFER)
+    backend = options.pop('BACKEND')
+    key = (backend, tuple(sorted(options.items())))
+    if key not in _buffers:
+        _buffers[key] = import_string(backend)(**{name.lower(): value for name, value in options.items()})
+    return _buffers[key]
+
+
+def record_event(kind, mailing_id, recipient_id, url=None):
+    """
+    Дописывает событие в буфер. Ошибка буфера не должна ломать переход по ссылке,
+    поэтому она только пишется в лог.
+    """
+    event = {
+        'kind': kind,
+        'mailing': str(mailing_id),
+        'recipient': str(recipient_id),
+        'url': url or '',
+        'ts': repr(time.time()),
+    }
+    try:
+        get_buffer().append(event)
+    except Exception:
+        logger.exception('Не удалось записать событие отслеживания')
+
+
+# -------- ПОТРЕБИТЕЛЬ --------
+
+def save_events(events):
+    """
+    Сохраняет пачку событий одним bulk_create и обновляет счётчики рассылок.
+
+    События удалённых (в том числе помеченных) рассылок и получателей отбрасываются.
+    Возвращает число сохранённых событий.
+    """
+    mailing_ids = {int(event['mailing']) for event in events}
+    recipient_ids = {int(event['recipient']) for event in events}
+    mailing_ids = set(Mailing.objects.filter(pk__in=mailing_ids).values_list('pk', flat=True))
+    recipient_ids = set(Recipient.objects.filter(pk__in=recipient_ids).values_list('pk', flat=True))
+
+    rows = []
+    counters = Counter()
+    last_event_at = {}
+    for event in events:
+        mailing_id, recipient_id = int(event['mailing']), int(event['recipient'])
+        if event['kind'] not in COUNTER_FIELDS or mailing_id not in mailing_ids or recipient_id not in recipient_ids:
+            continue
+        created_at = datetime.fromtimestamp(float(event['ts']), tz=dt_timezone.utc)
+        rows.append(TrackingEvent(
+            mailing_id=mailing_id, recipient_id=recipient_id,
+            kind=event['kind'], url=event.get('url', ''), created_at=created_at,
+        ))
+        counters[mailing_id, event['kind']] += 1
+        last_event_at[mailing_id] = max(created_at, last_event_at.get(mailing_id, created_at))
+
+    with transaction.atomic():
+        TrackingEvent.objects.bulk_create(rows, batch_size=settings.TRACKING_BATCH_SIZE)
+        for mailing_id, last in last_event_at.items():
+            MailingEngagement.add(
+                mailing_id,
+                last_event_at=last,
+                **{field: counters[mailing_id, kind] for kind, field in COUNTER_FIELDS.items()},
+            )
+    return len(rows)
+
+
+def consume_events(batch_size=None, max_batches=100):
+    """
+    Обрабатывает события из буфера пачками по batch_size (TRACKING_BATCH_SIZE).
+
+    Пачка подтверждается только после сохранения. Не больше max_batches пачек
+    за вызов, чтобы задача завершалась и при непрерывном потоке событий.
+    Возвращает число сохранённых событий.
+    """
+    buffer = get_buffer()
+    batch_size = batch_size or settings.TRACKING_BATCH_SIZE
+    saved = 0
+    for _ in range(max_batches):
+        claimed = buffer.claim(batch_size)
+        if not claimed:
+            break
+        saved += save_events([event for _, event in claimed])
+        buffer.ack([event_id for event_id, _ in claimed])
+    return saved
@@ -4,7 +4,9 @@ from . import views
 from .views import (
     MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView,
     MailingListView, MailingDetailView, MailingCreateView, MailingUpdateView, MailingDeleteView,
-    AttemptListView, LaunchMailingView, ToggleMailingStatusView, MailingStatsView
+    MailingAudienceView,
+    AttemptListView, LaunchMailingView, ToggleMailingStatusView, MailingStatsView,
+    AttemptExportView, MailingReportExportView,
 )
 
 from .views import (
@@ -12,6 +14,18 @@ from .views import (
     RecipientCreateView,
     RecipientUpdateView,
     RecipientDeleteView,
+    RecipientSearchView,
+    RecipientImportCreateView,
+    RecipientImportDetailView,
+    RecipientImportErrorsView,
+    SegmentListView,
+    SegmentCreateView,
+    SegmentUpdateView,
+    SegmentDeleteView,
+    MailingQueueStatsView,
+    TrackOpenView,
+    TrackClickView,
+    MetricsView,
 )
 
 app_name = 'mailing'
@@ -23,6 +37,17 @@ urlpatterns = [
     path('recipients/create/', RecipientCreateView.as_view(), name='recipient_create'),
     path('recipients/<int:pk>/update/', RecipientUpdateView.as_view(), name='recipient_update'),
     path('recipients/<int:pk>/delete/', RecipientDeleteView.as_view(), name='recipient_delete'),
+    path('recipients/search/', RecipientSearchView.as_view(), name='recipient_search'),
+    path('recipients/import/', RecipientImportCreateView.as_view(), name='recipient_import'),
+    path('recipients/import/<int:pk>/', RecipientImportDetailView.as_view(), name='recipient_import_detail'),
+    path('recipients/import/<int:pk>/errors/', RecipientImportErrorsView.as_view(), name='recipient_import_errors'),
+
+
+    # SEGMENTS
+    path('segments/', SegmentListView.as_view(), name='segment_list'),
+    path('segments/create/', SegmentCreateView.as_view(), name='segment_create'),
+    path('segments/<int:pk>/update/', SegmentUpdateView.as_view(), name='segment_update'),
+    path('segments/<int:pk>/delete/', SegmentDeleteView.as_view(), name='segment_delete'),
 
 
     # MESSAGE
@@ -38,16 +63,27 @@ urlpatterns = [
     path('mailings/<int:pk>/', MailingDetailView.as_view(), name='mailing-detail'),
     path('mailings/<int:pk>/update/', MailingUpdateView.as_view(), name='mailing-update'),
     path('mailings/<int:pk>/delete/', MailingDeleteView.as_view(), name='mailing-delete'),
+    path('mailings/<int:pk>/audience/', MailingAudienceView.as_view(), name='mailing-audience'),
     path('mailings/<int:pk>/launch/', LaunchMailingView.as_view(), name='mailing-launch'),
+    path('mailings/queues/', MailingQueueStatsView.as_view(), name='mailing-queue-stats'),
 
     path('mailings/', MailingListView.as_view(), name='mailing-list'),
     path('<int:pk>/stats/', MailingStatsView.as_view(), name='mailing-stats'),
+    path('mailings/report/export/', MailingReportExportView.as_view(), name='mailing-report-export'),
 
     path('<int:pk>/', views.MailingDetailView.as_view(), name='mailing-detail'),
     path('<int:pk>/launch/', LaunchMailingView.as_view(), name='mailing-launch'),
 
     # ATTEMPTS
     path('attempts/', AttemptListView.as_view(), name='attempt-list'),
+    path('attempts/export/', AttemptExportView.as_view(), name='attempt-export'),
+
+    # TRACKING
+    path('t/o/<str:token>/', TrackOpenView.as_view(), name='track-open'),
+    path('t/c/<str:token>/', TrackClickView.as_view(), name='track-click'),
+
+    # METRICS
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
     path('', HomeView.as_view(), name='home'),
     path('<int:pk>/toggle-status/', ToggleMailingStatusView.as_view(), name='mailing-toggle-status'),
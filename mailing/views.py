@@ -1,19 +1,37 @@
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, View
+from django.db.models import Count, Max, OuterRef, ProtectedError, Q, Subquery
+from django.db import transaction
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, FormView, View
+from django.views.generic.detail import SingleObjectMixin
+from django.views.generic.list import MultipleObjectMixin
 from django.urls import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
-from django.core.mail import send_mail
-from django.conf import settings
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 import pytz
 from django.views.generic import TemplateView
-from django.utils.decorators import method_decorator
 
 from .models import Message, Mailing, Attempt
-from .models import Recipient
+from .models import Recipient, RecipientImport, Segment, UserCounters
+from .services import reject_mailing
+from .scheduling import dispatch, queue_stats
+from . import audience, metrics
+from .deletion import soft_delete
+from .forms import ExportFilterForm, MailingAudienceForm, MailingForm, RecipientForm, RecipientImportForm, SegmentForm
+from .exports import stream_export
+from .cache import list_cache_key, cached_page
+from .tasks import import_recipients_task
+from .tracking import PIXEL, parse_token, record_event
 
-from django.views.decorators.cache import cache_page
+RECIPIENT_PREVIEW_SIZE = 50
 
 
 class OwnerOrManagerMixin:
@@ -22,6 +40,7 @@ class OwnerOrManagerMixin:
 
     Менеджеры видят все объекты.
     Обычные пользователи — только свои (по полю owner).
+    Роль берётся из user.is_manager (один раз на запрос, с кэшем в Redis).
     """
     owner_lookup = "owner"
 
@@ -30,7 +49,7 @@ class OwnerOrManagerMixin:
         user = self.request.user
 
         # Менеджер — видит всё
-        if user.groups.filter(name="Менеджеры").exists():
+        if user.is_manager:
             return qs
 
         # Обычный пользователь
@@ -44,11 +63,124 @@ class ManagerForbiddenMixin:
     Если пользователь в группе 'Менеджеры', вызывает handle_no_permission().
     """
     def dispatch(self, request, *args, **kwargs):
-        if request.user.groups.filter(name="Менеджеры").exists():
+        if request.user.is_authenticated and request.user.is_manager:
             return self.handle_no_permission()
         return super().dispatch(request, *args, **kwargs)
 
 
+class OwnerFormMixin:
+    """
+    Миксин для Create/UpdateView: передаёт форме текущего пользователя как владельца,
+    чтобы списки выбора (сообщения, получатели, сегменты, теги) содержали только его объекты.
+
+    Изменять чужие объекты могут только менеджеры, а им редактирование запрещено
+    (ManagerForbiddenMixin), поэтому владелец объекта — всегда текущий пользователь.
+    """
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['owner'] = self.request.user
+        return kwargs
+
+
+class SoftDeleteMixin:
+    """
+    Миксин для DeleteView рассылок и получателей: вместо каскадного удаления
+    помечает объект удалённым, а историю попыток удаляет фоновая задача
+    (см. mailing.deletion).
+    """
+
+    def form_valid(self, form):
+        soft_delete(self.object)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class KeysetPaginationMixin:
+    """
+    Миксин постраничного вывода по ключу (keyset) вместо OFFSET.
+
+    Объекты сортируются по убыванию pk. ?after=<pk> открывает следующую страницу,
+    ?before=<pk> — предыдущую. Страница выбирается одним запросом с LIMIT page_size + 1,
+    без OFFSET и без COUNT, поэтому её стоимость не зависит от размера таблицы.
+    """
+    page_size = 50
+
+    def get_context_data(self, **kwargs):
+        queryset = kwargs.pop('object_list', self.object_list)
+        page, has_previous, has_next = self.paginate_keyset(queryset)
+
+        kwargs['object_list'] = page
+        kwargs['has_previous'] = has_previous
+        kwargs['has_next'] = has_next
+        kwargs['previous_query'] = self.cursor_query('before', page[0].pk) if has_previous and page else ''
+        kwargs['next_query'] = self.cursor_query('after', page[-1].pk) if has_next and page else ''
+        return super().get_context_data(**kwargs)
+
+    def get_cursor(self, name):
+        try:
+            return int(self.request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    def cursor_query(self, name, value):
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[name] = value
+        return query.urlencode()
+
+    def paginate_keyset(self, queryset):
+        after = self.get_cursor('after')
+        before = self.get_cursor('before')
+        size = self.page_size
+
+        if before is not None:
+            page = list(queryset.filter(pk__gt=before).order_by('pk')[:size + 1])
+            has_previous = len(page) > size
+            page = page[:size][::-1]
+            return page, has_previous, True
+
+        if after is not None:
+            queryset = queryset.filter(pk__lt=after)
+        page = list(queryset.order_by('-pk')[:size + 1])
+        return page[:size], after is not None, len(page) > size
+
+
+class SearchMixin:
+    """
+    Миксин поиска в списках: ?q= фильтрует queryset методом search() (см. SearchQuerySet).
+
+    Поисковый запрос входит в параметры страницы, поэтому учитывается
+    в курсорах пагинации и в ключе кэша списка.
+    """
+
+    def get_search_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        return super().get_queryset().search(self.get_search_query())
+
+    def get_context_data(self, **kwargs):
+        kwargs['search_query'] = self.get_search_query()
+        return super().get_context_data(**kwargs)
+
+
+class OwnerCachedListMixin:
+    """
+    Миксин кэширования страниц списка по владельцу.
+
+    Кэшируется результат paginate_keyset (объекты страницы и флаги навигации),
+    а не HTML, поэтому CSRF-токены и сообщения не попадают в кэш. Ключ включает
+    пользователя (или общую область менеджеров) и версии моделей из cache_models,
+    которые увеличиваются сигналами при любом изменении (см. mailing.cache).
+    """
+    cache_models = ()
+
+    def paginate_keyset(self, queryset):
+        key = list_cache_key(self.request, type(self).__name__, self.cache_models, self.request.user.is_manager)
+        return cached_page(key, partial(super().paginate_keyset, queryset))
+
+
 class ToggleMailingStatusView(LoginRequiredMixin, View):
     """
     Вьюха для переключения статуса активности рассылки.
@@ -59,7 +191,7 @@ class ToggleMailingStatusView(LoginRequiredMixin, View):
     """
     def post(self, request, pk):
         user = request.user
-        if not user.groups.filter(name="Менеджеры").exists():
+        if not user.is_manager:
             messages.error(request, "Доступ запрещен.")
             return redirect("mailing:mailing-list")
 
@@ -78,16 +210,19 @@ class ToggleMailingStatusView(LoginRequiredMixin, View):
 
 
 # -------- MESSAGE --------
-@method_decorator(cache_page(60 * 10), name='dispatch')
-class MessageListView(LoginRequiredMixin, OwnerOrManagerMixin, ListView):
+class MessageListView(
+    LoginRequiredMixin, OwnerOrManagerMixin, SearchMixin, OwnerCachedListMixin, KeysetPaginationMixin, ListView,
+):
     """
     Список сообщений рассылки.
 
     Менеджеры видят все сообщения.
     Обычные пользователи — только свои.
+    Выводится постранично по ключу, ?q= ищет по теме.
     """
     model = Message
     template_name = 'mailing/message_list.html'
+    cache_models = ('mailing.message',)
 
 
 class MessageCreateView(LoginRequiredMixin, CreateView):
@@ -132,21 +267,27 @@ class MessageDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbidde
 
 
 # -------- MAILING --------
-@method_decorator(cache_page(60 * 10), name='dispatch')
-class MailingListView(LoginRequiredMixin, OwnerOrManagerMixin, ListView):
+class MailingListView(
+    LoginRequiredMixin, OwnerOrManagerMixin, SearchMixin, OwnerCachedListMixin, KeysetPaginationMixin, ListView,
+):
     """
     Список всех рассылок.
 
     Менеджеры видят все, пользователи — только свои.
+    Выводится постранично по ключу, сообщение подгружается тем же запросом.
+    ?q= ищет по теме сообщения.
     В контекст передаётся флаг is_manager.
     """
     model = Mailing
     template_name = 'mailing/mailing_list.html'
+    cache_models = ('mailing.mailing', 'mailing.message')
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('message')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        context['is_manager'] = user.groups.filter(name="Менеджеры").exists()
+        context['is_manager'] = self.request.user.is_manager
         return context
 
 
@@ -154,20 +295,25 @@ class MailingDetailView(LoginRequiredMixin, OwnerOrManagerMixin, DetailView):
     """
     Детали конкретной рассылки.
 
-    Обновляет статус рассылки при открытии.
+    Статус вычисляется по расписанию при выводе (Mailing.current_status), страница ничего не записывает.
     Добавляет флаг is_manager в контекст.
     """
     model = Mailing
     template_name = 'mailing/mailing_detail.html'
 
-    def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        obj.update_status()
-        return obj
+    def get_queryset(self):
+        return super().get_queryset().select_related('message', 'segment')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['is_manager'] = self.request.user.groups.filter(name="Менеджеры").exists()
+        context['is_manager'] = self.request.user.is_manager
+        if not self.object.segment_id:
+            # Список получателей может быть очень большим, выводится только начало
+            preview = list(self.object.recipients.all()[:RECIPIENT_PREVIEW_SIZE])
+            count = self.object.recipients.count() if len(preview) == RECIPIENT_PREVIEW_SIZE else len(preview)
+            context['recipient_preview'] = preview
+            context['recipient_count'] = count
+            context['recipient_more'] = count - len(preview)
         return context
 
 
@@ -185,36 +331,42 @@ class MailingStatsView(LoginRequiredMixin, DetailView):
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name="Менеджеры").exists():
-            return Mailing.objects.all()
-        return Mailing.objects.filter(owner=user)
+        if user.is_manager:
+            return Mailing.objects.select_related('message', 'segment', 'engagement')
+        return Mailing.objects.filter(owner=user).select_related('message', 'segment', 'engagement')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        mailing = self.get_object()
+        mailing = self.object
 
         attempts = Attempt.objects.filter(mailing=mailing)
 
-        recipient_status = {}
-        for recipient in mailing.recipients.all():
-            last_attempt = attempts.filter(recipient=recipient).order_by('-attempt_time').first()
-            recipient_status[recipient] = last_attempt.status if last_attempt else '—'
-
-        context['recipient_status'] = recipient_status
-        context['success_count'] = attempts.filter(status='Успешно').count()
-        context['fail_count'] = attempts.filter(status='Не успешно').count()
+        # Статус последней попытки подтягивается подзапросом по индексу
+        # attempt_mailing_recip_time_idx, а не отдельным запросом на получателя
+        last_status = attempts.filter(recipient=OuterRef('pk')).order_by('-attempt_time').values('status')[:1]
+        recipients = mailing.audience().annotate(last_status=Subquery(last_status))
+        context['recipient_status'] = {
+            recipient: recipient.last_status or '—' for recipient in recipients
+        }
+
+        totals = attempts.aggregate(
+            success_count=Count('pk', filter=Q(status='Успешно')),
+            fail_count=Count('pk', filter=Q(status='Не успешно')),
+        )
+        context.update(totals)
 
         return context
 
 
-class MailingCreateView(LoginRequiredMixin, CreateView):
+class MailingCreateView(LoginRequiredMixin, OwnerFormMixin, CreateView):
     """
     Создание новой рассылки.
 
     Привязывает рассылку к текущему пользователю.
+    Аудитория задаётся сегментом или явным списком получателей.
     """
     model = Mailing
-    fields = ['start_time', 'end_time', 'message', 'recipients']
+    form_class = MailingForm
     template_name = 'mailing/mailing_form.html'
     success_url = reverse_lazy('mailing:mailing-list')
 
@@ -223,7 +375,7 @@ class MailingCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class MailingUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, UpdateView):
+class MailingUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, OwnerFormMixin, UpdateView):
     """
     Редактирование рассылки.
 
@@ -231,15 +383,66 @@ class MailingUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbidde
     Пользователи могут редактировать только свои рассылки.
     """
     model = Mailing
-    fields = ['start_time', 'end_time', 'message', 'recipients']
+    form_class = MailingForm
     template_name = 'mailing/mailing_form.html'
     success_url = reverse_lazy('mailing:mailing-list')
 
 
-class MailingDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, DeleteView):
+class MailingAudienceView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, SingleObjectMixin, FormView):
+    """
+    Пакетное изменение списка получателей рассылки.
+
+    Каждое действие выполняется одним SQL-запросом (см. mailing.audience),
+    поэтому подходит для аудиторий любого размера.
+    Для рассылок по сегменту недоступно: их аудитория задаётся сегментом.
+    Менеджерам запрещено.
+    """
+    model = Mailing
+    form_class = MailingAudienceForm
+    template_name = 'mailing/mailing_audience.html'
+
+    ACTIONS = {
+        'add_all': lambda mailing, data: audience.add_all(mailing),
+        'add_matching': lambda mailing, data: audience.add_matching(mailing, data['query']),
+        'add_segment': lambda mailing, data: audience.add_segment(mailing, data['segment']),
+        'copy_from': lambda mailing, data: audience.copy_from(mailing, data['source']),
+        'remove_matching': lambda mailing, data: audience.remove_matching(mailing, data['query']),
+        'clear': lambda mailing, data: audience.clear(mailing),
+    }
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and not request.user.is_manager:
+            self.object = self.get_object()
+            if self.object.segment_id:
+                messages.error(request, 'Аудитория рассылки задана сегментом.')
+                return redirect('mailing:mailing-detail', pk=self.object.pk)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['owner'] = self.request.user
+        kwargs['mailing'] = self.object
+        return kwargs
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('recipient_count', self.object.recipients.count())
+        return super().get_context_data(**kwargs)
+
+    def form_valid(self, form):
+        action = form.cleaned_data['action']
+        changed = self.ACTIONS[action](self.object, form.cleaned_data)
+        if action in ('remove_matching', 'clear'):
+            messages.success(self.request, f'Исключено получателей: {changed}.')
+        else:
+            messages.success(self.request, f'Добавлено получателей: {changed}.')
+        return redirect('mailing:mailing-detail', pk=self.object.pk)
+
+
+class MailingDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, SoftDeleteMixin, DeleteView):
     """
     Удаление рассылки.
 
+    Рассылка сразу пропадает из списков, попытки удаляются в фоне.
     Менеджерам удаление запрещено.
     Пользователи могут удалять только свои рассылки.
     """
@@ -249,17 +452,135 @@ class MailingDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbidde
 
 
 # -------- ATTEMPT --------
-@method_decorator(cache_page(15), name='dispatch')
-class AttemptListView(LoginRequiredMixin, OwnerOrManagerMixin, ListView):
+class AttemptListView(LoginRequiredMixin, OwnerOrManagerMixin, OwnerCachedListMixin, KeysetPaginationMixin, ListView):
     """
     Список попыток отправки сообщений (Attempt).
 
     Показывает только те попытки, которые относятся к рассылкам текущего пользователя.
     Менеджеры видят всё.
+    Выводится постранично по ключу; рассылка, её сообщение и получатель
+    подгружаются тем же запросом.
     """
     model = Attempt
     template_name = 'mailing/attempt_list.html'
+    cache_models = ('mailing.attempt', 'mailing.mailing', 'mailing.message', 'mailing.recipient')
+    owner_lookup = "mailing__owner"
+
+    def get_queryset(self):
+        return super().get_queryset().visible().select_related('mailing__message', 'recipient')
+
+
+class ExportMixin(LoginRequiredMixin, OwnerOrManagerMixin, MultipleObjectMixin):
+    """
+    Общая часть потоковых выгрузок.
+
+    Проверяет фильтры из GET-параметров формой ExportFilterForm и переводит
+    период в границы по времени, чтобы фильтр шёл по индексу, а не по функции от даты.
+    """
+    filename = 'export'
+    columns = ()
+
+    def get(self, request, *args, **kwargs):
+        form = ExportFilterForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain; charset=utf-8')
+
+        queryset = self.filter_queryset(self.get_queryset(), form.cleaned_data)
+        return stream_export(queryset, self.columns, form.cleaned_data['format'], self.filename)
+
+    def filter_queryset(self, queryset, filters):
+        """
+        Применяет фильтры и возвращает values_list с полями в порядке columns.
+
+        По умолчанию фильтры не применяются, а columns — имена полей модели.
+        Наследники переопределяют метод, если фильтры относятся к связанным таблицам.
+        """
+        return queryset.order_by('pk').values_list(*self.columns)
+
+    @staticmethod
+    def period_bounds(filters):
+        tz = timezone.get_current_timezone()
+        start = end = None
+        if filters.get('date_from'):
+            start = timezone.make_aware(datetime.combine(filters['date_from'], time.min), tz)
+        if filters.get('date_to'):
+            end = timezone.make_aware(datetime.combine(filters['date_to'] + timedelta(days=1), time.min), tz)
+        return start, end
+
+
+class AttemptExportView(ExportMixin, View):
+    """
+    Потоковая выгрузка попыток отправки в CSV или NDJSON.
+
+    Фильтры: mailing, owner, date_from, date_to, status.
+    Пользователи выгружают только попытки своих рассылок, менеджеры — все.
+    """
+    model = Attempt
     owner_lookup = "mailing__owner"
+    filename = 'attempts'
+    columns = (
+        'id', 'attempt_time', 'status', 'server_response',
+        'mailing_id', 'subject', 'recipient_email', 'owner_email',
+    )
+
+    def filter_queryset(self, queryset, filters):
+        queryset = queryset.visible()
+        if filters.get('mailing'):
+            queryset = queryset.filter(mailing_id=filters['mailing'])
+        if filters.get('owner'):
+            queryset = queryset.filter(mailing__owner_id=filters['owner'])
+        if filters.get('status'):
+            queryset = queryset.filter(status=filters['status'])
+
+        start, end = self.period_bounds(filters)
+        if start:
+            queryset = queryset.filter(attempt_time__gte=start)
+        if end:
+            queryset = queryset.filter(attempt_time__lt=end)
+
+        return queryset.order_by('pk').values_list(
+            'id', 'attempt_time', 'status', 'server_response',
+            'mailing_id', 'mailing__message__subject', 'recipient__email', 'mailing__owner__email',
+        )
+
+
+class MailingReportExportView(ExportMixin, View):
+    """
+    Потоковая выгрузка отчёта по рассылкам: число успешных и неуспешных попыток
+    и время последней попытки за выбранный период.
+
+    Фильтры: mailing, owner, date_from, date_to, status (учитываются только попытки с этим статусом).
+    """
+    model = Mailing
+    filename = 'mailings_report'
+    columns = (
+        'id', 'subject', 'owner_email', 'start_time', 'end_time', 'is_active',
+        'success_count', 'fail_count', 'last_attempt_time',
+    )
+
+    def filter_queryset(self, queryset, filters):
+        if filters.get('mailing'):
+            queryset = queryset.filter(pk=filters['mailing'])
+        if filters.get('owner'):
+            queryset = queryset.filter(owner_id=filters['owner'])
+
+        attempts = Q()
+        start, end = self.period_bounds(filters)
+        if start:
+            attempts &= Q(attempt__attempt_time__gte=start)
+        if end:
+            attempts &= Q(attempt__attempt_time__lt=end)
+        if filters.get('status'):
+            attempts &= Q(attempt__status=filters['status'])
+
+        return queryset.order_by('pk').annotate(
+            success_count=Count('attempt', filter=attempts & Q(attempt__status='Успешно')),
+            fail_count=Count('attempt', filter=attempts & Q(attempt__status='Не успешно')),
+            last_attempt_time=Max('attempt__attempt_time', filter=attempts),
+        ).values_list(
+            'id', 'message__subject', 'owner__email', 'start_time', 'end_time', 'is_active',
+            'success_count', 'fail_count', 'last_attempt_time',
+        )
 
 
 # -------- MAILING LAUNCH --------
@@ -270,22 +591,23 @@ class LaunchMailingView(LoginRequiredMixin, View):
 
     - Менеджерам запуск запрещён.
     - Запрещает запуск неактивных рассылок.
-    - Отправляет письма получателям, если текущее время в допустимом интервале.
+    - Если текущее время в допустимом интервале, ставит отправку в очередь приоритета
+      рассылки (mailing.scheduling): письма уходят частями в фоновой задаче.
     - Создаёт записи Attempt для всех попыток (успешных и неуспешных).
     """
     def post(self, request, pk):
         user = request.user
 
         # Выбор queryset в зависимости от роли
-        if user.groups.filter(name="Менеджеры").exists():
+        if user.is_manager:
             qs = Mailing.objects.all()
         else:
             qs = Mailing.objects.filter(owner=user)
 
-        mailing = get_object_or_404(qs, pk=pk)
+        mailing = get_object_or_404(qs.select_related('message', 'segment'), pk=pk)
 
         # Запрет менеджерам на запуск рассылки
-        if user.groups.filter(name="Менеджеры").exists():
+        if user.is_manager:
             messages.error(request, "Менеджерам запрещено запускать рассылки.")
             return redirect("mailing:mailing-detail", pk=pk)
 
@@ -302,62 +624,51 @@ class LaunchMailingView(LoginRequiredMixin, View):
         end_time = mailing.end_time.astimezone(moscow_tz)
 
         if start_time <= now <= end_time:
-            for recipient in mailing.recipients.all():
-                try:
-                    send_mail(
-                        mailing.message.subject,
-                        mailing.message.body,
-                        settings.EMAIL_HOST_USER,
-                        [recipient.email],
-                        fail_silently=False,
-                    )
-                    Attempt.objects.create(
-                        mailing=mailing,
-                        recipient=recipient,
-                        status='Успешно',
-                        server_response='OK'
-                    )
-                except Exception as e:
-                    Attempt.objects.create(
-                        mailing=mailing,
-                        recipient=recipient,
-                        status='Не успешно',
-                        server_response=str(e)
-                    )
+            # Отправка идёт в фоне, в очереди приоритета рассылки (mailing.scheduling)
+            dispatch(mailing)
             messages.success(request, 'Рассылка запущена.')
         else:
-            for recipient in mailing.recipients.all():
-                Attempt.objects.create(
-                    mailing=mailing,
-                    recipient=recipient,
-                    status='Не успешно',
-                    server_response='Рассылка вне допустимого временного интервала'
-                )
+            reject_mailing(mailing, 'Рассылка вне допустимого временного интервала')
             messages.error(request, 'Рассылка вне допустимого временного интервала.')
 
         return redirect('mailing:mailing-detail', pk=pk)
 
 
+class MailingQueueStatsView(LoginRequiredMixin, View):
+    """
+    Глубина очередей отправки и время ожидания задач по приоритетам (JSON).
+
+    Доступна только менеджерам.
+    """
+    def get(self, request):
+        if not request.user.is_manager:
+            raise PermissionDenied
+        return JsonResponse(queue_stats())
+
+
 # -------- RECIPIENT --------
-@method_decorator(cache_page(60 * 10), name='dispatch')
-class RecipientListView(LoginRequiredMixin, OwnerOrManagerMixin, ListView):
+class RecipientListView(
+    LoginRequiredMixin, OwnerOrManagerMixin, SearchMixin, OwnerCachedListMixin, KeysetPaginationMixin, ListView,
+):
     """
     Список получателей рассылки.
 
     Менеджеры видят всех, пользователи — только своих.
+    Выводится постранично по ключу, ?q= ищет по email и имени.
     """
     model = Recipient
     template_name = 'mailing/recipient_list.html'
+    cache_models = ('mailing.recipient',)
 
 
-class RecipientCreateView(LoginRequiredMixin, CreateView):
+class RecipientCreateView(LoginRequiredMixin, OwnerFormMixin, CreateView):
     """
     Создание нового получателя рассылки.
 
     Автоматически назначает текущего пользователя как владельца.
     """
     model = Recipient
-    fields = ['email', 'full_name', 'comment']
+    form_class = RecipientForm
     template_name = 'mailing/recipient_form.html'
     success_url = reverse_lazy('mailing:recipient_list')
 
@@ -366,7 +677,7 @@ class RecipientCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class RecipientUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, UpdateView):
+class RecipientUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, OwnerFormMixin, UpdateView):
     """
     Редактирование получателя.
 
@@ -374,15 +685,16 @@ class RecipientUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbid
     Пользователи могут редактировать только своих получателей.
     """
     model = Recipient
-    fields = ['email', 'full_name', 'comment']
+    form_class = RecipientForm
     template_name = 'mailing/recipient_form.html'
     success_url = reverse_lazy('mailing:recipient_list')
 
 
-class RecipientDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, DeleteView):
+class RecipientDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, SoftDeleteMixin, DeleteView):
     """
     Удаление получателя.
 
+    Получатель сразу пропадает из списков и рассылок, попытки удаляются в фоне.
     Менеджерам удаление запрещено.
     Пользователи могут удалять только своих.
     """
@@ -391,14 +703,213 @@ class RecipientDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbid
     success_url = reverse_lazy('mailing:recipient_list')
 
 
+class RecipientSearchView(LoginRequiredMixin, View):
+    """
+    Поиск своих получателей для выбора в форме рассылки (JSON).
+
+    ?q= — начало email или имени, ?after=<pk> — следующая страница.
+    Ответ: {"results": [{"id", "text"}], "next": <pk для ?after> или null}.
+    Страница выбирается одним запросом по ключу, без OFFSET и COUNT.
+    """
+    page_size = 20
+
+    def get(self, request):
+        recipients = Recipient.objects.filter(owner=request.user).search_prefix(request.GET.get('q', ''))
+        try:
+            recipients = recipients.filter(pk__lt=int(request.GET['after']))
+        except (KeyError, ValueError):
+            pass
+
+        page = list(recipients.order_by('-pk').values_list('pk', 'email', 'full_name')[:self.page_size + 1])
+        has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        return JsonResponse({
+            'results': [{'id': pk, 'text': f'{full_name} ({email})'} for pk, email, full_name in page],
+            'next': page[-1][0] if has_next else None,
+        })
+
+
+class RecipientImportCreateView(LoginRequiredMixin, CreateView):
+    """
+    Загрузка файла для массового импорта получателей.
+
+    Файл обрабатывается в фоне задачей Celery после фиксации транзакции,
+    пользователь перенаправляется на страницу прогресса.
+    """
+    model = RecipientImport
+    form_class = RecipientImportForm
+    template_name = 'mailing/recipient_import_form.html'
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        response = super().form_valid(form)
+        transaction.on_commit(partial(import_recipients_task.delay, self.object.pk))
+        return response
+
+    def get_success_url(self):
+        return reverse_lazy('mailing:recipient_import_detail', kwargs={'pk': self.object.pk})
+
+
+class RecipientImportDetailView(LoginRequiredMixin, OwnerOrManagerMixin, DetailView):
+    """
+    Прогресс и итоги импорта получателей.
+
+    Пока импорт не завершён, страница обновляется сама.
+    """
+    model = RecipientImport
+    template_name = 'mailing/recipient_import_detail.html'
+
+
+class RecipientImportErrorsView(LoginRequiredMixin, OwnerOrManagerMixin, SingleObjectMixin, View):
+    """
+    Скачивание отчёта об отклонённых строках импорта.
+
+    Отдаётся через вьюху, а не по ссылке на media, чтобы проверить владельца.
+    """
+    model = RecipientImport
+
+    def get(self, request, *args, **kwargs):
+        recipient_import = self.get_object()
+        if not recipient_import.error_report:
+            raise Http404('Отчёт об ошибках отсутствует')
+        return FileResponse(
+            recipient_import.error_report.open('rb'),
+            as_attachment=True,
+            filename=f'import_{recipient_import.pk}_errors.csv',
+            content_type='text/csv; charset=utf-8',
+        )
+
+
+# -------- SEGMENT --------
+class SegmentListView(LoginRequiredMixin, OwnerOrManagerMixin, KeysetPaginationMixin, ListView):
+    """
+    Список сохранённых сегментов.
+
+    Менеджеры видят все, пользователи — только свои.
+    """
+    model = Segment
+    template_name = 'mailing/segment_list.html'
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related('tags')
+
+
+class SegmentCreateView(LoginRequiredMixin, OwnerFormMixin, CreateView):
+    """
+    Создание сегмента.
+
+    Автоматически назначает текущего пользователя как владельца.
+    """
+    model = Segment
+    form_class = SegmentForm
+    template_name = 'mailing/segment_form.html'
+    success_url = reverse_lazy('mailing:segment_list')
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+
+class SegmentUpdateView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, OwnerFormMixin, UpdateView):
+    """
+    Редактирование сегмента.
+
+    Изменения действуют со следующей отправки использующих его рассылок.
+    Менеджерам изменение запрещено.
+    """
+    model = Segment
+    form_class = SegmentForm
+    template_name = 'mailing/segment_form.html'
+    success_url = reverse_lazy('mailing:segment_list')
+
+
+class SegmentDeleteView(LoginRequiredMixin, OwnerOrManagerMixin, ManagerForbiddenMixin, DeleteView):
+    """
+    Удаление сегмента.
+
+    Сегмент, на который ссылаются рассылки, удалить нельзя.
+    Менеджерам удаление запрещено.
+    """
+    model = Segment
+    template_name = 'mailing/segment_confirm_delete.html'
+    success_url = reverse_lazy('mailing:segment_list')
+
+    def form_valid(self, form):
+        # Помеченные удалёнными рассылки ещё ссылаются на сегмент до фонового удаления
+        Mailing.all_objects.filter(segment=self.object, is_deleted=True).update(segment=None)
+        try:
+            return super().form_valid(form)
+        except ProtectedError:
+            messages.error(self.request, 'Сегмент используется в рассылках и не может быть удалён.')
+            return redirect('mailing:segment_list')
+
+
+# -------- TRACKING --------
+class TrackOpenView(View):
+    """
+    Пиксель открытия письма.
+
+    Проверяет подпись токена и дописывает событие в буфер (mailing.tracking),
+    к базе не обращается. Картинка отдаётся и при неверном токене.
+    """
+
+    def get(self, request, token):
+        try:
+            mailing_id, recipient_id, _ = parse_token(token)
+        except signing.BadSignature:
+            pass
+        else:
+            record_event('open', mailing_id, recipient_id)
+        response = HttpResponse(PIXEL, content_type='image/gif')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class TrackClickView(View):
+    """
+    Переход по ссылке из письма.
+
+    Адрес назначения берётся только из подписанного токена, поэтому
+    перенаправление на произвольный сайт невозможно. Событие дописывается
+    в буфер (mailing.tracking), к базе вьюха не обращается.
+    """
+
+    def get(self, request, token):
+        try:
+            mailing_id, recipient_id, url = parse_token(token)
+        except signing.BadSignature:
+            raise Http404('Неверная ссылка')
+        if not url:
+            raise Http404('Неверная ссылка')
+        record_event('click', mailing_id, recipient_id, url)
+        return HttpResponseRedirect(url)
+
+
+# -------- METRICS --------
+class MetricsView(View):
+    """
+    Метрики отправки в текстовом формате Prometheus (mailing.metrics).
+
+    Доступна сборщику с токеном METRICS_TOKEN (заголовок Authorization: Bearer <токен>)
+    и менеджерам; значения суммируются по всем процессам отправки.
+    """
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        has_token = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+        if not has_token and not (request.user.is_authenticated and request.user.is_manager):
+            raise PermissionDenied
+        response = HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
 # ------- OTHER -------
-@method_decorator(cache_page(60 * 15), name='dispatch')  # 15 минут
 class HomeView(LoginRequiredMixin, TemplateView):
     """
     Домашняя страница пользователя с общей статистикой.
 
     Показывает количество сообщений, получателей, рассылок и попыток.
-    Кэшируется на 15 минут.
+    Счётчики читаются одной строкой UserCounters, которая поддерживается сигналами.
     """
     template_name = "home.html"
 
@@ -406,10 +917,11 @@ class HomeView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        context['message_count'] = Message.objects.filter(owner=user).count()
-        context['recipient_count'] = Recipient.objects.filter(owner=user).count()
-        context['mailing_count'] = Mailing.objects.filter(owner=user).count()
-        context['attempt_count'] = Attempt.objects.filter(mailing__owner=user).count()
+        counters = UserCounters.for_user(user)
+        context['message_count'] = counters.message_count
+        context['recipient_count'] = counters.recipient_count
+        context['mailing_count'] = counters.mailing_count
+        context['attempt_count'] = counters.attempt_count
 
         context['has_no_messages'] = context['message_count'] == 0
         context['has_no_recipients'] = context['recipient_count'] == 0
@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils.functional import cached_property
+
+from .roles import ROLE_MANAGER, resolve_role
 
 
 class UserManager(BaseUserManager):
@@ -42,6 +45,9 @@ class User(AbstractUser):
     Добавляет email (уникальный), аватар, телефон и страну.
 
     Авторизация через email.
+
+    Роль доступна как user.is_manager: вычисляется один раз на объект
+    (то есть на запрос) и кэшируется в Redis, см. users/roles.py.
     """
     username = None  # Удаляем стандартное поле username
     email = models.EmailField(unique=True, verbose_name="Email")
@@ -57,3 +63,7 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+    @cached_property
+    def is_manager(self):
+        return resolve_role(self) == ROLE_MANAGER
@@ -0,0 +1,38 @@
+"""
+Определение роли пользователя (менеджер / обычный пользователь).
+
+Роль хранится в кэше (Redis) под ключом role:<id> и сбрасывается сигналами
+при изменении состава групп (см. users/signals.py). В пределах запроса
+результат запоминается на объекте пользователя (User.is_manager).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+MANAGERS_GROUP = "Менеджеры"
+
+ROLE_MANAGER = 'manager'
+ROLE_USER = 'user'
+
+
+def role_cache_key(user_id):
+    return f'role:{user_id}'
+
+
+def resolve_role(user):
+    """
+    Роль пользователя: сначала из кэша, при промахе — запросом к группам.
+    """
+    key = role_cache_key(user.pk)
+    role = cache.get(key)
+    if role is None:
+        is_manager = user.groups.filter(name=MANAGERS_GROUP).exists()
+        role = ROLE_MANAGER if is_manager else ROLE_USER
+        cache.set(key, role, settings.ROLE_CACHE_TIMEOUT)
+    return role
+
+
+def invalidate_roles(user_ids):
+    """
+    Сбрасывает закэшированные роли пользователей.
+    """
+    cache.delete_many([role_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import User
+from .roles import invalidate_roles
+
+
+def invalidate_roles_on_commit(user_ids):
+    """
+    Сбрасывает роли после фиксации транзакции.
+
+    Сброс до фиксации не помогает: параллельный запрос ещё видит старый состав
+    групп и снова кладёт в кэш старую роль на ROLE_CACHE_TIMEOUT. Список id
+    собирается сразу — к моменту фиксации группа может быть уже очищена.
+    """
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: invalidate_roles(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_role_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сбрасывает роль при изменении групп пользователя.
+
+    Прямая сторона: user.groups.add/remove/clear — меняется роль instance.
+    Обратная: group.user_set.add/remove — pk_set содержит id пользователей,
+    а для clear участники группы собираются до очистки (pre_clear).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_roles_on_commit([instance.pk])
+        return
+
+    if action in ('post_add', 'post_remove'):
+        invalidate_roles_on_commit(pk_set)
+    elif action == 'pre_clear':
+        invalidate_roles_on_commit(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_role_on_group_change(sender, instance, **kwargs):
+    """
+    Сбрасывает роли участников группы при её переименовании или удалении.
+    """
+    if instance.pk:
+        invalidate_roles_on_commit(instance.user_set.values_list('pk', flat=True))
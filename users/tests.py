@@ -1,2 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from config.testing import QueryBudgetMixin
+
+User = get_user_model()
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджет SQL-запросов для вьюх из users/urls.py.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='user@example.com', password='pass')
+
+    def test_anonymous_pages(self):
+        budgets = [
+            (0, reverse('users:register')),
+            (0, reverse('users:password_reset')),
+            (0, reverse('users:password_reset_done')),
+            (1, reverse('users:password_reset_confirm', args=['MQ', 'set-password'])),
+            (0, reverse('users:password_reset_complete')),
+        ]
+        for budget, url in budgets:
+            with self.subTest(url=url):
+                response = self.assertQueryBudget(budget, url)
+                self.assertIn(response.status_code, (200, 302))
+
+    def test_authenticated_pages(self):
+        budgets = [
+            (2, reverse('users:profile')),
+            (2, reverse('users:profile_edit')),
+            (2, reverse('users:password_change')),
+        ]
+        self.client.force_login(self.user)
+        for budget, url in budgets:
+            with self.subTest(url=url):
+                response = self.assertQueryBudget(budget, url)
+                self.assertEqual(response.status_code, 200)